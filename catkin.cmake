@@ -7,8 +7,14 @@ catkin_python_setup()
 install(DIRECTORY config/
     DESTINATION "${CATKIN_PACKAGE_SHARE_DESTINATION}/config"
 )
-install(PROGRAMS scripts/console.py
+install(PROGRAMS scripts/benchmark_lookat.py
+                 scripts/benchmark_planning.py
+                 scripts/benchmark_pointing.py
+                 scripts/build_grasp_database.py
+                 scripts/build_reachability_map.py
+                 scripts/console.py
                  scripts/generate_primitives_herb.py
+                 scripts/planning_server.py
                  scripts/plot_primitives.py
     DESTINATION "${CATKIN_PACKAGE_BIN_DESTINATION}"
 )
@@ -62,6 +62,10 @@ robot_in_table = numpy.array([[0., 1., 0.,  0.],
                               [0., 0., 0.,  1.]])
 base_pose = numpy.dot(table.GetTransform(), robot_in_table)
 base_pose[2,3] = 0
+if robot.reachability_map is not None:
+    # pick a base pose from which the push grasp is reachable
+    push_grasp_tsr = robot.tsrlibrary(fuze, 'push_grasp', manip=robot.right_arm)
+    base_pose = robot.base.FindBasePoses(push_grasp_tsr, manip=robot.right_arm)[0]
 robot.base.PlanToBasePose(base_pose)
 #robot.SetTransform(base_pose) # way faster for testing
 
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Compares the closed-form Lookat3D IK of HERB's head against the generic
+OpenRAVE IK solver on random targets in front of the robot, and checks that
+every closed-form solution looks at its target. See herbpy.kinematics.LookAtIK.
+"""
+
+import argparse, herbpy, logging, numpy, openravepy, sys, time
+
+logger = logging.getLogger('herbpy')
+
+def GetLookAtError(robot, head, target, dof_values):
+    with robot.GetEnv():
+        with robot:
+            head.SetDOFValues(dof_values)
+            ee_pose = head.GetEndEffectorTransform()
+            direction = numpy.dot(ee_pose[0:3, 0:3], head.GetLocalToolDirection())
+
+    offset = target - ee_pose[0:3, 3]
+    cos_angle = numpy.dot(offset, direction) \
+              / (numpy.linalg.norm(offset) * numpy.linalg.norm(direction))
+    return numpy.arccos(numpy.clip(cos_angle, -1., 1.))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='herbpy look-at IK benchmark')
+    parser.add_argument('-n', '--num-targets', type=int, default=1000,
+                        help='number of random targets')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed')
+    parser.add_argument('--tolerance', type=float, default=1e-3,
+                        help='maximum angle between the head and a target')
+    parser.add_argument('--model-cache', type=str,
+                        help='directory used to cache the HERB model')
+    args = parser.parse_args()
+
+    openravepy.RaveInitialize(True)
+    openravepy.misc.InitOpenRAVELogging()
+
+    env, robot = herbpy.initialize(sim=True, segway_sim=True,
+                                   model_cache_dir=args.model_cache)
+    head = robot.head
+
+    # Sample targets in a box in front of the robot.
+    rng = numpy.random.RandomState(args.seed)
+    targets_in_robot = rng.uniform([ 0.3, -1.5, 0. ], [ 2.5, 1.5, 2. ],
+                                   size=(args.num_targets, 3))
+    with env:
+        robot_pose = robot.GetTransform()
+    targets = numpy.dot(targets_in_robot, robot_pose[0:3, 0:3].T) + robot_pose[0:3, 3]
+
+    head.GetLookAtIK()
+
+    start_time = time.time()
+    solutions = head.FindIKSolutions(targets)
+    batch_duration = time.time() - start_time
+
+    start_time = time.time()
+    for target in targets:
+        head.FindIK(target)
+    single_duration = time.time() - start_time
+
+    found = ~numpy.any(numpy.isnan(solutions), axis=1)
+    errors = [ GetLookAtError(robot, head, target, dof_values)
+               for target, dof_values in zip(targets[found], solutions[found]) ]
+    max_error = max(errors) if errors else 0.
+
+    logger.info('closed form: %d of %d targets solved, max error %.2g rad',
+                numpy.sum(found), len(targets), max_error)
+    logger.info('closed form, batch: %.2f us per target',
+                1e6 * batch_duration / len(targets))
+    logger.info('closed form, one at a time: %.2f us per target',
+                1e6 * single_duration / len(targets))
+
+    # The generic solver is only available if an IK solver is loaded.
+    try:
+        start_time = time.time()
+        generic_found = 0
+        for target in targets:
+            ik_params = openravepy.IkParameterization(
+                target, openravepy.IkParameterization.Type.Lookat3D)
+            with env:
+                generic_found += head.FindIKSolution(ik_params, 0) is not None
+        generic_duration = time.time() - start_time
+
+        logger.info('generic solver: %d of %d targets solved, %.2f us per target',
+                    generic_found, len(targets),
+                    1e6 * generic_duration / len(targets))
+    except openravepy.openrave_exception as e:
+        logger.warning('The generic Lookat3D solver is unavailable: %s', str(e))
+
+    if max_error > args.tolerance:
+        sys.exit(1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Runs the planning benchmark on canonical HERB scenes in simulation and
+optionally compares the results against a baseline. Exits with a non-zero
+status if any task regressed. Unless --planner-statistics is given, each
+run starts from empty planner statistics in a temporary file, so it neither
+depends on nor changes the statistics of other herbpy sessions. See
+herbpy.benchmark.
+"""
+
+import argparse, herbpy, herbpy.benchmark, logging, openravepy, os, prpy.util
+import sys, tempfile
+
+logger = logging.getLogger('herbpy')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='herbpy planning benchmark')
+    parser.add_argument('-o', '--output', type=str,
+                        help='write the results to a JSON file')
+    parser.add_argument('--baseline', type=str,
+                        help='JSON results to check for regressions against')
+    parser.add_argument('--scenes', type=str, nargs='+',
+                        choices=sorted(herbpy.benchmark.SCENES.keys()),
+                        help='scenes to run; defaults to all scenes')
+    parser.add_argument('--tasks', type=str, nargs='+',
+                        choices=sorted(herbpy.benchmark.TASKS.keys()),
+                        help='tasks to run; defaults to all tasks')
+    parser.add_argument('-n', '--num-trials', type=int, default=10,
+                        help='number of trials of each task')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='base random seed')
+    parser.add_argument('--planning-mode', type=str, default='sequence',
+                        choices=[ 'sequence', 'race', 'adaptive' ],
+                        help='planner configuration to benchmark')
+    parser.add_argument('--success-tolerance', type=float, default=0.1,
+                        help='allowed drop in success rate')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='allowed relative increase in latency')
+    parser.add_argument('--planner-statistics', type=str,
+                        help='planner statistics file to use and update;'
+                             ' defaults to a new temporary file')
+    parser.add_argument('--model-cache', type=str,
+                        help='directory used to cache the HERB model')
+    parser.add_argument('--debug', action='store_true',
+                        help='enable debug logging')
+    args = parser.parse_args()
+
+    openravepy.RaveInitialize(True)
+    openravepy.misc.InitOpenRAVELogging()
+
+    if args.debug:
+        openravepy.RaveSetDebugLevel(openravepy.DebugLevel.Debug)
+
+    statistics_path = args.planner_statistics
+    if statistics_path is None:
+        statistics_path = os.path.join(
+            tempfile.mkdtemp(prefix='herbpy-benchmark-'), 'planner_statistics.json')
+    logger.info('Recording planner statistics in "%s".', statistics_path)
+
+    env, robot = herbpy.initialize(sim=True, segway_sim=True,
+                                   planning_mode=args.planning_mode,
+                                   planner_statistics_path=statistics_path,
+                                   model_cache_dir=args.model_cache)
+    objects_path = prpy.util.FindCatkinResource('pr_ordata', 'data/objects')
+
+    benchmark = herbpy.benchmark.Benchmark(env, robot, objects_path)
+    results = benchmark.Run(scene_names=args.scenes, task_names=args.tasks,
+                            num_trials=args.num_trials, seed=args.seed)
+
+    for scene_name, tasks in sorted(results.iteritems()):
+        for task_name, summary in sorted(tasks.iteritems()):
+            logger.info('%s/%s: %d/%d successes, p50 latency %.3f s',
+                        scene_name, task_name, summary['successes'],
+                        summary['trials'] - summary['setup_failures'],
+                        summary.get('latency', {}).get('p50', float('nan')))
+
+    if args.output is not None:
+        herbpy.benchmark.Save(args.output, results)
+
+    if args.baseline is not None:
+        baseline = herbpy.benchmark.Load(args.baseline)
+        regressions = herbpy.benchmark.Compare(
+            results, baseline, success_tolerance=args.success_tolerance,
+            latency_tolerance=args.latency_tolerance)
+
+        for regression in regressions:
+            logger.error('Regression in %s/%s: %s changed from %.3f to %.3f.',
+                         regression['scene'], regression['task'],
+                         regression['metric'], regression['baseline'],
+                         regression['value'])
+
+        if regressions:
+            sys.exit(1)
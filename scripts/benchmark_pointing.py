@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Measures how occlusion scoring of pointing IK solutions scales with the
+number of worker processes of a NaturalnessPool, and checks that the
+parallel scores are identical to serial scoring. See herbpy.action.parallel.
+"""
+
+import argparse, herbpy, herbpy.benchmark, herbpy.tsr, logging, multiprocessing
+import numpy, openravepy, prpy.util, sys, time
+from herbpy.action.parallel import NaturalnessPool
+from herbpy.action.occlusion import FitOcclusionScale
+from herbpy.action.rogue import Naturalness
+
+logger = logging.getLogger('herbpy')
+
+def GetPointingSolutions(robot, manip, obj, num_solutions, rng,
+                         max_samples=10000):
+    point_tsr = robot.tsrlibrary(None, 'point', obj.GetTransform(), manip)
+    poses, _ = herbpy.tsr.SampleTSRChains(point_tsr, max_samples, rng)
+
+    solutions = list()
+    with robot.GetEnv():
+        for pose in poses:
+            ik_solutions = manip.FindIKSolutions(pose,
+                openravepy.IkFilterOptions.CheckEnvCollisions)
+            if ik_solutions is not None:
+                solutions.extend(ik_solutions)
+            if len(solutions) >= num_solutions:
+                break
+
+    return numpy.array(solutions[:num_solutions])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='herbpy pointing benchmark')
+    parser.add_argument('--scene', type=str, default='fuze_bottle',
+                        choices=sorted(herbpy.benchmark.SCENES.keys()),
+                        help='object to point at')
+    parser.add_argument('-n', '--num-solutions', type=int, default=200,
+                        help='number of IK solutions to score')
+    parser.add_argument('-j', '--max-workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='maximum number of worker processes')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='number of timed runs per worker count')
+    parser.add_argument('--occlusion', type=str, default='render',
+                        choices=[ 'render', 'raycast' ],
+                        help='occlusion estimator')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed')
+    parser.add_argument('--model-cache', type=str,
+                        help='directory used to cache the HERB model')
+    args = parser.parse_args()
+
+    herbpy_args = { 'sim': True, 'segway_sim': True,
+                    'model_cache_dir': args.model_cache }
+
+    # The workers initialize HERB while this process does.
+    pool = NaturalnessPool(args.max_workers, **herbpy_args)
+
+    try:
+        openravepy.RaveInitialize(True)
+        openravepy.misc.InitOpenRAVELogging()
+
+        env, robot = herbpy.initialize(**herbpy_args)
+        manip = robot.right_arm
+        objects_path = prpy.util.FindCatkinResource('pr_ordata', 'data/objects')
+
+        rng = numpy.random.RandomState(args.seed)
+        benchmark = herbpy.benchmark.Benchmark(env, robot, objects_path,
+                                               manip=manip)
+        table, obj = benchmark.CreateScene(args.scene)
+        benchmark.ResetScene(args.scene, table, obj, rng)
+
+        with env:
+            manip.SetActive()
+        ik_solutions = GetPointingSolutions(robot, manip, obj,
+                                            args.num_solutions, rng)
+        logger.info('Scoring %d IK solutions for pointing at %s.',
+                    len(ik_solutions), args.scene)
+
+        ranker = Naturalness(obj.GetTransform(), obj.GetName(),
+                             occlusion=args.occlusion, num_exact=None)
+
+        def TimeRuns(fn):
+            durations = list()
+            for i in xrange(args.repeats):
+                start_time = time.time()
+                scores = fn()
+                durations.append(time.time() - start_time)
+            return scores, numpy.median(durations)
+
+        serial_scores, serial_duration = TimeRuns(
+            lambda: ranker.scoreOcclusion(robot, ik_solutions))
+        logger.info('serial: %.3f s', serial_duration)
+
+        # Calibrate ray casting against rendering for Point(occlusion_scale=...).
+        if args.occlusion == 'render':
+            ray_ranker = Naturalness(obj.GetTransform(), obj.GetName(),
+                                     occlusion='raycast', num_exact=None)
+            ray_scores = ray_ranker.scoreOcclusion(robot, ik_solutions)
+            logger.info('ray cast occlusion scale: %.3f',
+                        FitOcclusionScale(serial_scores, ray_scores))
+
+        # The first request loads the scene into the workers.
+        pool.ScoreOcclusion(robot, ranker, ik_solutions)
+
+        mismatches = 0
+        for num_workers in xrange(1, args.max_workers + 1):
+            scores, duration = TimeRuns(lambda: pool.ScoreOcclusion(
+                robot, ranker, ik_solutions, num_shards=num_workers))
+
+            identical = numpy.array_equal(scores, serial_scores)
+            mismatches += not identical
+            logger.info('%d worker(s): %.3f s, %.2fx speedup, %s', num_workers,
+                        duration, serial_duration / duration,
+                        'identical' if identical else 'MISMATCH')
+    finally:
+        pool.Close()
+
+    if mismatches:
+        sys.exit(1)
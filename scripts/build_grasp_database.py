@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Precomputes which grasps of each object are reachable with collision-free
+IK for the left and right arms and writes them to a grasp database. The
+Grasp and PushGrasp actions use the database to restrict TSR sampling to
+reachable grasps. See herbpy.graspdb.
+"""
+
+import argparse, herbpy, herbpy.graspdb, logging, numpy, openravepy, os, prpy.util
+
+logger = logging.getLogger('herbpy')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='herbpy grasp database builder')
+    parser.add_argument('-o', '--output', type=str,
+                        default=os.environ.get('HERBPY_GRASP_DATABASE',
+                            os.path.expanduser('~/.ros/herbpy/grasp_database.npz')),
+                        help='path of the grasp database')
+    parser.add_argument('--objects', type=str, nargs='+',
+                        help='object types to precompute; defaults to all')
+    parser.add_argument('--arms', type=str, nargs='+', default=[ 'left', 'right' ],
+                        choices=[ 'left', 'right' ],
+                        help='arms to precompute')
+    parser.add_argument('-n', '--num-samples', type=int, default=64,
+                        help='number of TSR samples checked per object pose')
+    parser.add_argument('--resolution', type=float, default=0.05,
+                        help='horizontal resolution of the object pose grid')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for the TSR samples')
+    parser.add_argument('--debug', action='store_true',
+                        help='enable debug logging')
+    args = parser.parse_args()
+
+    openravepy.RaveInitialize(True)
+    openravepy.misc.InitOpenRAVELogging()
+
+    if args.debug:
+        openravepy.RaveSetDebugLevel(openravepy.DebugLevel.Debug)
+
+    env, robot = herbpy.initialize(sim=True, segway_sim=True,
+                                   grasp_database_path=args.output)
+    objects_path = prpy.util.FindCatkinResource('pr_ordata', 'data/objects')
+
+    # Precompute with the other arm out of the way.
+    with env:
+        robot.SetTransform(numpy.eye(4))
+        dof_indices, dof_values \
+            = robot.configurations.get_configuration('relaxed_home')
+        robot.SetDOFValues(dof_values, dof_indices)
+
+    database = herbpy.graspdb.GraspDatabase(args.output)
+    grid_resolution = herbpy.graspdb.DEFAULT_GRID_RESOLUTION.copy()
+    grid_resolution[0:2] = args.resolution
+
+    for object_type, tsr_name, tsr_args in herbpy.graspdb.DEFAULT_ENTRIES:
+        if args.objects is not None and object_type not in args.objects:
+            continue
+
+        obj = env.ReadKinBodyXMLFile(
+            os.path.join(objects_path, object_type + '.kinbody.xml'))
+        env.Add(obj)
+
+        try:
+            for arm in args.arms:
+                manip = robot.GetManipulator(arm)
+                fraction = database.Build(robot, obj, manip, tsr_name,
+                                          tsr_args=tsr_args,
+                                          num_samples=args.num_samples,
+                                          grid_resolution=grid_resolution,
+                                          seed=args.seed)
+                logger.info('%s "%s" with the %s arm: %.1f%% of grasps are'
+                            ' feasible.', object_type, tsr_name, arm,
+                            100. * fraction)
+
+                # Save after every entry, since building takes a long time.
+                database.Save()
+        finally:
+            env.Remove(obj)
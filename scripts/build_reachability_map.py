@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Samples collision-free configurations of HERB's arms and writes the inverse
+reachability map used by robot.base.FindBasePoses. See herbpy.reachability.
+"""
+
+import argparse, herbpy, herbpy.reachability, logging, openravepy, os
+
+logger = logging.getLogger('herbpy')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='herbpy inverse reachability map builder')
+    parser.add_argument('-o', '--output', type=str,
+                        default=os.environ.get('HERBPY_REACHABILITY_MAP',
+                            os.path.expanduser('~/.ros/herbpy/reachability_map.npz')),
+                        help='path of the inverse reachability map')
+    parser.add_argument('--arms', type=str, nargs='+', default=[ 'left', 'right' ],
+                        choices=[ 'left', 'right' ],
+                        help='arms to sample')
+    parser.add_argument('-n', '--num-samples', type=int, default=100000,
+                        help='number of configurations to sample per arm')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed')
+    parser.add_argument('--debug', action='store_true',
+                        help='enable debug logging')
+    args = parser.parse_args()
+
+    openravepy.RaveInitialize(True)
+    openravepy.misc.InitOpenRAVELogging()
+
+    if args.debug:
+        openravepy.RaveSetDebugLevel(openravepy.DebugLevel.Debug)
+
+    env, robot = herbpy.initialize(sim=True, segway_sim=True,
+                                   reachability_map_path=args.output)
+
+    # Sample each arm with the other arm tucked in.
+    with env:
+        dof_indices, dof_values \
+            = robot.configurations.get_configuration('relaxed_home')
+        robot.SetDOFValues(dof_values, dof_indices)
+
+    reachability_map = herbpy.reachability.InverseReachabilityMap(args.output)
+    for arm in args.arms:
+        reachability_map.Build(robot, robot.GetManipulator(arm),
+                               num_samples=args.num_samples, seed=args.seed)
+        reachability_map.Save()
@@ -25,6 +25,12 @@ if __name__ == "__main__":
                         help='simulate base')
     parser.add_argument('--debug', action='store_true',
                         help='enable debug logging')
+    parser.add_argument('--profile', action='store_true',
+                        help='log the time spent in each phase of startup')
+    parser.add_argument('--profile-output', type=str,
+                        help='write cProfile statistics for startup to a file')
+    parser.add_argument('--model-cache', type=str,
+                        help='directory used to cache the HERB model')
     args = parser.parse_args()
 
     openravepy.RaveInitialize(True)
@@ -37,7 +43,10 @@ if __name__ == "__main__":
                    'attach_viewer':args.viewer,
                    'robot_xml':args.robot_xml,
                    'env_path':args.env_xml,
-                   'segway_sim':args.segway_sim}
+                   'segway_sim':args.segway_sim,
+                   'profile':args.profile,
+                   'profile_path':args.profile_output,
+                   'model_cache_dir':args.model_cache}
     if args.sim and not args.segway_sim:
         herbpy_args['segway_sim'] = args.sim
     
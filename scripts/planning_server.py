@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+Runs a daemon that keeps HERB environments initialized and serves planning
+requests over a Unix socket. See herbpy.server.PlanningClient.
+"""
+
+import argparse, herbpy.server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='herbpy planning daemon')
+    parser.add_argument('--socket', type=str, default='/tmp/herbpy.sock',
+                        help='path of the Unix socket to listen on')
+    parser.add_argument('-n', '--num-environments', type=int, default=1,
+                        help='number of HERB environments to keep warm')
+    parser.add_argument('--robot-xml', type=str,
+                        help='robot XML file; defaults to herb_description')
+    parser.add_argument('--env-xml', type=str,
+                        help='environment XML file; defaults to an empty environment')
+    parser.add_argument('--model-cache', type=str,
+                        help='directory used to cache the HERB model')
+    parser.add_argument('--debug', action='store_true',
+                        help='enable debug logging')
+    args = parser.parse_args()
+
+    herbpy.server.Serve(args.socket, num_environments=args.num_environments,
+                        debug=args.debug, sim=True, robot_xml=args.robot_xml,
+                        env_path=args.env_xml, model_cache_dir=args.model_cache)
@@ -0,0 +1,139 @@
+import logging, numpy
+
+logger = logging.getLogger('herbpy')
+
+def FindContact(env, body, obj, direction, max_distance, tolerance=0.001):
+    """
+    Move an object along a direction until it is just out of contact with
+    another body. This assumes that, once the object touches the body, it
+    stays in collision as it moves further along the direction, e.g. when
+    an object moves into the palm of a hand. The contact distance is found
+    by bisection, so the number of collision checks grows with the logarithm
+    of max_distance / tolerance.
+
+    If the object starts in collision, it is backed out along -direction
+    with exponentially growing steps before bisecting. If it does not
+    collide within max_distance, it is moved by max_distance. The caller
+    should hold the environment lock.
+
+    @param env The environment
+    @param body The body to find contact with, e.g. the robot
+    @param obj The object to move
+    @param direction Direction to move the object in the world frame
+    @param max_distance Maximum distance to move the object along direction
+    @param tolerance Maximum distance between the final pose and contact
+    @return tuple of the distance the object moved along direction and the
+       number of collision checks, or None for the distance if the object
+       could not be moved out of collision
+    """
+    if tolerance <= 0:
+        raise ValueError('The contact tolerance must be positive; got'
+                         ' {:f}.'.format(tolerance))
+
+    direction = numpy.array(direction, dtype=float)
+    direction /= numpy.linalg.norm(direction)
+    start_pose = obj.GetTransform()
+    num_checks = [ 0 ]
+
+    def in_collision(distance):
+        pose = start_pose.copy()
+        pose[:3,3] += distance*direction
+        obj.SetTransform(pose)
+        num_checks[0] += 1
+        return env.CheckCollision(body, obj)
+
+    if in_collision(0.):
+        # Back out until the object is free; the contact is in between.
+        colliding = 0.
+        step = tolerance
+        while True:
+            if not in_collision(-step):
+                free = -step
+                break
+            colliding = -step
+            if step >= max_distance:
+                obj.SetTransform(start_pose)
+                return None, num_checks[0]
+            step = min(2.*step, max_distance)
+    elif not in_collision(max_distance):
+        return max_distance, num_checks[0]
+    else:
+        free, colliding = 0., max_distance
+
+    while abs(colliding - free) > tolerance:
+        middle = 0.5*(free + colliding)
+        if in_collision(middle):
+            colliding = middle
+        else:
+            free = middle
+
+    pose = start_pose.copy()
+    pose[:3,3] += free*direction
+    obj.SetTransform(pose)
+
+    logger.debug('Found contact after %d collision checks.', num_checks[0])
+    return free, num_checks[0]
+
+def GetCollidingBodies(env, body):
+    """
+    Find all bodies that are in collision with a body. This uses a single
+    collision query that reports every colliding pair of links. If the
+    collision checker does not report all pairs, it falls back on disabling
+    one colliding body at a time and checking again. Bodies grabbed by the
+    body are never returned.
+
+    @param env The environment
+    @param body The body to check, e.g. the robot
+    @return tuple of the list of colliding bodies and the number of
+       collision queries
+    """
+    from openravepy import CollisionOptions, CollisionReport
+
+    with env:
+        ignored = set([ body ])
+        if hasattr(body, 'GetGrabbed'):
+            ignored.update(body.GetGrabbed())
+
+        checker = env.GetCollisionChecker()
+        options = checker.GetCollisionOptions()
+        report = CollisionReport()
+        try:
+            checker.SetCollisionOptions(options | CollisionOptions.AllLinkCollisions)
+            in_collision = env.CheckCollision(body, report)
+        finally:
+            checker.SetCollisionOptions(options)
+
+        if not in_collision:
+            return [], 1
+
+        colliding = list()
+        for links in getattr(report, 'vLinkColliding', []):
+            for link in links:
+                if link is None:
+                    continue
+                parent = link.GetParent()
+                if parent not in ignored and parent not in colliding:
+                    colliding.append(parent)
+        if colliding:
+            return colliding, 1
+
+        # The checker only reported one pair; disable bodies one at a time.
+        num_queries = 1
+        try:
+            while True:
+                parents = [ link.GetParent() for link in [ report.plink2, report.plink1 ]
+                            if link is not None and link.GetParent() not in ignored ]
+                if not parents or parents[0] in colliding:
+                    break
+                parent = parents[0]
+                colliding.append(parent)
+                parent.Enable(False)
+
+                num_queries += 1
+                if not env.CheckCollision(body, report):
+                    break
+        finally:
+            for parent in colliding:
+                parent.Enable(True)
+
+        return colliding, num_queries
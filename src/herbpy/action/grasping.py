@@ -2,12 +2,16 @@ import logging, openravepy, prpy
 from prpy.action import ActionMethod
 from prpy.planning.base import PlanningError
 from contextlib import contextmanager
+from contact import FindContact, GetCollidingBodies
+from pipelining import (PlanFromPredictedState, PlanFromState, PlanningFuture,
+                        ReachedPredictedState)
 
 logger = logging.getLogger('herbpy')
 
 @ActionMethod
 def Grasp(robot, obj, manip=None, preshape=[0., 0., 0., 0.], 
-          tsrlist=None, render=True, **kw_args):
+          tsrlist=None, render=True, pipelined=False,
+          concurrent_preshape=False, contact_tolerance=0.001, **kw_args):
     """
     @param robot The robot performing the push grasp
     @param obj The object to push grasp
@@ -17,14 +21,21 @@ def Grasp(robot, obj, manip=None, preshape=[0., 0., 0., 0.],
     @param tsrlist A list of TSRChain objects to use for planning to grasp pose
        (if None, the 'grasp' tsr from tsrlibrary is used)
     @param render Render tsr samples and push direction vectors during planning
+    @param pipelined Plan the next motion while the previous one executes
+    @param concurrent_preshape Plan while the hand moves to the preshape
+    @param contact_tolerance Maximum gap between the object and the hand
+       after moving the object into the hand
     """
     HerbGrasp(robot, obj,  manip=manip, preshape=preshape, 
-              tsrlist=tsrlist, render=render)
+              tsrlist=tsrlist, render=render, pipelined=pipelined,
+              concurrent_preshape=concurrent_preshape,
+              contact_tolerance=contact_tolerance)
 
 @ActionMethod
 def PushGrasp(robot, obj, push_distance=0.1, manip=None, 
               preshape=[0., 0., 0., 0.], push_required=True, 
-              tsrlist=None, render=True, **kw_args):
+              tsrlist=None, render=True, pipelined=False,
+              concurrent_preshape=False, contact_tolerance=0.001, **kw_args):
     """
     @param robot The robot performing the push grasp
     @param obj The object to push grasp
@@ -32,25 +43,60 @@ def PushGrasp(robot, obj, push_distance=0.1, manip=None,
     @param manip The manipulator to perform the grasp with 
        (if None active manipulator is used)
     @param push_required If true, throw exception if a plan for the pushing 
-       movement cannot be found. If false, continue with grasp even if push 
+       movement cannot be found, or if the object cannot be moved out of
+       collision with the hand. If false, continue with grasp even if push 
        cannot be executed.
     @param preshape The grasp preshape for the hand
     @param tsrlist A list of TSRChain objects to use for planning to grasp pose
        (if None, the 'grasp' tsr from tsrlibrary is used)
     @param render Render tsr samples and push direction vectors during planning
+    @param pipelined Plan the push while moving to the grasp pose
+    @param concurrent_preshape Plan while the hand moves to the preshape
+    @param contact_tolerance Maximum gap between the object and the hand
+       after moving the object into the hand
     """
     if tsrlist is None:
-        tsrlist = robot.tsrlibrary(obj, 'push_grasp', push_distance=push_distance)
+        tsrlist = GetGraspTSRList(robot, obj, manip, 'push_grasp',
+                                  push_distance=push_distance)
 
     HerbGrasp(robot, obj, manip=manip, preshape=preshape, 
               push_distance=push_distance,
-              tsrlist=tsrlist, render=render)
+              tsrlist=tsrlist, render=render, pipelined=pipelined,
+              concurrent_preshape=concurrent_preshape,
+              contact_tolerance=contact_tolerance)
+
+def GetGraspTSRList(robot, obj, manip, tsr_name, **tsr_args):
+    """
+    Get a grasp TSR from the TSR library. If the robot has a grasp database
+    with an entry for the object, the TSR is restricted to the region with
+    feasible IK solutions.
+    @param robot The robot performing the grasp
+    @param obj The object to grasp
+    @param manip The manipulator to perform the grasp with
+       (if None active manipulator is used)
+    @param tsr_name The name of the grasp TSR, e.g. 'grasp' or 'push_grasp'
+    @param tsr_args Keyword arguments of the TSR factory
+    """
+    if manip is None:
+        with robot.GetEnv():
+            manip = robot.GetActiveManipulator()
+
+    tsrlist = robot.tsrlibrary(obj, tsr_name, manip=manip, **tsr_args)
+
+    grasp_database = getattr(robot, 'grasp_database', None)
+    if grasp_database is not None:
+        tsrlist = grasp_database.PruneTSRList(robot, obj, manip, tsr_name,
+                                              tsrlist, tsr_args)
+    return tsrlist
 
 def HerbGrasp(robot, obj, push_distance=None, manip=None, 
               preshape=[0., 0., 0., 0.], 
               push_required=False, 
               tsrlist=None,
               render=True,
+              pipelined=False,
+              concurrent_preshape=False,
+              contact_tolerance=0.001,
               **kw_args):
     """
     @param robot The robot performing the push grasp
@@ -60,47 +106,96 @@ def HerbGrasp(robot, obj, push_distance=None, manip=None,
        (if None active manipulator is used)
     @param preshape The grasp preshape for the hand
     @param push_required If true, throw exception if a plan for the pushing 
-       movement cannot be found. If false, continue with grasp even if push 
+       movement cannot be found, or if the object cannot be moved out of
+       collision with the hand. If false, continue with grasp even if push 
        cannot be executed. (only used if distance is not None)
     @param render Render tsr samples and push direction vectors during planning
+    @param pipelined Plan the push in a cloned environment, from the end of
+       the grasp trajectory, while the grasp trajectory executes. The push is
+       replanned if the arm does not reach the end of the grasp trajectory.
+       (only used if distance is not None)
+    @param concurrent_preshape Plan to the grasp in a cloned environment with
+       the hand at the preshape while the real hand moves to it. The hand
+       motion finishes before the arm moves.
+    @param contact_tolerance Maximum gap between the object and the hand
+       after moving the object into the hand (only used if distance is not None)
     """
     if manip is None:
         with robot.GetEnv():
             manip = robot.GetActiveManipulator()
 
     # Move the hand to the grasp preshape
-    manip.hand.MoveHand(*preshape)
+    hand_future = None
+    if concurrent_preshape:
+        hand_future = PlanningFuture(lambda: manip.hand.MoveHand(*preshape))
+    else:
+        manip.hand.MoveHand(*preshape)
 
     # Get the grasp tsr
     if tsrlist is None:
-        tsrlist = robot.tsrlibrary(obj, 'grasp')
+        tsrlist = GetGraspTSRList(robot, obj, manip, 'grasp')
     
     # Plan to the grasp
+    push_future = None
     with prpy.viz.RenderTSRList(tsrlist, robot.GetEnv(), render=render):
-        manip.PlanToTSR(tsrlist)
+        if hand_future is not None:
+            # Plan with the hand at the preshape while the real hand moves.
+            with robot.GetEnv():
+                hand_indices = list(manip.hand.GetFingerIndices()) \
+                             + [ manip.hand.GetSpreadIndex() ]
+            preshape_indices = [ index for index, value in zip(hand_indices, preshape)
+                                 if value is not None ]
+            preshape_values = [ value for value in preshape if value is not None ]
+
+            def plan_grasp(cloned_env):
+                return cloned_env.Cloned(manip).PlanToTSR(tsrlist, execute=False)
+
+            try:
+                grasp_path = PlanFromState(robot, preshape_indices, preshape_values,
+                                           plan_grasp).result()
+            finally:
+                hand_future.result()
+        elif push_distance is not None and pipelined:
+            grasp_path = manip.PlanToTSR(tsrlist, execute=False)
+        else:
+            grasp_path = None
+            manip.PlanToTSR(tsrlist)
+
+        if grasp_path is not None and push_distance is not None and pipelined:
+            # Plan the push from the end of the grasp path while it executes.
+            def plan_push(cloned_env):
+                cloned_manip = cloned_env.Cloned(manip)
+                with cloned_env:
+                    direction = cloned_manip.GetEndEffectorTransform()[:3,2]
+                with prpy.rave.Disabled(cloned_env.Cloned(obj)):
+                    return cloned_manip.PlanToEndEffectorOffset(
+                        direction=direction, distance=push_distance,
+                        execute=False, **kw_args)
+
+            push_future = PlanFromPredictedState(robot, grasp_path, plan_push)
+            robot.ExecutePath(grasp_path)
+
+            if not ReachedPredictedState(robot, grasp_path):
+                push_future = None
+        elif grasp_path is not None:
+            robot.ExecutePath(grasp_path)
 
     if push_distance is not None:
         ee_in_world = manip.GetEndEffectorTransform()
         push_direction = ee_in_world[:3,2]
 
-        # Move the object into the hand
+        # Move the object back into the hand until it is just out of contact
         env = robot.GetEnv()
         with env:
-            obj_in_world = obj.GetTransform()
-
-            # First move back until collision
-            stepsize = 0.01
-            total_distance = 0.0
-            while not env.CheckCollision(robot, obj) and total_distance <= push_distance:
-                obj_in_world[:3,3] -= stepsize*push_direction
-                total_distance += stepsize
-                obj.SetTransform(obj_in_world)
-            
-            # Then move forward until just out of collision
-            stepsize = 0.001
-            while env.CheckCollision(robot, obj):
-                obj_in_world[:3,3] += stepsize*push_direction
-                obj.SetTransform(obj_in_world)
+            distance, _ = FindContact(env, robot, obj, -push_direction,
+                                      push_distance, tolerance=contact_tolerance)
+        if distance is None:
+            if push_required:
+                raise PlanningError('Could not move the object out of collision'
+                                    ' with the hand.')
+            else:
+                logger.warn('Could not move the object out of collision with'
+                            ' the hand. Ignoring.')
 
         # Manipulator must be active for grab to work properly
         p = openravepy.KinBody.SaveParameters
@@ -114,9 +209,12 @@ def HerbGrasp(robot, obj, push_distance=None, manip=None,
                                    push_distance, robot.GetEnv(), render=render):
             try:
                 with prpy.rave.Disabled(obj):
-                    manip.PlanToEndEffectorOffset(direction = push_direction,
-                                                  distance = push_distance,
-                                                  **kw_args)
+                    if push_future is not None:
+                        robot.ExecutePath(push_future.result())
+                    else:
+                        manip.PlanToEndEffectorOffset(direction = push_direction,
+                                                      distance = push_distance,
+                                                      **kw_args)
             except PlanningError, e:
                 if push_required:
                     raise
@@ -148,26 +246,18 @@ def Lift(robot, obj, distance=0.05, manip=None, render=True, **kw_args):
         with robot.GetEnv():
             manip = robot.GetActiveManipulator()
 
-    # Check for collision and disable anything in collision
-    creport = openravepy.CollisionReport()    
-    disabled_objects = []
-
     # Resolve inconsistencies in grabbed objects
     if robot.CheckSelfCollision():
         grabbed_objs = robot.GetGrabbed()
-        for obj in grabbed_objs:
-            robot.Release(obj)
-        for obj in grabbed_objs:
-            robot.Grab(obj)
+        for grabbed_obj in grabbed_objs:
+            robot.Release(grabbed_obj)
+        for grabbed_obj in grabbed_objs:
+            robot.Grab(grabbed_obj)
 
-    # Create list of any current collisions so those can be disabled
-    while robot.GetEnv().CheckCollision(robot, creport):
-        collision_obj = creport.plink2.GetParent()
-        disabled_objects.append(collision_obj)
-        collision_obj.Enable(False)
-        
-    for obj in disabled_objects:
-        obj.Enable(True)
+    # Find all current collisions so those can be disabled
+    disabled_objects, num_queries = GetCollidingBodies(robot.GetEnv(), robot)
+    logger.debug('Lift disabled %d objects in collision after %d collision'
+                 ' queries.', len(disabled_objects), num_queries)
 
     # Perform the lift
     with prpy.rave.AllDisabled(robot.GetEnv(), disabled_objects):
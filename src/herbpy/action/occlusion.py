@@ -0,0 +1,109 @@
+import logging, numpy, prpy
+
+logger = logging.getLogger('herbpy')
+
+
+def GetCameraRays(pose, pixels, intrinsics, max_range):
+    """Get the rays through pixels of a pinhole camera.
+    @param pose pose of the camera; it looks along its z-axis
+    @param pixels (N,2) array of pixel coordinates
+    @param intrinsics fx, fy, cx, cy, near and far of the camera
+    @param max_range length of the rays
+    @return (N,6) array of ray origins and scaled directions
+    """
+    fx, fy, cx, cy = intrinsics[0:4]
+    directions = numpy.column_stack([ (pixels[:, 0] - cx) / fx,
+                                      (pixels[:, 1] - cy) / fy,
+                                      numpy.ones(len(pixels)) ])
+    directions /= numpy.sqrt(numpy.sum(directions**2, axis=1))[:, numpy.newaxis]
+    directions = numpy.dot(directions, pose[0:3, 0:3].T) * max_range
+
+    rays = numpy.zeros((len(pixels), 6))
+    rays[:, 0:3] = pose[0:3, 3]
+    rays[:, 3:6] = directions
+    return rays
+
+
+def GetRayOcclusion(robot, goal, pose, intrinsics=(529, 525, 328, 267, 0.01, 10),
+                    dims=(640, 480), resolution=24):
+    """Estimate how much of an object is hidden from a camera by ray casting.
+    This mirrors the rendered occlusion score of Naturalness without an
+    offscreen renderer: rays are cast through a grid of pixels covering the
+    projection of the bounding box of the goal, and each ray that reaches the
+    goal is weighted by its distance to the center of the image like
+    Naturalness.weightedScoreArray. The robot does not occlude the goal.
+    @param robot robot; it is ignored by the rays
+    @param goal object that should be visible
+    @param pose pose of the camera; it looks along its z-axis
+    @param intrinsics fx, fy, cx, cy, near and far of the camera
+    @param dims width and height of the image in pixels
+    @param resolution number of rays along each side of the grid
+    @return weighted fraction of the visible goal that is occluded, in [0,1]
+    """
+    env = robot.GetEnv()
+    fx, fy, cx, cy, near, far = intrinsics
+
+    with env:
+        aabb = goal.ComputeAABB()
+    corner_signs = numpy.array([ [ sx, sy, sz ] for sx in (-1, 1)
+                                                for sy in (-1, 1)
+                                                for sz in (-1, 1) ])
+    corners = aabb.pos() + corner_signs * aabb.extents()
+
+    # Bound the pixels of the goal by projecting the corners of its AABB.
+    world_in_camera = numpy.linalg.inv(pose)
+    corners_in_camera = numpy.dot(corners, world_in_camera[0:3, 0:3].T) \
+                      + world_in_camera[0:3, 3]
+    in_front = corners_in_camera[:, 2] > near
+    if not numpy.any(in_front):
+        return 0.
+    elif numpy.all(in_front):
+        z = corners_in_camera[:, 2]
+        u = fx * corners_in_camera[:, 0] / z + cx
+        v = fy * corners_in_camera[:, 1] / z + cy
+        u_min, u_max = max(u.min(), 0.), min(u.max(), dims[0] - 1.)
+        v_min, v_max = max(v.min(), 0.), min(v.max(), dims[1] - 1.)
+        if u_min > u_max or v_min > v_max:
+            return 0.
+    else:
+        u_min, u_max, v_min, v_max = 0., dims[0] - 1., 0., dims[1] - 1.
+
+    u_grid, v_grid = numpy.meshgrid(numpy.linspace(u_min, u_max, resolution),
+                                    numpy.linspace(v_min, v_max, resolution))
+    pixels = numpy.column_stack([ u_grid.ravel(), v_grid.ravel() ])
+    rays = GetCameraRays(pose, pixels, intrinsics, far)
+
+    with env:
+        goal_hits, goal_points = env.CheckCollisionRays(rays, goal)
+        with prpy.rave.Disabled(robot):
+            scene_hits, scene_points = env.CheckCollisionRays(rays, None)
+
+    goal_hits = numpy.asarray(goal_hits, dtype=bool)
+    if not numpy.any(goal_hits):
+        return 0.
+
+    # A ray is occluded if it hits another body before it reaches the goal.
+    goal_distances = numpy.sqrt(numpy.sum(
+        (numpy.asarray(goal_points)[:, 0:3] - pose[0:3, 3])**2, axis=1))
+    scene_distances = numpy.sqrt(numpy.sum(
+        (numpy.asarray(scene_points)[:, 0:3] - pose[0:3, 3])**2, axis=1))
+    occluded = goal_hits & numpy.asarray(scene_hits, dtype=bool) \
+             & (scene_distances < goal_distances - 1e-4)
+
+    center = (numpy.array(dims, dtype=float) - 1) / 2
+    weights = 1. / (1. + numpy.sqrt(numpy.sum((pixels - center)**2, axis=1)))
+    return numpy.sum(weights[occluded]) / numpy.sum(weights[goal_hits])
+
+
+def FitOcclusionScale(rendered_scores, ray_scores):
+    """Fit the scale that calibrates ray cast occlusion to rendered occlusion.
+    @param rendered_scores occlusion scores from the offscreen renderer
+    @param ray_scores GetRayOcclusion scores of the same poses
+    @return least-squares scale s that minimizes |rendered - s * ray|
+    """
+    rendered_scores = numpy.asarray(rendered_scores, dtype=float)
+    ray_scores = numpy.asarray(ray_scores, dtype=float)
+    denominator = numpy.dot(ray_scores, ray_scores)
+    if denominator == 0:
+        return 1.
+    return numpy.dot(rendered_scores, ray_scores) / denominator
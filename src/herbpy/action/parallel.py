@@ -0,0 +1,133 @@
+import json, logging, multiprocessing, numpy, os, shutil, subprocess, sys
+import tempfile, threading, time
+from herbpy.server import PlanningClient, PlanningServerError
+
+logger = logging.getLogger('herbpy')
+
+# Runs a PlanningServer with one HERB environment in a new interpreter.
+_WORKER_COMMAND = ('import json, sys, herbpy.server;'
+                   ' herbpy.server.Serve(sys.argv[1], **json.loads(sys.argv[2]))')
+
+
+class NaturalnessPool(object):
+    def __init__(self, num_workers=None, startup_timeout=300., **herbpy_args):
+        """Pool of worker processes that score the occlusion of IK solutions.
+        Each worker is a PlanningServer with one HERB environment and its own
+        offscreen sensor. Workers are started as new Python interpreters
+        instead of being forked, so the pool can be created from a live
+        herbpy session. Every request sends the state of the robot and the
+        kinbodies that changed since the last request; kinbodies that were
+        not loaded from a file are saved to a temporary file.
+        @param num_workers number of worker processes; defaults to the
+                           number of CPUs
+        @param startup_timeout maximum time to wait for the workers to
+                               initialize HERB
+        @param **herbpy_args keyword arguments passed to herbpy.initialize;
+                             they must be serializable as JSON
+        """
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+
+        self.num_workers = num_workers
+        self._lock = threading.Lock()
+        self._directory = tempfile.mkdtemp(prefix='herbpy-naturalness-')
+        self._processes = list()
+        self._clients = list()
+
+        try:
+            socket_paths = list()
+            for i in xrange(num_workers):
+                socket_path = os.path.join(self._directory,
+                                           'worker{:d}.sock'.format(i))
+                self._processes.append(subprocess.Popen([ sys.executable,
+                    '-c', _WORKER_COMMAND, socket_path, json.dumps(herbpy_args) ]))
+                socket_paths.append(socket_path)
+
+            deadline = time.time() + startup_timeout
+            for process, socket_path in zip(self._processes, socket_paths):
+                self._clients.append(self._Connect(process, socket_path, deadline))
+        except:
+            self.Close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+
+    def Close(self):
+        """Stop the worker processes."""
+        for client in self._clients:
+            client.Close()
+        for process in self._processes:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+
+        self._clients = list()
+        self._processes = list()
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def ScoreOcclusion(self, robot, ranker, ik_solutions, num_shards=None):
+        """Score the weighted occlusion term of IK solutions in parallel.
+        The scores are the same as ranker.scoreOcclusion in this process.
+        @param robot robot the solutions are for
+        @param ranker Naturalness ranker
+        @param ik_solutions (N,D) array of IK solutions of the active arm
+        @param num_shards number of workers to split the solutions between;
+                          defaults to all workers
+        @return (N,) array of occlusion scores
+        """
+        ik_solutions = numpy.atleast_2d(ik_solutions)
+        if len(ik_solutions) == 0:
+            return numpy.zeros(0)
+
+        if num_shards is None:
+            num_shards = self.num_workers
+        num_shards = min(num_shards, self.num_workers)
+
+        shards = [ shard for shard in numpy.array_split(
+                       numpy.arange(len(ik_solutions)), num_shards)
+                   if len(shard) > 0 ]
+        results = [ None ] * len(shards)
+
+        def score_shard(i):
+            try:
+                results[i] = self._clients[i].ScoreOcclusion(
+                    robot, ranker, ik_solutions[shards[i]])
+            except Exception as e:
+                results[i] = e
+
+        # Each worker has one connection, so requests must not interleave.
+        with self._lock:
+            threads = [ threading.Thread(target=score_shard, args=(i,))
+                        for i in xrange(len(shards)) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return numpy.concatenate(results)
+
+    def _Connect(self, process, socket_path, deadline):
+        while True:
+            if process.poll() is not None:
+                raise PlanningServerError(
+                    'Scoring worker exited with code {:d} during startup.'.format(
+                    process.returncode))
+
+            if os.path.exists(socket_path):
+                try:
+                    return PlanningClient(socket_path,
+                                          body_directory=self._directory)
+                except EnvironmentError:
+                    pass
+
+            if time.time() > deadline:
+                raise PlanningServerError(
+                    'Timed out waiting for a scoring worker to start.')
+            time.sleep(0.1)
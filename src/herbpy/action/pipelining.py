@@ -0,0 +1,115 @@
+import logging, numpy, threading
+from prpy.clone import Clone
+from prpy.util import CopyTrajectory
+from herbpy.planning.cache import GetTrajectoryDOFIndices
+
+logger = logging.getLogger('herbpy')
+
+
+class PlanningFuture(object):
+    def __init__(self, fn):
+        """Run a function in a background thread.
+        @param fn function that takes no arguments
+        """
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+        thread = threading.Thread(target=self._Run, args=(fn,),
+                                  name='PlanningFuture')
+        thread.daemon = True
+        thread.start()
+
+    def _Run(self, fn):
+        try:
+            self._result = fn()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the function to finish and return its result.
+        @param timeout maximum time to wait, or None to wait forever
+        @return return value of the function; re-raises its exception
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for planning to finish.')
+        elif self._error is not None:
+            raise self._error
+        else:
+            return self._result
+
+
+def GetPredictedState(robot, traj):
+    """Get the DOF values the robot will have after executing a path.
+    @param robot robot that will execute the path
+    @param traj path or trajectory
+    @return tuple of the DOF indices and their values at the end of traj
+    """
+    cspec = traj.GetConfigurationSpecification()
+    dof_indices = GetTrajectoryDOFIndices(traj)
+    waypoint = traj.GetWaypoint(traj.GetNumWaypoints() - 1)
+    dof_values = cspec.ExtractJointValues(waypoint, robot, dof_indices)
+    return dof_indices, dof_values
+
+
+def PlanFromState(robot, dof_indices, dof_values, plan_fn):
+    """Plan from a different state of the robot in the background.
+    This clones the environment, sets \p dof_values on the cloned robot, and
+    calls \p plan_fn(cloned_env) in a background thread. The returned
+    trajectory is copied into the robot's environment.
+    @param robot robot to plan for
+    @param dof_indices DOF indices to change in the cloned environment
+    @param dof_values values of those DOFs
+    @param plan_fn function that plans in the cloned environment
+    @return PlanningFuture whose result is the planned trajectory
+    """
+    env = robot.GetEnv()
+
+    def plan():
+        with Clone(env) as cloned_env:
+            cloned_robot = cloned_env.Cloned(robot)
+            with cloned_env:
+                cloned_robot.SetDOFValues(dof_values, dof_indices)
+
+            cloned_traj = plan_fn(cloned_env)
+            return CopyTrajectory(cloned_traj, env=env)
+
+    return PlanningFuture(plan)
+
+
+def PlanFromPredictedState(robot, traj, plan_fn):
+    """Plan the next motion while a path is executing.
+    This plans from the end of \p traj with PlanFromState. Check that the
+    robot actually reached the end of \p traj with ReachedPredictedState
+    before executing the result.
+    @param robot robot that is executing traj
+    @param traj path or trajectory that is executing
+    @param plan_fn function that plans in the cloned environment
+    @return PlanningFuture whose result is the planned trajectory
+    """
+    dof_indices, dof_values = GetPredictedState(robot, traj)
+    return PlanFromState(robot, dof_indices, dof_values, plan_fn)
+
+
+def ReachedPredictedState(robot, traj, tolerance=0.01):
+    """Check whether the robot is at the end of a path.
+    @param robot robot that executed traj
+    @param traj path or trajectory
+    @param tolerance maximum joint error in radians
+    @return True if every DOF is within tolerance of its predicted value
+    """
+    dof_indices, dof_values = GetPredictedState(robot, traj)
+    with robot.GetEnv():
+        actual_values = robot.GetDOFValues(dof_indices)
+
+    error = numpy.max(numpy.abs(numpy.array(actual_values) - dof_values))
+    if error > tolerance:
+        logger.warning('Robot stopped %.3f rad away from the end of the path.',
+                       error)
+        return False
+    return True
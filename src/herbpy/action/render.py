@@ -0,0 +1,125 @@
+import collections, logging, openravepy, threading
+from contextlib import contextmanager
+
+logger = logging.getLogger('herbpy')
+
+
+class RenderSensorPool(object):
+    def __init__(self, length=640, width=480,
+                 intrinsics=(529, 525, 328, 267, 0.01, 10),
+                 max_environments=4, max_idle=2):
+        """Pool of configured offscreen render cameras.
+        Creating, configuring and powering on a camera is slow, so sensors
+        are kept powered on and handed out again by Acquire. A sensor only
+        renders bodies of the environment it was created in, so the pool is
+        keyed on the environment. The sensors of the least recently used
+        environment are powered off when more than \p max_environments have
+        sensors, which bounds the memory used by cloned environments.
+        @param length width of the image in pixels
+        @param width height of the image in pixels
+        @param intrinsics fx, fy, cx, cy, near and far of the camera
+        @param max_environments maximum number of environments with sensors
+        @param max_idle maximum number of idle sensors per environment
+        """
+        self.length = length
+        self.width = width
+        self.intrinsics = intrinsics
+        self.max_environments = max_environments
+        self.max_idle = max_idle
+
+        self._lock = threading.Lock()
+        self._idle = collections.OrderedDict()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def Acquire(self, env):
+        """Borrow a powered on sensor for an environment.
+        The sensor is cleared of bodies when it is returned to the pool.
+        @param env environment the sensor renders
+        @return context manager that yields the sensor
+        """
+        sensor = self._Pop(env)
+        try:
+            yield sensor
+        finally:
+            sensor.SendCommand('clearbodies')
+            self._Push(env, sensor)
+
+    def Release(self, env):
+        """Power off the idle sensors of an environment, e.g. before the
+        environment is destroyed.
+        @param env environment
+        """
+        with self._lock:
+            sensors = self._idle.pop(env, [])
+        self._PowerOff(sensors)
+
+    def Clear(self):
+        """Power off all idle sensors."""
+        with self._lock:
+            sensors = [ sensor for env_sensors in self._idle.itervalues()
+                               for sensor in env_sensors ]
+            self._idle.clear()
+        self._PowerOff(sensors)
+
+    def GetStatistics(self):
+        """Get the pool counters.
+        @return dictionary of counters
+        """
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'environments': len(self._idle),
+                'idle': sum(len(sensors) for sensors in self._idle.itervalues()),
+            }
+
+    def _Pop(self, env):
+        with self._lock:
+            sensors = self._idle.pop(env, None)
+            if sensors is not None:
+                self._idle[env] = sensors
+                if sensors:
+                    self.reused += 1
+                    return sensors.pop()
+            self.created += 1
+
+        sensor = openravepy.RaveCreateSensor(env, 'offscreen_render_camera')
+        if sensor is None:
+            raise ValueError('Failed creating an offscreen_render_camera sensor;'
+                             ' is the offscreen_render plugin installed?')
+
+        sensor.SendCommand('setintrinsic '
+                           + ' '.join(str(value) for value in self.intrinsics))
+        sensor.SendCommand('setdims {:d} {:d}'.format(self.length, self.width))
+        sensor.Configure(openravepy.Sensor.ConfigureCommand.PowerOn)
+        return sensor
+
+    def _Push(self, env, sensor):
+        evicted = list()
+        with self._lock:
+            sensors = self._idle.pop(env, [])
+            if len(sensors) < self.max_idle:
+                sensors.append(sensor)
+            else:
+                evicted.append(sensor)
+            self._idle[env] = sensors
+
+            while len(self._idle) > self.max_environments:
+                _, env_sensors = self._idle.popitem(last=False)
+                evicted.extend(env_sensors)
+
+        self._PowerOff(evicted)
+
+    def _PowerOff(self, sensors):
+        for sensor in sensors:
+            try:
+                sensor.Configure(openravepy.Sensor.ConfigureCommand.PowerOff)
+            except openravepy.openrave_exception as e:
+                logger.warn('Failed powering off an offscreen render sensor: %s',
+                            str(e))
+
+
+# Shared by every Naturalness ranker in the process.
+sensor_pool = RenderSensorPool()
@@ -3,12 +3,16 @@ from prpy.action import ActionMethod
 from prpy.planning.base import PlanningError
 from contextlib import contextmanager 
 from prpy.util import FindCatkinResource
-import numpy, cPickle, time, os.path
+import numpy, cPickle, heapq, threading, time, os.path
+import render
+from occlusion import GetRayOcclusion
+from herbpy.kinematics import GetEndEffectorTransforms
 
 logger = logging.getLogger('herbpy')
 
 @ActionMethod
-def Point(robot, focus, manip=None, render=False):
+def Point(robot, focus, manip=None, render=False, occlusion='render',
+          occlusion_scale=1., scoring_pool=None):
     """
     @param robot The robot performing the point
     @param focus The 3-D coordinate in space or object 
@@ -16,8 +20,17 @@ def Point(robot, focus, manip=None, render=False):
     @param manip The manipulator to perform the point with. 
                  This must be the right arm
     @param render Render tsr samples during planning
+    @param occlusion Score occlusion of the object with the offscreen
+                     renderer ('render') or by ray casting ('raycast'),
+                     which does not need the offscreen_render plugin
+    @param occlusion_scale Scale of ray cast occlusion scores; fit it
+                           against rendered scores with
+                           scripts/benchmark_pointing.py
+    @param scoring_pool NaturalnessPool that scores the IK solutions
+                        in parallel worker processes
     """
-    import offscreen_render
+    if occlusion == 'render':
+        import offscreen_render
     #Pointing at an object
     if type(focus) == openravepy.openravepy_int.KinBody:
         focus_trans = focus.GetTransform()
@@ -48,7 +61,9 @@ def Point(robot, focus, manip=None, render=False):
 
     with prpy.viz.RenderTSRList(point_tsr, robot.GetEnv(), render=render):
         robot.PlanToTSR(point_tsr, execute=True, 
-              ranker=Naturalness(focus_trans, goal_name))
+              ranker=Naturalness(focus_trans, goal_name, occlusion=occlusion,
+                                 occlusion_scale=occlusion_scale,
+                                 scoring_pool=scoring_pool))
     robot.right_hand.MoveHand(f1=2.4, f2=0.8, f3=2.4, spread=3.14)
 
 @ActionMethod
@@ -306,98 +321,239 @@ def MiddleFinger(robot, manip=None):
                                 for the left and right arm.')
 
 class Naturalness(object):
-    def __init__(self, focus_trans, goal_name):
+    #Score masks and feature weights are shared by every instance
+    _score_masks = dict()
+    _feature_weights = None
+    _cache_lock = threading.Lock()
+
+    def __init__(self, focus_trans, goal_name, sensor_pool=None,
+                 occlusion='render', occlusion_scale=1., num_exact=3,
+                 scoring_pool=None):
+        """
+        @param focus_trans pose of the focus of the point
+        @param goal_name name of the object being pointed at, or None
+        @param sensor_pool RenderSensorPool used to score occlusion
+                           (if None, the pool shared by the process is used)
+        @param occlusion 'render' to score occlusion with the offscreen
+                         renderer or 'raycast' to estimate it with rays
+        @param occlusion_scale scale of ray cast occlusion scores, e.g.
+                               fit against rendered scores with
+                               occlusion.FitOcclusionScale
+        @param num_exact number of best solutions whose occlusion is scored
+                         exactly (if None, all solutions are scored)
+        @param scoring_pool NaturalnessPool of worker processes that score
+                            occlusion in parallel (if None, occlusion is
+                            scored in this process)
+        """
+        if occlusion not in ('render', 'raycast'):
+            raise ValueError('Unknown occlusion estimator "{:s}".'.format(occlusion))
+        if num_exact is not None and num_exact < 1:
+            raise ValueError('num_exact must be None or at least 1; got {:s}.'.format(
+                             str(num_exact)))
+
         self.focus_trans = focus_trans
         self.goal_name = goal_name
+        self.occlusion = occlusion
+        self.occlusion_scale = occlusion_scale
+        self.num_exact = num_exact
+        self.scoring_pool = scoring_pool
+        self.sensor_pool = sensor_pool if sensor_pool is not None else render.sensor_pool
 
         #Set up sensor parameters
-        self.sensor_length = 640
-        self.sensor_width = 480
+        self.sensor_length = self.sensor_pool.length
+        self.sensor_width = self.sensor_pool.width
         self.sensor_weight = 255
-        self.scoreMask = self.weightedScoreArray()
-       
-        feature_path = FindCatkinResource('herbpy', 
+
+        with self._cache_lock:
+            dims = (self.sensor_length, self.sensor_width)
+            if dims not in Naturalness._score_masks:
+                score_mask = self.weightedScoreArray()
+                score_mask.flags.writeable = False
+                Naturalness._score_masks[dims] = score_mask
+            self.scoreMask = Naturalness._score_masks[dims]
+
+            if Naturalness._feature_weights is None:
+                Naturalness._feature_weights = self.loadFeatureWeights()
+            self.featureWeights = Naturalness._feature_weights
+
+    def loadFeatureWeights(self):
+        """Load the weight of each feature from the herbpy config."""
+        feature_path = FindCatkinResource('herbpy',
                 'config/natural_feature_weights.pickle')
-         
+
         try:
-            self.featureWeights = cPickle.load(open(feature_path, 'rb'))
+            with open(feature_path, 'rb') as feature_file:
+                return cPickle.load(feature_file)
         except IOError as e:
             raise ValueError('Failed loading pointing weights \
                     from "{:s}".'.format(feature_path))
-        
-        
+
+    #Joint features: (joint name, feature name, optimal, full range, offset)
+    joint_features = [
+        ('/right/j1', 'ShoulderRotation', 1.5, 2, 0),
+        ('/right/j5', 'ElbowRotation', -0.5, 2, 1.5),
+        ('/right/j6', 'WristAngle', 0, 1, 0),
+        ('/right/j7', 'WristRotation', 0, 1, 0),
+    ]
+
     def __call__(self, robot, ik_solutions):
         self.robot = robot
         self.env = self.robot.GetEnv()
         self.manip = robot.GetActiveManipulator()
+        ik_solutions = numpy.atleast_2d(ik_solutions)
         num_sols = ik_solutions.shape[0]
-        results = numpy.zeros(num_sols)
-
-        #Create sensor
-        self.sensor = openravepy.RaveCreateSensor(self.env,
-                'offscreen_render_camera')
-        self.sensor.SendCommand('setintrinsic 529 525 328 267 0.01 10')
-        self.sensor.SendCommand('setdims '+str(self.sensor_length)+
-                ' '+str(self.sensor_width))
-        self.sensor.Configure(openravepy.Sensor.ConfigureCommand.PowerOn)
-        resetDOFs = self.manip.GetDOFValues()             
- 
-        #Score each configuration
-        for i in xrange(0, num_sols):
-            results[i] = self.score_pose(ik_solutions[i])
-
-        self.manip.SetDOFValues(resetDOFs)
-        return results
 
-    def score_pose(self, ik_sol):
-        """Set the robot in the configuration and then total up, 
-        for each scoring parameter, the weight of that parameter
-        times its score"""
-        self.manip.SetDOFValues(ik_sol)
-        self.pose = self.manip.GetEndEffectorTransform()
-
-        total = 0
-        total += self.compute_score('/right/j1', 'ShoulderRotation', 1.5, 2, 0) 
-        total += self.compute_score('/right/j5', 'ElbowRotation', -0.5, 2, 1.5)
-        total += self.compute_score('/right/j6', 'WristAngle', 0, 1, 0)
-        total += self.compute_score('/right/j7', 'WristRotation', 0, 1, 0)
-        total += self.wristOffset('WristRelative')
-        total += self.objectDistance('Distance')
+        #Score the kinematic features of all configurations at once
+        poses = GetEndEffectorTransforms(self.robot, self.manip, ik_solutions)
+        features = numpy.column_stack([ self.jointFeatures(ik_solutions),
+                                        self.wristOffset(poses),
+                                        self.objectDistance(poses) ])
+        weights = numpy.array([ self.featureWeights[feature[1]]
+                                for feature in self.joint_features ]
+                              + [ self.featureWeights['WristRelative'],
+                                  self.featureWeights['Distance'] ])
+        results = numpy.dot(features, weights)
 
         #If the focus is a point in space, not an object, there
         #is no concept of occulsion
-        if self.goal_name is not None:
-            total += self.score_occulsion()
-        return total
-
-    def compute_score(self, joint, dict_name, optimal, full_range, offset):
-        """For the generic joint based parameter, score based on 
-        who far the configuration differs from the 'optimal' """
-        actual = self.robot.GetJoint(joint).GetValue(1)+(offset*numpy.pi)
-        optimal_val = (optimal+offset)*numpy.pi
-        full_range_val = full_range*numpy.pi
-        weight = self.featureWeights[dict_name]
-        return (abs(optimal_val - actual) / full_range_val)*weight
-
-    def wristOffset(self, dict_name):
+        if self.goal_name is None:
+            return results
+
+        #Score every solution the bound may need in the worker processes
+        if self.scoring_pool is not None:
+            candidates = self.occlusionCandidates(results)
+            scores = self.scoring_pool.ScoreOcclusion(robot, self,
+                                                      ik_solutions[candidates])
+            return self.boundOcclusion(results,
+                                       dict(zip(candidates, scores)).__getitem__)
+
+        with self.occlusionScorer(ik_solutions, poses) as score_fn:
+            return self.boundOcclusion(results, score_fn)
+
+    def scoreOcclusion(self, robot, ik_solutions):
+        """Score the weighted occlusion term of every solution."""
+        self.robot = robot
+        self.env = self.robot.GetEnv()
+        self.manip = robot.GetActiveManipulator()
+        ik_solutions = numpy.atleast_2d(ik_solutions)
+        poses = GetEndEffectorTransforms(self.robot, self.manip, ik_solutions)
+
+        with self.occlusionScorer(ik_solutions, poses) as score_fn:
+            return numpy.array([ score_fn(i) for i in xrange(len(ik_solutions)) ])
+
+    @contextmanager
+    def occlusionScorer(self, ik_solutions, poses):
+        """Yields a function that scores the weighted occlusion term
+        of the i-th solution."""
+        #Rays ignore the robot, so the arm does not have to move
+        if self.occlusion == 'raycast':
+            goal = self.env.GetKinBody(self.goal_name)
+            yield lambda i: self.score_occulsion_raycast(goal, poses[i])
+            return
+
+        resetDOFs = self.manip.GetDOFValues()
+
+        #Occlusion needs a render of each configuration
+        def score_render(i):
+            self.manip.SetDOFValues(ik_solutions[i])
+            return self.score_occulsion()
+
+        with self.sensor_pool.Acquire(self.env) as self.goal_sensor, \
+             self.sensor_pool.Acquire(self.env) as self.scene_sensor:
+            try:
+                self.addBodies()
+                yield score_render
+            finally:
+                self.manip.SetDOFValues(resetDOFs)
+                self.goal_sensor = self.scene_sensor = None
+
+    def occlusionCandidates(self, cheap_scores):
+        """Indices of the solutions that boundOcclusion may score. Lower
+        and upper bounds differ by the same amount for all solutions, so
+        a solution whose lower bound is at least the num_exact-th smallest
+        upper bound is never scored."""
+        if self.num_exact is None or self.num_exact >= len(cheap_scores):
+            return numpy.arange(len(cheap_scores))
+
+        weight = self.featureWeights['OcculsionScore']
+        if self.occlusion == 'raycast':
+            weight *= self.occlusion_scale
+        lower = cheap_scores + min(0., weight)
+        order = numpy.argsort(lower, kind='mergesort')
+        bound = cheap_scores[order[self.num_exact - 1]] + max(0., weight)
+        return order[:self.num_exact].tolist() \
+             + [ i for i in order[self.num_exact:] if lower[i] < bound ]
+
+    def boundOcclusion(self, cheap_scores, score_fn):
+        """The occlusion fraction is between 0 and 1, so the occlusion
+        term is bounded by its weight. Solutions are scored exactly in
+        order of their lower bound until num_exact solutions are scored
+        and no other solution can beat them. The remaining solutions
+        get their upper bound, so the best num_exact keep their rank."""
+        weight = self.featureWeights['OcculsionScore']
+        if self.occlusion == 'raycast':
+            weight *= self.occlusion_scale
+        lower = cheap_scores + min(0., weight)
+        results = cheap_scores + max(0., weight)
+
+        # Max-heap (of negated scores) of the num_exact best exact scores.
+        best = list()
+        num_scored = 0
+        for i in numpy.argsort(lower, kind='mergesort'):
+            if (self.num_exact is not None and len(best) >= self.num_exact
+                    and lower[i] >= -best[0]):
+                break
+            results[i] = cheap_scores[i] + score_fn(i)
+            num_scored += 1
+
+            if self.num_exact is None:
+                continue
+            elif len(best) < self.num_exact:
+                heapq.heappush(best, -results[i])
+            else:
+                heapq.heappushpop(best, -results[i])
+
+        logger.debug('Scored the occlusion of %d of %d IK solutions.',
+                     num_scored, len(cheap_scores))
+        return results
+
+    def jointFeatures(self, ik_solutions):
+        """For the generic joint based parameters, score based on
+        how far each configuration differs from the 'optimal'. Joints
+        that are not in the active arm keep their current value."""
+        arm_indices = list(self.manip.GetArmIndices())
+        features = numpy.zeros((len(ik_solutions), len(self.joint_features)))
+
+        for i, (joint, _, optimal, full_range, offset) \
+                in enumerate(self.joint_features):
+            dof_index = self.robot.GetJoint(joint).GetDOFIndex()
+            if dof_index in arm_indices:
+                values = ik_solutions[:, arm_indices.index(dof_index)]
+            else:
+                values = self.robot.GetDOFValues([ dof_index ])[0]
+
+            actual = values + (offset*numpy.pi)
+            optimal_val = (optimal+offset)*numpy.pi
+            full_range_val = full_range*numpy.pi
+            features[:, i] = abs(optimal_val - actual) / full_range_val
+        return features
+
+    def wristOffset(self, poses):
         """For finding how far the rotation of the wrist is offset
         from being horizontal, find the angle between z value of the
         wrist pose and the j unit vector. Then score by how much it
         differs from the optimal, being horizontal."""
-        z = self.pose[0:3, 2]
-        z_length = numpy.sqrt(z[0]**2 + z[1]**2 + z[2]**2)
-        angle = (numpy.arccos(z[1] / z_length)) / numpy.pi
+        z = poses[:, 0:3, 2]
+        z_length = numpy.sqrt(numpy.sum(z**2, axis=1))
+        angle = (numpy.arccos(z[:, 1] / z_length)) / numpy.pi
         optimal = 0
         full_range = 2
-        offset = abs(optimal - angle) / full_range
-        return self.featureWeights[dict_name] * offset 
+        return abs(optimal - angle) / full_range
 
-    def objectDistance(self, dict_name):
+    def objectDistance(self, poses):
         """Compute the distance between the end effector and the object."""
-        [px, py, pz] = self.pose[0:3, 3]
-        [gx, gy, gz] = self.focus_trans[0:3, 3]
-        dist = numpy.sqrt((px-gx)**2 + (py - gy)**2 + (pz - gz)**2)
-        return self.featureWeights[dict_name]*dist
+        offsets = poses[:, 0:3, 3] - self.focus_trans[0:3, 3]
+        return numpy.sqrt(numpy.sum(offsets**2, axis=1))
 
     def weightedScoreArray(self):
         """The occulsion value is scored against a weighted array that
@@ -411,42 +567,50 @@ class Naturalness(object):
 
     def valFromPhoto(self, img):
         """Takes the image generated by sensor and computes
-        the weighted score."""
-        data = img.imagedata
-        compact_array = numpy.apply_over_axes(numpy.sum, data, [2])
-        reshape_array = numpy.ravel(compact_array)
-        divide_out = reshape_array / self.sensor_weight
-        goal = numpy.dot(self.scoreMask, divide_out)
-        return goal
+        the weighted score of the pixels of the goal object."""
+        #The goal is the only body rendered in the red channel
+        goal_pixels = numpy.ravel(img.imagedata[:, :, 0]) / self.sensor_weight
+        return numpy.dot(self.scoreMask, goal_pixels)
+
+    def addBodies(self):
+        """The goal sensor only holds the goal object. The scene sensor
+        holds the goal object in red and all other objects in black,
+        so they hide the pixels of the goal they are in front of.
+        Bodies are added once for all configurations that are scored."""
+        goal_color = ' '+str(self.sensor_weight)+' 0 0'
+        self.goal_sensor.SendCommand('addbody '+self.goal_name+goal_color)
+        self.scene_sensor.SendCommand('addbody '+self.goal_name+goal_color)
 
-    def score_occulsion(self):
-        """Sensor captures base photo with just the goal object
-        and scores it against a photo with all objects in the scene
-        overlaid on the base photo."""
-        pose = self.manip.GetEndEffectorTransform()
-        self.sensor.SetTransform(pose)
-       
-        self.sensor.SendCommand('addbody '+self.goal_name+' '+
-                str(self.sensor_weight)+' 0 0')
-        self.sensor.SimulationStep(0.01)
-        data_solo = self.sensor.GetSensorData()
-        solo_goal = self.valFromPhoto(data_solo)
-       
         #Get all other objects in the scene and add them to the image
         allObjs = self.env.GetBodies()
         for j in allObjs:
             name = j.GetName()
             if ((name != self.goal_name) and (name != self.robot.GetName())):
-                self.sensor.SendCommand('addbody '+name+' 0 0 0 0')
+                self.scene_sensor.SendCommand('addbody '+name+' 0 0 0 0')
 
-        self.sensor.SimulationStep(0.01)
-        data_all = self.sensor.GetSensorData()
-        all_goal = self.valFromPhoto(data_all)
- 
+    def score_occulsion(self):
+        """Both sensors capture a photo from the end effector and the
+        score is the fraction of the weighted goal pixels that are
+        hidden by other objects in the scene."""
+        pose = self.manip.GetEndEffectorTransform()
+        self.goal_sensor.SetTransform(pose)
+        self.scene_sensor.SetTransform(pose)
+
+        self.goal_sensor.SimulationStep(0.01)
+        solo_goal = self.valFromPhoto(self.goal_sensor.GetSensorData())
         if solo_goal == 0:
-            score = 0
-        else:
-            score = (float(solo_goal - all_goal) / float(solo_goal))
+            return 0.
+
+        self.scene_sensor.SimulationStep(0.01)
+        all_goal = self.valFromPhoto(self.scene_sensor.GetSensorData())
+
+        score = (float(solo_goal - all_goal) / float(solo_goal))
+        return score*self.featureWeights['OcculsionScore']
 
-        self.sensor.SendCommand('clearbodies')
-        return score*self.featureWeights['OcculsionScore'] 
+    def score_occulsion_raycast(self, goal, pose):
+        """Estimate the occlusion score by casting rays from the end
+        effector instead of rendering photos."""
+        score = GetRayOcclusion(self.robot, goal, pose,
+                                intrinsics=self.sensor_pool.intrinsics,
+                                dims=(self.sensor_length, self.sensor_width))
+        return self.occlusion_scale*score*self.featureWeights['OcculsionScore']
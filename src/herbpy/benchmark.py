@@ -0,0 +1,396 @@
+import json, logging, numpy, os, random, time
+import openravepy
+from prpy.planning.base import MetaPlanner, PlanningError
+from herbpy.planning.cache import GetTrajectoryDOFIndices
+
+logger = logging.getLogger('herbpy')
+
+# Table and base poses from examples/graspFuzeBottle.py.
+TABLE_POSE = numpy.array([[ 1., 0.,  0., 2. ],
+                          [ 0., 0., -1., 2. ],
+                          [ 0., 1.,  0., 0. ],
+                          [ 0., 0.,  0., 1. ]])
+ROBOT_IN_TABLE = numpy.array([[ 0., 1., 0.,  0.    ],
+                              [ 0., 0., 1.,  0.    ],
+                              [ 1., 0., 0., -1.025 ],
+                              [ 0., 0., 0.,  1.    ]])
+
+# Each scene places one object on the table. The offset is the position of
+# the object along the table's width, as a fraction of the half-extent.
+SCENES = {
+    'fuze_bottle': {
+        'offset': 0.6,
+        'tasks': [ 'Grasp', 'PushGrasp', 'Lift', 'Place',
+                   'PlanToNamedConfiguration', 'PlanToBasePose' ],
+    },
+    'plastic_glass': {
+        'offset': 0.6,
+        'tasks': [ 'Grasp', 'PushGrasp', 'Lift', 'Place' ],
+    },
+    'plastic_plate': {
+        'offset': 0.5,
+        'tasks': [ 'Grasp', 'Lift', 'Place' ],
+    },
+    'plastic_bowl': {
+        'offset': 0.5,
+        'tasks': [ 'Grasp', 'Place' ],
+    },
+    'pop_tarts': {
+        'offset': 0.6,
+        'tasks': [ 'Grasp', 'PushGrasp', 'Lift' ],
+    },
+    'wicker_tray': {
+        'offset': 0.3,
+        'tasks': [ 'Grasp', 'Lift' ],
+    },
+    'rubbermaid_ice_guard_pitcher': {
+        'offset': 0.6,
+        'tasks': [ 'Grasp' ],
+    },
+}
+
+
+def _Grasp(robot, manip, obj, table):
+    if obj.GetName() == 'wicker_tray':
+        tsrlist = robot.tsrlibrary(obj, 'handle_grasp', manip=manip)
+    else:
+        tsrlist = None
+    manip.Grasp(obj, tsrlist=tsrlist, render=False)
+
+def _PushGrasp(robot, manip, obj, table):
+    manip.PushGrasp(obj, push_required=False, render=False)
+
+def _Lift(robot, manip, obj, table):
+    manip.Lift(obj, render=False)
+
+def _Place(robot, manip, obj, table):
+    manip.Place(obj, table, render=False)
+
+def _PlanToNamedConfiguration(robot, manip, obj, table):
+    robot.PlanToNamedConfiguration('home', execute=False)
+
+def _PlanToBasePose(robot, manip, obj, table):
+    with robot.GetEnv():
+        goal_pose = robot.GetTransform()
+    goal_pose[0:3, 3] -= 0.5 * goal_pose[0:3, 0]
+    robot.base.PlanToBasePose(goal_pose, execute=False)
+
+# Tasks and the tasks that must succeed to set up the scene for them.
+TASKS = {
+    'Grasp': ([], _Grasp),
+    'PushGrasp': ([], _PushGrasp),
+    'Lift': ([ _Grasp ], _Lift),
+    'Place': ([ _Grasp, _Lift ], _Place),
+    'PlanToNamedConfiguration': ([], _PlanToNamedConfiguration),
+    'PlanToBasePose': ([], _PlanToBasePose),
+}
+
+
+def GetPathLength(robot, traj):
+    """Compute the length of a path in configuration space.
+    @param robot robot the path is for
+    @param traj path or trajectory
+    @return sum of the Euclidean distances between consecutive waypoints
+    """
+    cspec = traj.GetConfigurationSpecification()
+    dof_indices = GetTrajectoryDOFIndices(traj)
+    if not dof_indices:
+        return 0.
+
+    waypoints = numpy.array([
+        cspec.ExtractJointValues(traj.GetWaypoint(i), robot, dof_indices)
+        for i in xrange(traj.GetNumWaypoints()) ])
+    if len(waypoints) < 2:
+        return 0.
+
+    return float(numpy.sum(numpy.linalg.norm(numpy.diff(waypoints, axis=0), axis=1)))
+
+
+class RecordingPlanner(MetaPlanner):
+    def __init__(self, planner):
+        """Records the trajectories returned by a planner.
+        @param planner delegate planner
+        """
+        MetaPlanner.__init__(self)
+        self._planners = [ planner ]
+        self.planner = planner
+        self.trajectories = list()
+
+    def __str__(self):
+        return str(self.planner)
+
+    def plan(self, method, args, kw_args):
+        traj = getattr(self.planner, method)(*args, **kw_args)
+        self.trajectories.append(traj)
+        return traj
+
+
+class Benchmark(object):
+    def __init__(self, env, robot, objects_path, manip=None):
+        """Headless planning benchmark built from canonical HERB scenes.
+        HERB's planners read and update its planner statistics, so initialize
+        HERB with a new \p planner_statistics_path for each run; otherwise
+        results depend on earlier sessions and the benchmark changes the
+        statistics used outside of it.
+        @param env environment that contains HERB
+        @param robot HERB
+        @param objects_path directory with the pr_ordata kinbody files
+        @param manip manipulator used for manipulation tasks; default right
+        """
+        self.env = env
+        self.robot = robot
+        self.objects_path = objects_path
+        self.manip = manip or robot.right_arm
+
+    def CreateScene(self, scene_name):
+        """Add a table and the scene's object to the environment.
+        @param scene_name name of the scene, which is also the object type
+        @return tuple of the table and the object
+        """
+        for body in self.env.GetBodies():
+            if body != self.robot:
+                self.env.Remove(body)
+
+        table = self.env.ReadKinBodyXMLFile(
+            os.path.join(self.objects_path, 'table.kinbody.xml'))
+        table.SetName('table')
+        self.env.Add(table)
+        table.SetTransform(TABLE_POSE)
+
+        obj = self.env.ReadKinBodyXMLFile(
+            os.path.join(self.objects_path, scene_name + '.kinbody.xml'))
+        if obj is None:
+            raise ValueError('Failed loading object "{:s}" from "{:s}".'.format(
+                             scene_name, self.objects_path))
+        obj.SetName(scene_name)
+        self.env.Add(obj)
+
+        return table, obj
+
+    def ResetScene(self, scene_name, table, obj, rng):
+        """Reset the robot and randomly perturb the object on the table.
+        @param scene_name name of the scene
+        @param table table kinbody
+        @param obj object kinbody
+        @param rng numpy.random.RandomState used for the perturbation
+        """
+        robot = self.robot
+
+        with self.env:
+            for grabbed in robot.GetGrabbed():
+                robot.Release(grabbed)
+
+            dof_indices, dof_values \
+                = robot.configurations.get_configuration('relaxed_home')
+            robot.SetDOFValues(dof_values, dof_indices)
+            robot.SetDOFValues(numpy.zeros(len(self.manip.hand.GetIndices())),
+                               self.manip.hand.GetIndices())
+
+            base_pose = numpy.dot(table.GetTransform(), ROBOT_IN_TABLE)
+            base_pose[2, 3] = 0.
+            robot.SetTransform(base_pose)
+
+            table_aabb = table.ComputeAABB()
+            yaw = rng.uniform(-numpy.pi, numpy.pi)
+            obj_pose = openravepy.matrixFromAxisAngle([ 0., 0., yaw ])
+            obj_pose[0:3, 3] = [
+                table_aabb.pos()[0] + rng.uniform(-0.02, 0.02),
+                table_aabb.pos()[1] + table_aabb.extents()[1] * SCENES[scene_name]['offset']
+                    + rng.uniform(-0.02, 0.02),
+                table_aabb.pos()[2] + table_aabb.extents()[2] + .01,
+            ]
+            obj.SetTransform(obj_pose)
+            obj.Enable(True)
+
+    def RunTrial(self, scene_name, task_name, table, obj, seed):
+        """Run one trial of a task.
+        Exceptions other than PlanningError are logged and recorded as a
+        failed trial, with the exception type in \p error.
+        @return dictionary with the outcome, latency, path length, and the
+                planners that produced a solution
+        """
+        random.seed(seed)
+        numpy.random.seed(seed)
+        self.ResetScene(scene_name, table, obj, numpy.random.RandomState(seed))
+
+        setup_fns, task_fn = TASKS[task_name]
+        try:
+            for setup_fn in setup_fns:
+                setup_fn(self.robot, self.manip, obj, table)
+        except PlanningError as e:
+            logger.warning('Setup for %s in scene %s failed: %s',
+                           task_name, scene_name, str(e))
+            return { 'seed': seed, 'outcome': 'setup_failed' }
+        except Exception as e:
+            logger.exception('Setup for %s in scene %s raised an exception.',
+                             task_name, scene_name)
+            return { 'seed': seed, 'outcome': 'setup_failed',
+                     'error': type(e).__name__ }
+
+        statistics_before = self.robot.planner_statistics.GetAll()
+        planner = self.robot.planner
+        base_planner = self.robot.base_planner
+        self.robot.planner = RecordingPlanner(planner)
+        self.robot.base_planner = RecordingPlanner(base_planner)
+
+        error = None
+        start_time = time.time()
+        try:
+            task_fn(self.robot, self.manip, obj, table)
+            outcome = 'success'
+        except PlanningError as e:
+            logger.info('%s in scene %s failed: %s', task_name, scene_name, str(e))
+            outcome = 'failure'
+        except Exception as e:
+            logger.exception('%s in scene %s raised an exception.',
+                             task_name, scene_name)
+            outcome = 'failure'
+            error = type(e).__name__
+        finally:
+            duration = time.time() - start_time
+            trajectories = (self.robot.planner.trajectories
+                          + self.robot.base_planner.trajectories)
+            self.robot.planner = planner
+            self.robot.base_planner = base_planner
+
+        trial = {
+            'seed': seed,
+            'outcome': outcome,
+            'duration': duration,
+            'path_length': sum(GetPathLength(self.robot, traj)
+                               for traj in trajectories),
+            'planners': self._GetAttribution(statistics_before,
+                self.robot.planner_statistics.GetAll()),
+        }
+        if error is not None:
+            trial['error'] = error
+        return trial
+
+    def Run(self, scene_names=None, task_names=None, num_trials=10, seed=0):
+        """Run the benchmark.
+        @param scene_names scenes to run; defaults to all scenes
+        @param task_names tasks to run; defaults to all tasks of each scene
+        @param num_trials number of trials of each task
+        @param seed base random seed; trial i uses seed + i
+        @return dictionary of summaries indexed by scene and task
+        """
+        results = dict()
+
+        for scene_name in sorted(scene_names or SCENES.keys()):
+            table, obj = self.CreateScene(scene_name)
+            results[scene_name] = dict()
+
+            for task_name in SCENES[scene_name]['tasks']:
+                if task_names is not None and task_name not in task_names:
+                    continue
+
+                logger.info('Running %d trials of %s in scene %s.',
+                            num_trials, task_name, scene_name)
+                trials = [ self.RunTrial(scene_name, task_name, table, obj, seed + i)
+                           for i in xrange(num_trials) ]
+                results[scene_name][task_name] = Summarize(trials)
+
+        return results
+
+    def _GetAttribution(self, before, after):
+        attribution = dict()
+        for method, planners in after.iteritems():
+            for planner_name, entry in planners.iteritems():
+                previous = before.get(method, {}).get(planner_name, {})
+                successes = entry['successes'] - previous.get('successes', 0)
+                if successes > 0:
+                    attribution[planner_name] = attribution.get(planner_name, 0) + successes
+        return attribution
+
+
+def Summarize(trials):
+    """Summarize the trials of one task.
+    @param trials list of trial dictionaries returned by Benchmark.RunTrial
+    @return dictionary of summary statistics
+    """
+    attempted = [ trial for trial in trials if trial['outcome'] != 'setup_failed' ]
+    successes = [ trial for trial in attempted if trial['outcome'] == 'success' ]
+    durations = [ trial['duration'] for trial in attempted ]
+
+    attribution = dict()
+    for trial in successes:
+        for planner_name, count in trial['planners'].iteritems():
+            attribution[planner_name] = attribution.get(planner_name, 0) + count
+
+    summary = {
+        'trials': len(trials),
+        'setup_failures': len(trials) - len(attempted),
+        'successes': len(successes),
+        'success_rate': float(len(successes)) / len(attempted) if attempted else None,
+        'planners': attribution,
+        'raw': trials,
+    }
+
+    if durations:
+        summary['latency'] = dict(
+            ('p{:d}'.format(percentile), float(numpy.percentile(durations, percentile)))
+            for percentile in [ 50, 90, 99 ])
+    if successes:
+        summary['path_length'] = float(numpy.mean(
+            [ trial['path_length'] for trial in successes ]))
+
+    return summary
+
+
+def Compare(results, baseline, success_tolerance=0.1, latency_tolerance=0.25,
+            latency_floor=0.05):
+    """Find regressions relative to a baseline.
+    A task regresses if its success rate dropped by more than
+    \p success_tolerance or its median or 90th percentile latency increased
+    by more than \p latency_tolerance (relative) and \p latency_floor
+    (absolute, in seconds).
+    @param results benchmark results
+    @param baseline benchmark results to compare against
+    @return list of regression dictionaries
+    """
+    regressions = list()
+
+    for scene_name, tasks in results.iteritems():
+        for task_name, summary in tasks.iteritems():
+            reference = baseline.get(scene_name, {}).get(task_name)
+            if reference is None:
+                continue
+
+            if (summary['success_rate'] is not None
+                    and reference['success_rate'] is not None
+                    and summary['success_rate'] < reference['success_rate'] - success_tolerance):
+                regressions.append({
+                    'scene': scene_name,
+                    'task': task_name,
+                    'metric': 'success_rate',
+                    'baseline': reference['success_rate'],
+                    'value': summary['success_rate'],
+                })
+
+            for percentile in [ 'p50', 'p90' ]:
+                value = summary.get('latency', {}).get(percentile)
+                reference_value = reference.get('latency', {}).get(percentile)
+                if value is None or reference_value is None:
+                    continue
+
+                if (value > reference_value * (1. + latency_tolerance)
+                        and value - reference_value > latency_floor):
+                    regressions.append({
+                        'scene': scene_name,
+                        'task': task_name,
+                        'metric': 'latency_' + percentile,
+                        'baseline': reference_value,
+                        'value': value,
+                    })
+
+    return regressions
+
+
+def Load(path):
+    with open(path, 'r') as results_file:
+        return json.load(results_file)
+
+
+def Save(path, results):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
@@ -0,0 +1,324 @@
+import json, logging, numpy, os, tempfile
+import openravepy
+from prpy.planning.base import PlanningError
+from prpy.tsr.tsr import TSR, TSRChain
+from prpy.tsr.tsrlibrary import TSRLibrary
+from herbpy.tsr.sampling import GetTSRPoses
+
+logger = logging.getLogger('herbpy')
+
+# Grasp TSRs covered by the database by default, with their arguments.
+DEFAULT_ENTRIES = [
+    ('fuze_bottle', 'grasp', {}),
+    ('fuze_bottle', 'push_grasp', { 'push_distance': 0.1 }),
+    ('plastic_glass', 'grasp', {}),
+    ('plastic_glass', 'push_grasp', { 'push_distance': 0.1 }),
+    ('pop_tarts', 'grasp', {}),
+    ('pop_tarts', 'push_grasp', { 'push_distance': 0.1 }),
+    ('plastic_plate', 'grasp', {}),
+    ('plastic_bowl', 'grasp', {}),
+    ('rubbermaid_ice_guard_pitcher', 'grasp', {}),
+]
+
+# Object poses in the robot frame covered by the database: x, y, z, and yaw.
+DEFAULT_GRID_LOWER = numpy.array([ 0.2, -1.0, 0.4, -numpy.pi ])
+DEFAULT_GRID_UPPER = numpy.array([ 1.2,  1.0, 1.2,  numpy.pi ])
+DEFAULT_GRID_RESOLUTION = numpy.array([ 0.05, 0.05, 0.1, numpy.pi / 4 ])
+
+
+def GetObjectPose(robot, obj):
+    """Get the pose of an upright object in the robot frame.
+    @param robot robot
+    @param obj object
+    @return array of x, y, z, and yaw, or None if obj is not upright
+    """
+    with robot.GetEnv():
+        obj_in_robot = numpy.dot(numpy.linalg.inv(robot.GetTransform()),
+                                 obj.GetTransform())
+
+    if obj_in_robot[2, 2] < numpy.cos(0.1):
+        return None
+
+    yaw = numpy.arctan2(obj_in_robot[1, 0], obj_in_robot[0, 0])
+    return numpy.array([ obj_in_robot[0, 3], obj_in_robot[1, 3],
+                         obj_in_robot[2, 3], yaw ])
+
+
+def GetCoveringInterval(values, lower, upper, periodic):
+    """Get the smallest interval within [lower, upper] that contains values.
+    If the dimension is periodic, the interval may wrap around, in which case
+    its upper bound is greater than \p upper.
+    @param values array of values in [lower, upper]
+    @param lower lower bound of the dimension
+    @param upper upper bound of the dimension
+    @param periodic True if lower and upper are the same point
+    @return tuple of the bounds of the interval
+    """
+    values = numpy.sort(values)
+    if not periodic:
+        return values[0], values[-1]
+
+    # The complement of the largest gap between samples covers all of them.
+    gaps = numpy.diff(numpy.concatenate([ values, [ values[0] + upper - lower ] ]))
+    i = numpy.argmax(gaps)
+    start = values[(i + 1) % len(values)]
+    return start, start + (upper - lower) - gaps[i]
+
+
+class GraspDatabase(object):
+    def __init__(self, path=None):
+        """Precomputed IK feasibility of grasp TSRs.
+        For each object type, grasp TSR and manipulator, the database stores a
+        fixed set of samples from the TSR's bounds and, for each cell of a grid
+        of upright object poses in the robot frame, which of those samples
+        have a collision-free IK solution. The TSR is fixed relative to the
+        object, so this only depends on the pose of the object relative to the
+        robot. Cells are only checked against the robot and the object itself;
+        other obstacles may make more grasps infeasible at runtime.
+        @param path optional file used to persist the database
+        """
+        self.path = path
+        self._entries = dict()
+
+        if path is not None and os.path.exists(path):
+            self.Load()
+
+    @staticmethod
+    def GetKey(object_type, tsr_name, manip_name, tsr_args=None):
+        return json.dumps([ object_type, tsr_name, manip_name, tsr_args or {} ],
+                          sort_keys=True)
+
+    def Load(self):
+        """Load the database from \p path."""
+        with open(self.path, 'rb') as db_file:
+            data = numpy.load(db_file)
+            index = json.loads(str(data['index']))
+
+            self._entries = dict()
+            for i, metadata in enumerate(index):
+                entry = dict(metadata)
+                entry['samples'] = data['{:d}_samples'.format(i)]
+                entry['feasible'] = data['{:d}_feasible'.format(i)]
+                self._entries[metadata['key']] = entry
+
+        logger.info('Loaded %d grasp database entries from "%s".',
+                    len(self._entries), self.path)
+
+    def Save(self):
+        """Atomically write the database to \p path."""
+        index = list()
+        arrays = dict()
+
+        for i, (key, entry) in enumerate(sorted(self._entries.iteritems())):
+            index.append(dict((name, value) for name, value in entry.iteritems()
+                              if name not in [ 'samples', 'feasible' ]))
+            arrays['{:d}_samples'.format(i)] = entry['samples']
+            arrays['{:d}_feasible'.format(i)] = entry['feasible']
+        arrays['index'] = numpy.array(json.dumps(index))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as db_file:
+            numpy.savez_compressed(db_file, **arrays)
+        os.rename(temp_path, self.path)
+
+    def Build(self, robot, obj, manip, tsr_name, tsr_args=None,
+              num_samples=64, grid_lower=DEFAULT_GRID_LOWER,
+              grid_upper=DEFAULT_GRID_UPPER,
+              grid_resolution=DEFAULT_GRID_RESOLUTION, seed=0):
+        """Compute the IK feasibility of a grasp TSR and add it to the database.
+        The object is moved to the center of each grid cell, so the
+        environment should only contain the robot and the object.
+        @param robot robot
+        @param obj object of the type to precompute
+        @param manip manipulator to grasp with
+        @param tsr_name name of the grasp TSR, e.g. 'grasp'
+        @param tsr_args keyword arguments of the TSR factory
+        @param num_samples number of TSR samples checked in each cell
+        @param grid_lower lower bounds of the x, y, z, and yaw of the object
+        @param grid_upper upper bounds of the x, y, z, and yaw of the object
+        @param grid_resolution cell size of the grid
+        @param seed random seed for the TSR samples
+        @return fraction of feasible samples
+        """
+        env = robot.GetEnv()
+        tsr_args = tsr_args or {}
+        object_type = TSRLibrary.get_object_type(obj)
+        samples = numpy.random.RandomState(seed).uniform(size=(num_samples, 6))
+
+        with env:
+            tsr = self._GetTSR(robot, obj, manip, tsr_name, tsr_args)
+            Bw = numpy.array(tsr.Bw, dtype=float)
+
+        # The yaw of the object does not matter if the TSR allows any rotation
+        # around its z-axis and no horizontal translation; rotating the object
+        # only shifts the yaw of the samples.
+        grid_lower = numpy.array(grid_lower, dtype=float)
+        grid_upper = numpy.array(grid_upper, dtype=float)
+        grid_resolution = numpy.array(grid_resolution, dtype=float)
+        yaw_invariant = (Bw[5, 1] - Bw[5, 0] >= 2 * numpy.pi - 1e-6
+                         and not numpy.any(Bw[0:2, :]))
+        if yaw_invariant:
+            grid_resolution[3] = grid_upper[3] - grid_lower[3]
+
+        shape = numpy.maximum(1, numpy.round(
+            (grid_upper - grid_lower) / grid_resolution).astype(int))
+        num_cells = int(numpy.prod(shape))
+        feasible = numpy.zeros((num_cells, num_samples), dtype=bool)
+
+        logger.info('Building grasp database entry for %s "%s" with the %s'
+                    ' arm: %d cells of %d samples.', object_type, tsr_name,
+                    manip.GetName(), num_cells, num_samples)
+
+        ik_options = openravepy.IkFilterOptions.CheckEnvCollisions
+        with env:
+            robot_pose = robot.GetTransform()
+
+            with robot.CreateRobotStateSaver(), obj.CreateKinBodyStateSaver():
+                for cell in xrange(num_cells):
+                    index = numpy.array(numpy.unravel_index(cell, shape))
+                    x, y, z, yaw = grid_lower + (index + 0.5) * grid_resolution
+
+                    obj_in_robot = openravepy.matrixFromAxisAngle([ 0., 0., yaw ])
+                    obj_in_robot[0:3, 3] = [ x, y, z ]
+                    obj.SetTransform(numpy.dot(robot_pose, obj_in_robot))
+
+                    tsr = self._GetTSR(robot, obj, manip, tsr_name, tsr_args)
+                    poses = GetTSRPoses(tsr, Bw[:, 0] + samples * (Bw[:, 1] - Bw[:, 0]))
+                    for k, pose in enumerate(poses):
+                        feasible[cell, k] = manip.FindIKSolution(
+                            pose, ik_options) is not None
+
+        key = self.GetKey(object_type, tsr_name, manip.GetName(), tsr_args)
+        self._entries[key] = {
+            'key': key,
+            'grid_lower': grid_lower.tolist(),
+            'grid_resolution': grid_resolution.tolist(),
+            'shape': shape.tolist(),
+            'yaw_invariant': bool(yaw_invariant),
+            'samples': samples.astype(numpy.float32),
+            'feasible': numpy.packbits(feasible, axis=1),
+        }
+        return float(numpy.mean(feasible))
+
+    def GetFeasibleSamples(self, robot, obj, manip, tsr_name, tsr_args=None):
+        """Get the precomputed feasible samples of a grasp TSR.
+        The samples are the union over the object's cell and its neighbors,
+        to account for the discretization of the grid.
+        @param robot robot
+        @param obj object to grasp
+        @param manip manipulator to grasp with
+        @param tsr_name name of the grasp TSR
+        @param tsr_args keyword arguments of the TSR factory
+        @return (M,6) array of samples normalized to the bounds of the TSR,
+                or None if the database has no information for this query
+        """
+        try:
+            object_type = TSRLibrary.get_object_type(obj)
+        except ValueError:
+            return None
+
+        entry = self._entries.get(self.GetKey(
+            object_type, tsr_name, manip.GetName(), tsr_args))
+        if entry is None:
+            return None
+
+        obj_pose = GetObjectPose(robot, obj)
+        if obj_pose is None:
+            return None
+
+        grid_lower = numpy.array(entry['grid_lower'])
+        grid_resolution = numpy.array(entry['grid_resolution'])
+        shape = numpy.array(entry['shape'])
+
+        # Yaw wraps around; the other dimensions must be inside the grid.
+        obj_pose[3] = (obj_pose[3] - grid_lower[3]) % (2 * numpy.pi) + grid_lower[3]
+        index = numpy.floor((obj_pose - grid_lower) / grid_resolution).astype(int)
+        if numpy.any(index[0:3] < 0) or numpy.any(index[0:3] >= shape[0:3]):
+            return None
+        index[3] = min(index[3], shape[3] - 1)
+
+        num_samples = len(entry['samples'])
+        feasible = numpy.zeros(num_samples, dtype=bool)
+        for offset in numpy.ndindex(3, 3, 3, 3):
+            neighbor = index + numpy.array(offset) - 1
+            neighbor[3] %= shape[3]
+            if numpy.any(neighbor < 0) or numpy.any(neighbor >= shape):
+                continue
+
+            cell = numpy.ravel_multi_index(neighbor, shape)
+            feasible |= numpy.unpackbits(entry['feasible'][cell])[:num_samples].astype(bool)
+
+        samples = numpy.array(entry['samples'][feasible], dtype=float)
+        if entry['yaw_invariant']:
+            cell_yaw = grid_lower[3] + (index[3] + 0.5) * grid_resolution[3]
+            samples[:, 5] = (samples[:, 5] + (cell_yaw - obj_pose[3]) / (2 * numpy.pi)) % 1.
+        return samples
+
+    def PruneTSRList(self, robot, obj, manip, tsr_name, tsrlist, tsr_args=None):
+        """Restrict a grasp TSR to the region with feasible IK solutions.
+        The bounds of the TSR are shrunk to the smallest box that contains
+        the precomputed feasible samples, so TSR sampling does not waste IK
+        calls on grasps that are out of reach.
+        @param robot robot
+        @param obj object to grasp
+        @param manip manipulator to grasp with
+        @param tsr_name name of the TSR that tsrlist was created from
+        @param tsrlist list of TSRChains returned by the TSR library
+        @param tsr_args keyword arguments of the TSR factory
+        @return pruned list of TSRChains; tsrlist if the database has no
+                information for this query
+        @throws PlanningError if the database has no feasible grasp
+        """
+        if len(tsrlist) != 1 or len(tsrlist[0].TSRs) != 1:
+            return tsrlist
+
+        samples = self.GetFeasibleSamples(robot, obj, manip, tsr_name, tsr_args)
+        if samples is None:
+            return tsrlist
+        elif len(samples) == 0:
+            raise PlanningError('The grasp database has no feasible "{:s}"'
+                                ' grasp of {:s} with the {:s} arm.'.format(
+                                tsr_name, obj.GetName(), manip.GetName()))
+
+        chain = tsrlist[0]
+        tsr = chain.TSRs[0]
+        Bw = numpy.array(tsr.Bw, dtype=float)
+        values = Bw[:, 0] + samples * (Bw[:, 1] - Bw[:, 0])
+
+        pruned_Bw = Bw.copy()
+        for i in xrange(6):
+            if Bw[i, 1] <= Bw[i, 0]:
+                continue
+
+            periodic = (i >= 3 and Bw[i, 1] - Bw[i, 0] >= 2 * numpy.pi - 1e-6)
+            lower, upper = GetCoveringInterval(values[:, i], Bw[i, 0], Bw[i, 1], periodic)
+
+            # Pad the interval by the expected spacing between samples.
+            padding = (Bw[i, 1] - Bw[i, 0]) / len(samples)
+            pruned_Bw[i, 0] = lower - padding
+            pruned_Bw[i, 1] = upper + padding
+            if not periodic:
+                pruned_Bw[i, 0] = max(pruned_Bw[i, 0], Bw[i, 0])
+                pruned_Bw[i, 1] = min(pruned_Bw[i, 1], Bw[i, 1])
+            elif pruned_Bw[i, 1] - pruned_Bw[i, 0] >= Bw[i, 1] - Bw[i, 0]:
+                pruned_Bw[i, :] = Bw[i, :]
+
+        logger.debug('Grasp database pruned the "%s" TSR of %s from %s to %s.',
+                     tsr_name, obj.GetName(), Bw.tolist(), pruned_Bw.tolist())
+
+        pruned_tsr = TSR(T0_w=tsr.T0_w, Tw_e=tsr.Tw_e, Bw=pruned_Bw,
+                         manip=tsr.manipindex)
+        return [ TSRChain(sample_start=chain.sample_start,
+                          sample_goal=chain.sample_goal,
+                          constrain=chain.constrain, TSR=pruned_tsr) ]
+
+    def _GetTSR(self, robot, obj, manip, tsr_name, tsr_args):
+        tsrlist = robot.tsrlibrary(obj, tsr_name, manip=manip, **tsr_args)
+        if len(tsrlist) != 1 or len(tsrlist[0].TSRs) != 1:
+            raise ValueError('The grasp database only supports TSRs with one'
+                             ' chain of one TSR.')
+        return tsrlist[0].TSRs[0]
@@ -5,27 +5,45 @@ from herbbase import HerbBase
 logger = logging.getLogger('herbpy')
 
 def initialize(robot_xml=None, env_path=None, attach_viewer=False,
-               sim=True, **kw_args):
-    import prpy, os
-
-    prpy.logger.initialize_logging()
-
-    # Hide TrajOpt logging.
-    os.environ.setdefault('TRAJOPT_LOG_THRESH', 'WARN')
+               sim=True, profile=False, profile_path=None,
+               model_cache_dir=None, **kw_args):
+    """Create an OpenRAVE environment that contains HERB.
+    The time and memory spent in each phase of startup is recorded in
+    \p robot.startup_profile as a StartupProfiler.
+    @param robot_xml robot XML file; defaults to herb_description
+    @param env_path optional environment XML file to load
+    @param attach_viewer viewer to attach; True tries or_rviz then qtcoin
+    @param sim simulate all of HERB's components
+    @param profile log the startup profile
+    @param profile_path optional output path for cProfile statistics
+    @param model_cache_dir optional directory used to cache HERB's model;
+           defaults to the HERBPY_MODEL_CACHE environment variable
+    @return tuple of environment and robot
+    """
+    from profiler import StartupProfiler
+
+    if model_cache_dir is None:
+        model_cache_dir = os.environ.get('HERBPY_MODEL_CACHE')
+
+    profiler = StartupProfiler(profile_path=profile_path)
+    with profiler:
+        env, robot = _initialize(profiler, robot_xml=robot_xml,
+                                 env_path=env_path,
+                                 attach_viewer=attach_viewer, sim=sim,
+                                 model_cache_dir=model_cache_dir, **kw_args)
+
+    robot.startup_profile = profiler
+    if profile:
+        profiler.log()
 
-    # Load plugins.
-    if prpy.dependency_manager.is_catkin():
-        prpy.dependency_manager.export()
-    else:
-        prpy.dependency_manager.export(PACKAGE)
-    openravepy.RaveInitialize(True)
-
-    # Create the environment.
-    env = openravepy.Environment()
-    if env_path is not None:
-        if not env.Load(env_path):
-            raise Exception('Unable to load environment frompath %s' % env_path)
+    return env, robot
 
+def _find_model(robot_xml):
+    """Resolve the files HERB's model is loaded from.
+    @param robot_xml robot XML file; ignored when using Catkin
+    @return list of the URDF and SRDF paths when using Catkin, otherwise a
+            list that contains the robot XML path
+    """
     if prpy.dependency_manager.is_catkin():
         # Find the HERB URDF and SRDF files.
         from catkin.find_in_workspaces import find_in_workspaces
@@ -36,18 +54,32 @@ def initialize(robot_xml=None, env_path=None, attach_viewer=False,
                          ' package herb_description installed?')
             raise ValueError('Unable to find HERB model.')
 
-        found_models = False
         for share_directory in share_directories:
-            urdf_path = os.path.join(share_directories[0], 'robots', 'herb.urdf')
-            srdf_path = os.path.join(share_directories[0], 'robots', 'herb.srdf')
+            urdf_path = os.path.join(share_directory, 'robots', 'herb.urdf')
+            srdf_path = os.path.join(share_directory, 'robots', 'herb.srdf')
             if os.path.exists(urdf_path) and os.path.exists(srdf_path):
-                found_models = True
-                break
+                return [ os.path.abspath(urdf_path), os.path.abspath(srdf_path) ]
+
+        logger.error('Missing URDF file and/or SRDF file for HERB.'
+                     ' Is the herb_description package properly installed?')
+        raise ValueError('Unable to find HERB URDF and SRDF files.')
+    else:
+        if robot_xml is None:
+            import rospkg
+            rospack = rospkg.RosPack()
+            base_path = rospack.get_path('herb_description')
+            robot_xml = os.path.join(base_path, 'ordata', 'robots', 'herb.robot.xml')
 
-        if not found_models:
-            logger.error('Missing URDF file and/or SRDF file for HERB.'
-                         ' Is the herb_description package properly installed?')
-            raise ValueError('Unable to find HERB URDF and SRDF files.')
+        return [ os.path.abspath(robot_xml) ]
+
+def _load_model(env, sources):
+    """Load HERB's model from herb_description.
+    @param env environment to load HERB into
+    @param sources files returned by _find_model
+    @return robot
+    """
+    if prpy.dependency_manager.is_catkin():
+        urdf_path, srdf_path = sources
 
         # Load the URDF file into OpenRAVE.
         urdf_module = openravepy.RaveCreateModule(env, 'urdf')
@@ -66,15 +98,56 @@ def initialize(robot_xml=None, env_path=None, attach_viewer=False,
             raise ValueError('Unable to find robot with name "{:s}".'.format(
                              herb_name))
     else:
-        if robot_xml is None:
-            import os, rospkg
-            rospack = rospkg.RosPack()
-            base_path = rospack.get_path('herb_description')
-            robot_xml = os.path.join(base_path, 'ordata', 'robots', 'herb.robot.xml')
-
-        robot = env.ReadRobotXMLFile(robot_xml)
+        robot = env.ReadRobotXMLFile(sources[0])
         env.Add(robot)
 
+    return robot
+
+def _initialize(profiler, robot_xml, env_path, attach_viewer, sim,
+                model_cache_dir, **kw_args):
+    import prpy, os
+
+    prpy.logger.initialize_logging()
+
+    # Hide TrajOpt logging.
+    os.environ.setdefault('TRAJOPT_LOG_THRESH', 'WARN')
+
+    # Load plugins.
+    with profiler.phase('export_plugins'):
+        if prpy.dependency_manager.is_catkin():
+            prpy.dependency_manager.export()
+        else:
+            prpy.dependency_manager.export(PACKAGE)
+
+    with profiler.phase('rave_initialize'):
+        openravepy.RaveInitialize(True)
+
+    # Create the environment.
+    with profiler.phase('create_environment'):
+        env = openravepy.Environment()
+        if env_path is not None:
+            if not env.Load(env_path):
+                raise Exception('Unable to load environment frompath %s' % env_path)
+
+    # Load HERB, optionally from the model cache.
+    with profiler.phase('load_robot'):
+        # Key the cache on the resolved files, so switching to another
+        # herb_description overlay does not load a stale model.
+        sources = _find_model(robot_xml)
+        cache_key = ' '.join(sources)
+
+        robot = None
+        if model_cache_dir is not None:
+            from modelcache import ModelCache
+            model_cache = ModelCache(model_cache_dir)
+            robot = model_cache.Load(env, cache_key)
+
+        if robot is None:
+            robot = _load_model(env, sources)
+
+            if model_cache_dir is not None:
+                model_cache.Save(robot, cache_key, sources)
+
     # Default arguments.
     keys = [ 'left_arm_sim', 'left_hand_sim', 'left_ft_sim',
              'right_arm_sim', 'right_hand_sim', 'right_ft_sim',
@@ -84,30 +157,32 @@ def initialize(robot_xml=None, env_path=None, attach_viewer=False,
             kw_args[key] = sim
 
     from herbrobot import HERBRobot
-    prpy.bind_subclass(robot, HERBRobot, **kw_args)
+    with profiler.phase('bind_subclass'):
+        prpy.bind_subclass(robot, HERBRobot, profiler=profiler, **kw_args)
 
     if sim:
         dof_indices, dof_values \
             = robot.configurations.get_configuration('relaxed_home')
         robot.SetDOFValues(dof_values, dof_indices)
 
-    # Start by attempting to load or_rviz.
-    if attach_viewer == True:
-        attach_viewer = 'rviz'
-        env.SetViewer(attach_viewer)
-
-        # Fall back on qtcoin if loading or_rviz failed
-        if env.GetViewer() is None:
-            logger.warning(
-                'Loading the RViz viewer failed. Do you have or_interactive'
-                ' marker installed? Falling back on qtcoin.')
-            attach_viewer = 'qtcoin'
-
-    if attach_viewer and env.GetViewer() is None:
-        env.SetViewer(attach_viewer)
-        if env.GetViewer() is None:
-            raise Exception('Failed creating viewer of type "{0:s}".'.format(
-                            attach_viewer))
+    with profiler.phase('attach_viewer'):
+        # Start by attempting to load or_rviz.
+        if attach_viewer == True:
+            attach_viewer = 'rviz'
+            env.SetViewer(attach_viewer)
+
+            # Fall back on qtcoin if loading or_rviz failed
+            if env.GetViewer() is None:
+                logger.warning(
+                    'Loading the RViz viewer failed. Do you have or_interactive'
+                    ' marker installed? Falling back on qtcoin.')
+                attach_viewer = 'qtcoin'
+
+        if attach_viewer and env.GetViewer() is None:
+            env.SetViewer(attach_viewer)
+            if env.GetViewer() is None:
+                raise Exception('Failed creating viewer of type "{0:s}".'.format(
+                                attach_viewer))
 
     # Remove the ROS logging handler again. It might have been added when we
     # loaded or_rviz.
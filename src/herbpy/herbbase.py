@@ -166,3 +166,84 @@ class HerbBase(MobileBase):
         des_angle = numpy.arctan2(direction[1], direction[0])
         self.Rotate(des_angle - cur_angle)
         self.Drive(distance)
+
+    def FindBasePoses(self, tsrlist, manip=None, num_samples=200,
+                      max_poses=10, xy_resolution=0.05,
+                      yaw_resolution=numpy.pi / 16, check_collision=True):
+        """
+        Find base poses from which a TSR is reachable. This samples
+        end-effector poses from the TSR and uses the robot's inverse
+        reachability map to vote for the base poses that reach them. Base
+        poses are ranked by the number of end-effector samples they reach.
+        @param tsrlist list of TSRChains, e.g. from robot.tsrlibrary
+        @param manip manipulator that should reach the TSR; defaults to the
+                     active manipulator
+        @param num_samples number of end-effector poses to sample
+        @param max_poses maximum number of base poses to return
+        @param xy_resolution position resolution of the base poses
+        @param yaw_resolution orientation resolution of the base poses
+        @param check_collision discard base poses where the robot, in its
+                               current configuration, is in collision
+        @return list of base poses for PlanToBasePose, best first
+        """
+        from prpy.exceptions import PrPyException
+        from prpy.planning.base import PlanningError
+        from herbpy.tsr.sampling import SampleTSRChains
+
+        robot = self.robot
+        env = robot.GetEnv()
+        reachability_map = getattr(robot, 'reachability_map', None)
+
+        with env:
+            if manip is None:
+                manip = robot.GetActiveManipulator()
+            robot_pose = robot.GetTransform()
+
+        if reachability_map is None or not reachability_map.HasManipulator(manip):
+            raise PrPyException('There is no inverse reachability map for the'
+                                ' {:s} arm.'.format(manip.GetName()))
+
+        ee_poses, _ = SampleTSRChains(tsrlist, num_samples)
+        base_poses, ee_indices = reachability_map.GetBasePoses(
+            manip, ee_poses, base_height=robot_pose[2, 3])
+
+        # Vote for cells of base poses. Each end-effector sample counts once
+        # per cell, so the score is the number of samples a cell reaches.
+        cells = dict()
+        keys = numpy.column_stack([
+            numpy.floor(base_poses[:, 0:2] / xy_resolution),
+            numpy.floor(numpy.mod(base_poses[:, 2], 2 * numpy.pi) / yaw_resolution),
+        ]).astype(int)
+        for key, base_pose, ee_index in zip(map(tuple, keys), base_poses, ee_indices):
+            cell = cells.setdefault(key, { 'ee_indices': set(), 'poses': list() })
+            cell['ee_indices'].add(ee_index)
+            cell['poses'].append(base_pose)
+
+        ranked_cells = sorted(cells.itervalues(),
+                              key=lambda cell: len(cell['ee_indices']),
+                              reverse=True)
+
+        result = list()
+        with env:
+            with robot.CreateRobotStateSaver():
+                for cell in ranked_cells:
+                    poses = numpy.array(cell['poses'])
+                    yaw = numpy.arctan2(numpy.mean(numpy.sin(poses[:, 2])),
+                                        numpy.mean(numpy.cos(poses[:, 2])))
+                    base_pose = openravepy.matrixFromAxisAngle([ 0., 0., yaw ])
+                    base_pose[0:2, 3] = numpy.mean(poses[:, 0:2], axis=0)
+                    base_pose[2, 3] = robot_pose[2, 3]
+
+                    if check_collision:
+                        robot.SetTransform(base_pose)
+                        if env.CheckCollision(robot):
+                            continue
+
+                    result.append(base_pose)
+                    if len(result) >= max_poses:
+                        break
+
+        if not result:
+            raise PlanningError('Failed finding a base pose from which the TSR'
+                                ' is reachable.')
+        return result
@@ -1,15 +1,28 @@
 import logging, numpy, openravepy, rospy
 import prpy
 from prpy.base.wam import WAM
+from kinematics import LookAtIK
 
 class HERBPantilt(WAM):
     def __init__(self, sim, owd_namespace):
-        # FIXME: We don't build the IK database because ikfast fails with a
-        # compilation error on the pantilt. This should actually be LookAt3D.
+        # We don't build the IK database because ikfast fails with a
+        # compilation error on the pantilt. Lookat3D IK is solved in closed
+        # form by GetLookAtIK instead.
         WAM.__init__(self, sim, owd_namespace, iktype=None)
+        self._lookat_ik = None
 
     def CloneBindings(self, parent):
         WAM.CloneBindings(self, parent)
+        self._lookat_ik = None
+
+    def GetLookAtIK(self):
+        """Get the closed-form Lookat3D IK solver of the head.
+        The solver is built the first time it is needed.
+        @return LookAtIK
+        """
+        if self._lookat_ik is None:
+            self._lookat_ik = LookAtIK(self.GetRobot(), self)
+        return self._lookat_ik
 
     def FollowHand(self, traj, manipulator):
         """Modify a trajectory to make the head follow an end-effector.
@@ -32,22 +45,27 @@ class HERBPantilt(WAM):
         # may be no IK solution at some waypoints.
         head_path = list()
         head_path.append(robot.GetDOFValues(head_indices))
-        last_ik_index = 0
+        final_ik_index = 0
 
         with robot.GetEnv():
             with robot:
+                hand_positions = list()
                 for i in xrange(1, traj.GetNumWaypoints()):
                     traj_waypoint = traj.GetWaypoint(i)
                     arm_dof_values = traj_config_spec.ExtractJointValues(traj_waypoint, robot, arm_indices)
                     # Compute the position of the right arm through the FK.
                     manipulator.SetDOFValues(arm_dof_values)
-                    hand_pose = manipulator.GetEndEffectorTransform()
-
-                    # This will be None if there is no IK solution.
-                    head_dof_values = self.FindIK(hand_pose[0:3, 3])
+                    hand_positions.append(manipulator.GetEndEffectorTransform()[0:3, 3])
+
+        # Solve the IK of all waypoints at once. This will be None if there is
+        # no IK solution.
+        if hand_positions:
+            for i, head_dof_values in enumerate(self.FindIKSolutions(hand_positions)):
+                if numpy.any(numpy.isnan(head_dof_values)):
+                    head_path.append(None)
+                else:
                     head_path.append(head_dof_values)
-                    if head_dof_values is not None:
-                        final_ik_index = i
+                    final_ik_index = i + 1
 
         # Propagate the last successful IK solution to all following waypoints.
         # This lets us avoid some edge cases during interpolation.
@@ -116,8 +134,25 @@ class HERBPantilt(WAM):
     def FindIK(self, target):
         """Find an IK solution that is looking at a desired position.
         @param target target position
-        @return IK solution
+        @return IK solution or None if there is no solution
         """
-        ik_params = openravepy.IkParameterization(target, openravepy.IkParameterization.Type.Lookat3D)
-        return self.ikmodel.manip.FindIKSolution(ik_params, 0)
+        dof_values = self.FindIKSolutions([ target ])[0]
+        if numpy.any(numpy.isnan(dof_values)):
+            return None
+        return dof_values
+
+    def FindIKSolutions(self, targets):
+        """Find IK solutions that are looking at many positions at once.
+        This uses the closed-form solution of GetLookAtIK and returns
+        the solution within the joint limits that is closest to the current
+        configuration of the head.
+        @param targets (N,3) array of target positions
+        @return (N,2) array of IK solutions; rows without a solution are NaN
+        """
+        robot = self.GetRobot()
+        lookat_ik = self.GetLookAtIK()
+        with robot.GetEnv():
+            base_pose = self.GetBase().GetTransform()
+            current_values = self.GetDOFValues()
+        return lookat_ik.Solve(targets, base_pose, current_values)
 
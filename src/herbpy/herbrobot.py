@@ -1,5 +1,6 @@
 PACKAGE = 'herbpy'
 import logging
+import os
 import openravepy
 import prpy
 import prpy.rave, prpy.util
@@ -25,8 +26,15 @@ def try_and_warn(fn, exception_type, message, default_value=None):
 class HERBRobot(Robot):
     def __init__(self, left_arm_sim, right_arm_sim, right_ft_sim,
                        left_hand_sim, right_hand_sim, left_ft_sim,
-                       head_sim, talker_sim, segway_sim):
+                       head_sim, talker_sim, segway_sim, profiler=None,
+                       planning_mode='sequence', cache_plans=False,
+                       planner_statistics_path=None, grasp_database_path=None,
+                       reachability_map_path=None):
         from prpy.util import FindCatkinResource
+        from herbpy.profiler import NullProfiler
+
+        if profiler is None:
+            profiler = NullProfiler()
 
         Robot.__init__(self, robot_name='herb')
 
@@ -41,14 +49,15 @@ class HERBRobot(Robot):
         self.manipulators = [ self.left_arm, self.right_arm, self.head ]
 
         # Dynamically switch to self-specific subclasses.
-        prpy.bind_subclass(self.left_arm, WAM, sim=left_arm_sim, owd_namespace='/left/owd')
-        prpy.bind_subclass(self.right_arm, WAM, sim=right_arm_sim, owd_namespace='/right/owd')
-        prpy.bind_subclass(self.head, HERBPantilt, sim=head_sim, owd_namespace='/head/owd')
-        prpy.bind_subclass(self.left_arm.hand, BarrettHand, sim=left_hand_sim, manipulator=self.left_arm,
-                           owd_namespace='/left/owd', bhd_namespace='/left/bhd', ft_sim=right_ft_sim)
-        prpy.bind_subclass(self.right_arm.hand, BarrettHand, sim=right_hand_sim, manipulator=self.right_arm,
-                           owd_namespace='/right/owd', bhd_namespace='/right/bhd', ft_sim=right_ft_sim)
-        self.base = HerbBase(sim=segway_sim, robot=self)
+        with profiler.phase('bind_manipulators'):
+            prpy.bind_subclass(self.left_arm, WAM, sim=left_arm_sim, owd_namespace='/left/owd')
+            prpy.bind_subclass(self.right_arm, WAM, sim=right_arm_sim, owd_namespace='/right/owd')
+            prpy.bind_subclass(self.head, HERBPantilt, sim=head_sim, owd_namespace='/head/owd')
+            prpy.bind_subclass(self.left_arm.hand, BarrettHand, sim=left_hand_sim, manipulator=self.left_arm,
+                               owd_namespace='/left/owd', bhd_namespace='/left/bhd', ft_sim=right_ft_sim)
+            prpy.bind_subclass(self.right_arm.hand, BarrettHand, sim=right_hand_sim, manipulator=self.right_arm,
+                               owd_namespace='/right/owd', bhd_namespace='/right/bhd', ft_sim=right_ft_sim)
+            self.base = HerbBase(sim=segway_sim, robot=self)
 
         # Set HERB's acceleration limits. These are not specified in URDF.
         accel_limits = self.GetDOFAccelerationLimits()
@@ -58,124 +67,253 @@ class HERBRobot(Robot):
         self.SetDOFAccelerationLimits(accel_limits)
         
         # Support for named configurations.
-        import os.path
-        self.configurations.add_group('left_arm', self.left_arm.GetArmIndices())
-        self.configurations.add_group('right_arm', self.right_arm.GetArmIndices())
-        self.configurations.add_group('head', self.head.GetArmIndices())
-        self.configurations.add_group('left_hand', self.left_hand.GetIndices())
-        self.configurations.add_group('right_hand', self.right_hand.GetIndices())
-
-        configurations_path = FindCatkinResource('herbpy', 'config/configurations.yaml')
-        
-        try:
-            self.configurations.load_yaml(configurations_path)
-        except IOError as e:
-            raise ValueError('Failed laoding named configurations from "{:s}".'.format(
-                configurations_path))
+        with profiler.phase('load_configurations'):
+            import os.path
+            self.configurations.add_group('left_arm', self.left_arm.GetArmIndices())
+            self.configurations.add_group('right_arm', self.right_arm.GetArmIndices())
+            self.configurations.add_group('head', self.head.GetArmIndices())
+            self.configurations.add_group('left_hand', self.left_hand.GetIndices())
+            self.configurations.add_group('right_hand', self.right_hand.GetIndices())
+
+            configurations_path = FindCatkinResource('herbpy', 'config/configurations.yaml')
+
+            try:
+                self.configurations.load_yaml(configurations_path)
+            except IOError as e:
+                raise ValueError('Failed laoding named configurations from "{:s}".'.format(
+                    configurations_path))
 
         # Initialize a default planning pipeline.
-        from prpy.planning import (
-            FirstSupported,
-            MethodMask,
-            Ranked,
-            Sequence,
-        )
-        from prpy.planning import (
-            CBiRRTPlanner,
-            CHOMPPlanner,
-            GreedyIKPlanner,
-            IKPlanner,
-            NamedPlanner,
-            SBPLPlanner,
-            SnapPlanner,
-            TSRPlanner,
-            VectorFieldPlanner
-        )
+        with profiler.phase('create_planners'):
+            from prpy.planning import (
+                FirstSupported,
+                MethodMask,
+                Ranked,
+                Sequence,
+            )
+            from prpy.planning import (
+                CBiRRTPlanner,
+                GreedyIKPlanner,
+                IKPlanner,
+                NamedPlanner,
+                SnapPlanner,
+                TSRPlanner,
+                VectorFieldPlanner
+            )
+
+            from herbpy.planning import (
+                AdaptiveSequence,
+                BudgetedSequence,
+                CachedPlanner,
+                LazyPlanner,
+                PlannerStatistics,
+                Race,
+            )
+
+            # TODO: These should be meta-planners.
+            self.named_planner = NamedPlanner()
+            self.ik_planner = IKPlanner()
+
+            # Most planners create their own environment when they are
+            # constructed, so we defer creating them until they are first used.
+
+            # Special-purpose planners.
+            self.snap_planner = LazyPlanner(SnapPlanner)
+            self.vectorfield_planner = LazyPlanner(VectorFieldPlanner)
+            self.greedyik_planner = LazyPlanner(GreedyIKPlanner)
+
+            # General-purpose planners.
+            self.cbirrt_planner = LazyPlanner(CBiRRTPlanner)
 
-        # TODO: These should be meta-planners.
-        self.named_planner = NamedPlanner()
-        self.ik_planner = IKPlanner()
+            # Trajectory optimizer.
+            self.trajopt_planner = LazyPlanner(self._CreateTrajoptPlanner,
+                                               name='TrajoptPlanner')
+            self.chomp_planner = LazyPlanner(self._CreateCHOMPPlanner,
+                                             name='CHOMPPlanner')
+            self.optimizer_planner = LazyPlanner(self._CreateOptimizerPlanner,
+                                                 name='OptimizerPlanner')
 
-        # Special-purpose planners.
-        self.snap_planner = SnapPlanner()
-        self.vectorfield_planner = VectorFieldPlanner()
-        self.greedyik_planner = GreedyIKPlanner()
+            # Every meta-planner records the outcome of its delegates.
+            if planner_statistics_path is None:
+                planner_statistics_path = os.environ.get(
+                    'HERBPY_PLANNER_STATISTICS', os.path.expanduser(
+                        '~/.ros/herbpy/planner_statistics.json'))
+            self.planner_statistics = PlannerStatistics(planner_statistics_path)
 
-        # General-purpose planners.
-        self.cbirrt_planner = CBiRRTPlanner()
+            self.sequence_planner = BudgetedSequence(
+                # First, try the straight-line trajectory.
+                self.snap_planner,
+                # Then, try a few simple (and fast!) heuristics.
+                self.vectorfield_planner,
+                self.greedyik_planner,
+                # Next, try a trajectory optimizer.
+                self.optimizer_planner,
+                # Give the optimizer most of the time if there is a deadline.
+                weights=[ 1., 1., 1., 3. ],
+                statistics=self.planner_statistics
+            )
+            # Alternatively, run the same planners concurrently.
+            self.race_planner = Race(
+                self.snap_planner,
+                self.vectorfield_planner,
+                self.greedyik_planner,
+                self.optimizer_planner,
+                statistics=self.planner_statistics
+            )
+            # Or try them in the order that has worked best in the past.
+            self.adaptive_planner = AdaptiveSequence(
+                self.snap_planner,
+                self.vectorfield_planner,
+                self.greedyik_planner,
+                self.optimizer_planner,
+                statistics=self.planner_statistics
+            )
+            self.planner = self.CreatePlanner(planning_mode)
+            if cache_plans:
+                self.planner = CachedPlanner(self.planner)
 
-        # Trajectory optimizer.
+            from prpy.planning.retimer import HauserParabolicSmoother
+            self.smoother = HauserParabolicSmoother()
+            # TODO: This should not be HauserParabolicSmoother because it changes the path. This is a temporary
+            # hack because the ParabolicTrajectoryRetimer doesn't work on HERB.
+            self.retimer = HauserParabolicSmoother()
+            self.simplifier = None
+
+            # Base planning
+            self.sbpl_planner = LazyPlanner(self._CreateSBPLPlanner,
+                                            name='SBPLPlanner')
+            self.base_planner = self.sbpl_planner
+            if cache_plans:
+                self.base_planner = CachedPlanner(self.base_planner)
+
+        # Create action library
+        with profiler.phase('load_actions'):
+            from prpy.action import ActionLibrary
+            self.actions = ActionLibrary()
+
+            # Register default actions and TSRs
+            import herbpy.action
+            import herbpy.tsr
+
+            # Reuse the TSRs of objects that have not moved.
+            from herbpy.tsr.cache import CachedTSRLibrary
+            self.tsrlibrary = CachedTSRLibrary(self.tsrlibrary)
+
+            # Precomputed grasp feasibility, built by build_grasp_database.py.
+            from herbpy.graspdb import GraspDatabase
+            if grasp_database_path is None:
+                grasp_database_path = os.environ.get(
+                    'HERBPY_GRASP_DATABASE', os.path.expanduser(
+                        '~/.ros/herbpy/grasp_database.npz'))
+            if os.path.exists(grasp_database_path):
+                self.grasp_database = GraspDatabase(grasp_database_path)
+            else:
+                self.grasp_database = None
+
+            # Base placement, built by build_reachability_map.py.
+            from herbpy.reachability import InverseReachabilityMap
+            if reachability_map_path is None:
+                reachability_map_path = os.environ.get(
+                    'HERBPY_REACHABILITY_MAP', os.path.expanduser(
+                        '~/.ros/herbpy/reachability_map.npz'))
+            if os.path.exists(reachability_map_path):
+                self.reachability_map = InverseReachabilityMap(reachability_map_path)
+            else:
+                self.reachability_map = None
+
+            # Reject TSR samples outside the workspace of the arm before IK.
+            from herbpy.workspace import WorkspaceFilter
+            if self.reachability_map is not None:
+                self.workspace_filter = WorkspaceFilter(
+                    self.reachability_map.GetWorkspaceGrids())
+            else:
+                self.workspace_filter = None
+
+        # Setting necessary sim flags
+        self.talker_simulated = talker_sim
+        self.segway_sim = segway_sim
+
+    def CreatePlanner(self, mode='sequence'):
+        """Create HERB's default planning pipeline.
+        The pipeline first tries a set of fast planners, then samples goals
+        from TSRs, and finally falls back on CBiRRT. The mode determines how
+        the fast planners are combined: 'sequence' tries them one at a time,
+        'race' runs them concurrently and uses the first solution, and
+        'adaptive' orders them using statistics from previous calls.
+
+        Planning methods accept an optional \p deadline keyword argument, an
+        absolute time as returned by time.time(). The pipeline splits the
+        remaining time between its stages and either returns before the
+        deadline or raises a DeadlinePlanningError.
+        @param mode how to combine the fast planners
+        @return planner
+        """
+        from prpy.planning import FirstSupported, NamedPlanner, TSRPlanner
+        from herbpy.planning import BudgetedSequence, WorkspaceFilteredPlanner
+
+        if mode == 'sequence':
+            actual_planner = self.sequence_planner
+        elif mode == 'race':
+            actual_planner = self.race_planner
+        elif mode == 'adaptive':
+            actual_planner = self.adaptive_planner
+        else:
+            raise ValueError('Unknown planning mode "{:s}".'.format(mode))
+
+        return FirstSupported(
+            BudgetedSequence(actual_planner, 
+                             WorkspaceFilteredPlanner(
+                                 TSRPlanner(delegate_planner=actual_planner)),
+                             self.cbirrt_planner,
+                             weights=[ 1., 2., 2. ],
+                             statistics=self.planner_statistics),
+            # Special purpose meta-planner.
+            NamedPlanner(delegate_planner=actual_planner),
+        )
+
+    def _CreateTrajoptPlanner(self):
         try:
             from or_trajopt import TrajoptPlanner
 
-            self.trajopt_planner = TrajoptPlanner()
+            return TrajoptPlanner()
         except ImportError:
-            self.trajopt_planner = None
             logger.warning('Failed creating TrajoptPlanner. Is the or_trajopt'
                            ' package in your workspace and built?')
+            return None
+
+    def _CreateCHOMPPlanner(self):
+        from prpy.planning import CHOMPPlanner
 
         try:
-            self.chomp_planner = CHOMPPlanner()
+            return CHOMPPlanner()
         except UnsupportedPlanningError:
-            self.chomp_planner = None
             logger.warning('Failed loading the CHOMP module. Is the or_cdchomp'
                            ' package in your workspace and built?')
+            return None
 
-        if not (self.trajopt_planner or self.chomp_planner):
+    def _CreateOptimizerPlanner(self):
+        planner = self.trajopt_planner.planner or self.chomp_planner.planner
+        if planner is None:
             raise PrPyException('Unable to load both CHOMP and TrajOpt. At'
                                 ' least one of these packages is required.')
-        
-        actual_planner = Sequence(
-            # First, try the straight-line trajectory.
-            self.snap_planner,
-            # Then, try a few simple (and fast!) heuristics.
-            self.vectorfield_planner,
-            self.greedyik_planner,
-            # Next, try a trajectory optimizer.
-            self.trajopt_planner or self.chomp_planner
-        )
-        self.planner = FirstSupported(
-            Sequence(actual_planner, 
-                     TSRPlanner(delegate_planner=actual_planner),
-                     self.cbirrt_planner),
-            # Special purpose meta-planner.
-            NamedPlanner(delegate_planner=actual_planner),
-        )
-        
-        from prpy.planning.retimer import HauserParabolicSmoother
-        self.smoother = HauserParabolicSmoother()
-        # TODO: This should not be HauserParabolicSmoother because it changes the path. This is a temporary
-        # hack because the ParabolicTrajectoryRetimer doesn't work on HERB.
-        self.retimer = HauserParabolicSmoother()
-        self.simplifier = None
-
-        # Base planning
+        return planner
+
+    def _CreateSBPLPlanner(self):
+        from prpy.planning import SBPLPlanner
         from prpy.util import FindCatkinResource
         planner_parameters_path = FindCatkinResource('herbpy', 'config/base_planner_parameters.yaml')
 
-        self.sbpl_planner = SBPLPlanner()
+        sbpl_planner = SBPLPlanner()
         try:
             with open(planner_parameters_path, 'rb') as config_file:
                 import yaml
                 params_yaml = yaml.load(config_file)
-            self.sbpl_planner.SetPlannerParameters(params_yaml)
+            sbpl_planner.SetPlannerParameters(params_yaml)
         except IOError as e:
             raise ValueError('Failed loading base planner parameters from "{:s}".'.format(
                 planner_parameters_path))
 
-        self.base_planner = self.sbpl_planner
-
-        # Create action library
-        from prpy.action import ActionLibrary
-        self.actions = ActionLibrary()
-
-        # Register default actions and TSRs
-        import herbpy.action
-        import herbpy.tsr
-
-        # Setting necessary sim flags
-        self.talker_simulated = talker_sim
-        self.segway_sim = segway_sim
+        return sbpl_planner
 
     def CloneBindings(self, parent):
         from prpy import Cloned
@@ -190,6 +328,10 @@ class HERBRobot(Robot):
         self.manipulators = [ self.left_arm, self.right_arm, self.head ]
         self.planner = parent.planner
         self.base_planner = parent.base_planner
+        self.planner_statistics = parent.planner_statistics
+        self.grasp_database = parent.grasp_database
+        self.reachability_map = parent.reachability_map
+        self.workspace_filter = parent.workspace_filter
 
     def SetStiffness(self, stiffness):
         """Set the stiffness of HERB's arms and head.
@@ -0,0 +1,183 @@
+import numpy
+
+
+def GetRotations(axes, angles):
+    """Compute rotation matrices from axes and angles (Rodrigues' formula).
+    @param axes (3,) unit axis or (N,3) array of unit axes
+    @param angles (N,) array of angles
+    @return (N,3,3) array of rotation matrices
+    """
+    angles = numpy.asarray(angles, dtype=float)
+    axes = numpy.asarray(axes, dtype=float) * numpy.ones((len(angles), 1))
+
+    K = numpy.zeros((len(angles), 3, 3))
+    K[:, 0, 1] = -axes[:, 2]
+    K[:, 0, 2] =  axes[:, 1]
+    K[:, 1, 0] =  axes[:, 2]
+    K[:, 1, 2] = -axes[:, 0]
+    K[:, 2, 0] = -axes[:, 1]
+    K[:, 2, 1] =  axes[:, 0]
+
+    s = numpy.sin(angles)[:, numpy.newaxis, numpy.newaxis]
+    c = numpy.cos(angles)[:, numpy.newaxis, numpy.newaxis]
+    return numpy.eye(3) + s * K + (1. - c) * numpy.einsum('nij,njk->nik', K, K)
+
+
+def GetEndEffectorTransforms(robot, manip, dof_values):
+    """Compute the end-effector poses of many arm configurations at once.
+    This uses the product of exponentials formula with the current
+    configuration of the robot as the reference: the axis and anchor of
+    each joint are read once, and every configuration rotates the links
+    after a joint around that joint's axis. The arm must be a serial chain
+    of revolute joints, which is true for HERB's WAMs.
+    @param robot robot
+    @param manip manipulator
+    @param dof_values (N,D) array of values of manip.GetArmIndices()
+    @return (N,4,4) array of end-effector poses in the world frame
+    """
+    dof_values = numpy.atleast_2d(numpy.asarray(dof_values, dtype=float))
+    num_configs = len(dof_values)
+
+    with robot.GetEnv():
+        dof_indices = manip.GetArmIndices()
+        reference_values = robot.GetDOFValues(dof_indices)
+        joints = [ robot.GetJointFromDOFIndex(index) for index in dof_indices ]
+        axes = [ joint.GetAxis(0) for joint in joints ]
+        anchors = [ joint.GetAnchor() for joint in joints ]
+        reference_pose = manip.GetEndEffectorTransform()
+
+    rotations = numpy.tile(numpy.eye(3), (num_configs, 1, 1))
+    translations = numpy.zeros((num_configs, 3))
+
+    # Compose exp(xi_1 q_1) ... exp(xi_n q_n) from the base to the tip.
+    for i, (axis, anchor) in enumerate(zip(axes, anchors)):
+        joint_rotations = GetRotations(axis, dof_values[:, i] - reference_values[i])
+        joint_translations = anchor - numpy.dot(joint_rotations, anchor)
+
+        translations = translations + numpy.einsum(
+            'nij,nj->ni', rotations, joint_translations)
+        rotations = numpy.einsum('nij,njk->nik', rotations, joint_rotations)
+
+    poses = numpy.zeros((num_configs, 4, 4))
+    poses[:, 0:3, 0:3] = numpy.dot(rotations, reference_pose[0:3, 0:3])
+    poses[:, 0:3, 3] = numpy.dot(rotations, reference_pose[0:3, 3]) + translations
+    poses[:, 3, 3] = 1.
+    return poses
+
+
+class LookAtIK(object):
+    def __init__(self, robot, manip, tolerance=1e-3):
+        """Closed-form Lookat3D IK of a pan-tilt manipulator.
+        The kinematics are read once in the frame of the base link of the
+        manipulator, from the current configuration. The first joint pans
+        and the second joint tilts. The viewing direction of the
+        manipulator must be perpendicular to the tilt axis, which is true
+        for HERB's head up to the rounding of the angles in its URDF; the
+        angle between a solution and its target is at most about the
+        cosine of the angle between them.
+        @param robot robot
+        @param manip manipulator with two revolute joints
+        @param tolerance maximum cosine of the angle between the viewing
+                         direction and the tilt axis
+        """
+        with robot.GetEnv():
+            dof_indices = manip.GetArmIndices()
+            if len(dof_indices) != 2:
+                raise ValueError('Look-at IK needs a manipulator with two joints;'
+                                 ' {:s} has {:d}.'.format(manip.GetName(),
+                                                          len(dof_indices)))
+
+            world_in_base = numpy.linalg.inv(manip.GetBase().GetTransform())
+            self.reference_values = robot.GetDOFValues(dof_indices)
+            self.lower, self.upper = robot.GetDOFLimits(dof_indices)
+            joints = [ robot.GetJointFromDOFIndex(index) for index in dof_indices ]
+            axes = [ joint.GetAxis(0) for joint in joints ]
+            anchors = [ joint.GetAnchor() for joint in joints ]
+            ee_pose = manip.GetEndEffectorTransform()
+            direction = numpy.dot(ee_pose[0:3, 0:3], manip.GetLocalToolDirection())
+
+        rotation, translation = world_in_base[0:3, 0:3], world_in_base[0:3, 3]
+        self.pan_axis, self.tilt_axis = [ numpy.dot(rotation, axis) for axis in axes ]
+        self.pan_anchor, self.tilt_anchor = [ numpy.dot(rotation, anchor) + translation
+                                              for anchor in anchors ]
+        self.origin = numpy.dot(rotation, ee_pose[0:3, 3]) + translation
+        self.direction = numpy.dot(rotation, direction)
+        self.direction /= numpy.linalg.norm(self.direction)
+
+        cos_angle = numpy.dot(self.tilt_axis, self.direction)
+        if abs(cos_angle) > tolerance:
+            raise ValueError('The viewing direction of {:s} is not perpendicular'
+                             ' to its tilt axis; the cosine of their angle is'
+                             ' {:g}.'.format(manip.GetName(), cos_angle))
+
+    def Solve(self, targets, base_pose, current_values=None):
+        """Find joint values that look at many targets at once.
+        Each target has up to two solutions; the one within the joint limits
+        that is closest to \p current_values is returned.
+        @param targets (N,3) array of points in the world frame
+        @param base_pose pose of the base link of the manipulator
+        @param current_values configuration to stay close to; defaults to the
+                              configuration the kinematics were read in
+        @return (N,2) array of joint values; rows without a solution are NaN
+        """
+        targets = numpy.atleast_2d(numpy.asarray(targets, dtype=float))
+        if current_values is None:
+            current_values = self.reference_values
+
+        world_in_base = numpy.linalg.inv(base_pose)
+        targets = numpy.dot(targets, world_in_base[0:3, 0:3].T) + world_in_base[0:3, 3]
+
+        a1, a2 = self.pan_axis, self.tilt_axis
+        p1, p2 = self.pan_anchor, self.tilt_anchor
+        offset = self.origin - p2
+
+        # Panning by q1 must put the target in the plane of the viewing ray
+        # that is swept by tilting: A cos(q1) + B sin(q1) = C.
+        v = targets - p1
+        A = numpy.dot(v, a2 - numpy.dot(a1, a2) * a1)
+        B = numpy.dot(v, numpy.cross(a1, a2))
+        C = numpy.dot(a2, self.origin - p1) - numpy.dot(a1, a2) * numpy.dot(v, a1)
+        radius = numpy.sqrt(A**2 + B**2)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            half_width = numpy.arccos(C / radius)
+
+        best = numpy.empty((len(targets), 2))
+        best.fill(numpy.nan)
+        best_distance = numpy.empty(len(targets))
+        best_distance.fill(numpy.inf)
+
+        for sign in (1., -1.):
+            pan = numpy.arctan2(B, A) + sign * half_width
+            valid = numpy.isfinite(pan)
+            pan = numpy.where(valid, pan, 0.)
+
+            # Undo the pan and find the tilt that rotates the ray through the
+            # target; both preserve the distance to the tilt axis.
+            u = numpy.einsum('nji,nj->ni', GetRotations(a1, pan), v) + p1 - p2
+            along = numpy.dot(offset, self.direction)
+            discriminant = along**2 - numpy.dot(offset, offset) + numpy.sum(u**2, axis=1)
+            valid &= discriminant >= 0.
+            distance = -along + numpy.sqrt(numpy.maximum(discriminant, 0.))
+            valid &= distance > 0.
+
+            w = offset + distance[:, numpy.newaxis] * self.direction
+            tilt = numpy.arctan2(numpy.dot(numpy.cross(w, u), a2),
+                                 numpy.sum(w * u, axis=1) - numpy.dot(w, a2) * numpy.dot(u, a2))
+
+            values = self.reference_values + numpy.column_stack([ pan, tilt ])
+            values, in_limits = self._WrapToLimits(values)
+            valid &= in_limits
+
+            distance_to_current = numpy.sum(numpy.abs(values - current_values), axis=1)
+            better = valid & (distance_to_current < best_distance)
+            best[better] = values[better]
+            best_distance[better] = distance_to_current[better]
+
+        return best
+
+    def _WrapToLimits(self, values):
+        # Shift each angle by a multiple of 2 pi to its smallest value above
+        # the lower limit.
+        turns = numpy.ceil((self.lower - values) / (2 * numpy.pi))
+        values = values + 2 * numpy.pi * turns
+        return values, numpy.all(values <= self.upper, axis=1)
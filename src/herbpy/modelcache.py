@@ -0,0 +1,112 @@
+import hashlib, json, logging, os, tempfile
+import openravepy
+
+logger = logging.getLogger('herbpy')
+
+
+class ModelCache(object):
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, cache_dir):
+        """Cache of HERB's robot model serialized as a COLLADA file.
+        Each entry stores the resolved paths of the files the model was loaded
+        from along with their modification times and sizes. An entry is only
+        used if all of its source files are unchanged. Note that only the top
+        level files are checked; meshes referenced by the model are not.
+        @param cache_dir directory that contains the cache
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+
+    def Load(self, env, key):
+        """Load a cached model into an environment.
+        @param env environment to load the model into
+        @param key name of the cache entry, e.g. the robot XML path
+        @return robot, or None if there is no valid cache entry
+        """
+        entry = self._ReadIndex().get(key)
+        if entry is None:
+            logger.debug('Model cache has no entry for "%s".', key)
+            return None
+
+        if entry['fingerprint'] != self._GetFingerprint(entry['sources']):
+            logger.info('Model cache entry for "%s" is out of date.', key)
+            return None
+
+        model_path = os.path.join(self.cache_dir, entry['model'])
+        if not env.Load(model_path):
+            logger.warning('Failed loading cached model "%s".', model_path)
+            return None
+
+        robot = env.GetRobot(entry['robot_name'])
+        if robot is None:
+            logger.warning('Cached model "%s" does not contain robot "%s".',
+                           model_path, entry['robot_name'])
+        return robot
+
+    def Save(self, robot, key, sources):
+        """Serialize a robot and add it to the cache.
+        @param robot robot to serialize
+        @param key name of the cache entry, e.g. the robot XML path
+        @param sources list of paths the robot was loaded from
+        @return True if the entry was written
+        """
+        sources = [ os.path.abspath(path) for path in sources ]
+        fingerprint = self._GetFingerprint(sources)
+        model_name = '{:s}.dae'.format(
+            hashlib.sha1(json.dumps([ key, fingerprint ])).hexdigest())
+        model_path = os.path.join(self.cache_dir, model_name)
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        try:
+            env = robot.GetEnv()
+            with env:
+                env.Save(model_path, openravepy.Environment.SelectionOptions.Body,
+                         { 'target': robot.GetName() })
+        except openravepy.openrave_exception as e:
+            logger.warning('Failed saving model to cache "%s": %s',
+                           model_path, str(e))
+            return False
+
+        index = self._ReadIndex()
+        index[key] = {
+            'model': model_name,
+            'robot_name': robot.GetName(),
+            'sources': sources,
+            'fingerprint': fingerprint,
+        }
+        self._WriteIndex(index)
+
+        logger.info('Saved model for "%s" to cache "%s".', key, model_path)
+        return True
+
+    def _GetFingerprint(self, sources):
+        fingerprint = [ openravepy.__version__ ]
+        for path in sources:
+            try:
+                stat = os.stat(path)
+                fingerprint.append([ path, stat.st_mtime, stat.st_size ])
+            except OSError:
+                fingerprint.append([ path, None, None ])
+        return fingerprint
+
+    def _ReadIndex(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_NAME)
+        try:
+            with open(index_path, 'r') as index_file:
+                return json.load(index_file)
+        except IOError:
+            return dict()
+        except ValueError:
+            logger.warning('Ignoring corrupt model cache index "%s".',
+                           index_path)
+            return dict()
+
+    def _WriteIndex(self, index):
+        # Write to a temporary file first so concurrent readers never see a
+        # partially written index.
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as index_file:
+            json.dump(index, index_file)
+        os.rename(temp_path, os.path.join(self.cache_dir, self.INDEX_NAME))
@@ -0,0 +1,9 @@
+from adaptive import AdaptiveSequence
+from budget import (BudgetedSequence, Deadline, DeadlinePlanningError, GetDeadline,
+                    PlanningTimeoutError)
+from cache import CachedPlanner
+from lazy import LazyPlanner, TIME_LIMIT_ARGUMENTS
+from race import Race
+from statistics import (GetPlannerName, GetTopLevelMethod, IsLeafPlanner,
+                        PlannerStatistics, TopLevelMethod)
+from workspace import WorkspaceFilteredPlanner
@@ -0,0 +1,125 @@
+import logging, random, time
+from prpy.planning.base import MetaPlanner, MetaPlanningError, PlanningError
+from budget import Deadline
+from statistics import GetPlannerName, PlannerStatistics, TopLevelMethod
+
+logger = logging.getLogger('herbpy')
+
+
+class AdaptiveSequence(MetaPlanner):
+    def __init__(self, *planners, **kw_args):
+        """Sequence that orders its delegates using past performance.
+        If planner i succeeds with probability p_i and takes c_i seconds per
+        attempt, the expected time to find a solution is minimized by trying
+        the planners in increasing order of c_i / p_i. Both are estimated
+        from recorded statistics with a Laplace prior. Planners that were
+        attempted at least \p min_attempts times with a recorded success
+        rate below \p min_success_rate are skipped, except with probability
+        \p exploration so their statistics can recover. Statistics are kept
+        per top-level method, e.g. a PlanToTSR call that reaches this
+        sequence as PlanToConfiguration uses the statistics of PlanToTSR.
+        The planners are tried until a \p deadline keyword argument, or that
+        of the Deadline context, passes; it is only passed on to delegates
+        that support deadlines.
+        @param planners delegate planners, in their default order
+        @param statistics PlannerStatistics; defaults to an in-memory store
+        @param min_attempts attempts required before a planner is skipped
+        @param min_success_rate success rate below which a planner is skipped
+        @param exploration probability of trying a skipped planner anyway
+        @param prior_time assumed duration of a planner with no statistics
+        """
+        MetaPlanner.__init__(self)
+        self._planners = planners
+        self.statistics = kw_args.get('statistics') or PlannerStatistics()
+        self.min_attempts = kw_args.get('min_attempts', 20)
+        self.min_success_rate = kw_args.get('min_success_rate', 0.02)
+        self.exploration = kw_args.get('exploration', 0.05)
+        self.prior_time = kw_args.get('prior_time', 1.0)
+
+    def __str__(self):
+        return 'AdaptiveSequence({:s})'.format(', '.join(map(str, self._planners)))
+
+    def GetExpectedCost(self, method, planner):
+        """Estimate the time per success of a planner.
+        @return tuple of the success rate, time per attempt, and their ratio
+        """
+        entry = self.statistics.Get(method, GetPlannerName(planner))
+        attempts = entry['attempts']
+        success_rate = (entry['successes'] + 1.) / (attempts + 2.)
+        attempt_time = (entry['total_time'] + self.prior_time) / (attempts + 1.)
+        return success_rate, attempt_time, attempt_time / success_rate
+
+    def GetOrder(self, method, top_method=None):
+        """Get the planners that will be tried for a method, in order.
+        @param method planning method name
+        @param top_method method whose statistics are used; defaults to
+                          \p method
+        @return list of planners
+        """
+        if top_method is None:
+            top_method = method
+
+        candidates = list()
+        for index, planner in enumerate(self._planners):
+            if not planner.has_planning_method(method):
+                continue
+
+            # The prior would keep a planner that never succeeded above the
+            # threshold for many attempts, so skip on the recorded rate.
+            entry = self.statistics.Get(top_method, GetPlannerName(planner))
+            attempts = entry['attempts']
+            _, _, cost = self.GetExpectedCost(top_method, planner)
+
+            if (attempts > 0 and attempts >= self.min_attempts
+                    and float(entry['successes']) / attempts < self.min_success_rate
+                    and random.random() >= self.exploration):
+                logger.debug('AdaptiveSequence - Skipping planner "%s" for %s;'
+                             ' success rate is %.3f.', str(planner), method,
+                             float(entry['successes']) / attempts)
+                continue
+
+            candidates.append((cost, index, planner))
+
+        # Never skip every planner.
+        if not candidates:
+            return [ planner for planner in self._planners
+                     if planner.has_planning_method(method) ]
+
+        return [ planner for _, _, planner in sorted(candidates) ]
+
+    def plan(self, method, args, kw_args):
+        with TopLevelMethod(method) as top_method:
+            with Deadline(kw_args.pop('deadline', None)) as deadline:
+                return self._Plan(method, top_method, deadline, args, kw_args)
+
+    def _Plan(self, method, top_method, deadline, args, kw_args):
+        errors = dict()
+
+        for planner in self.GetOrder(method, top_method):
+            if deadline is not None and time.time() >= deadline:
+                logger.info('AdaptiveSequence - The deadline passed; skipping'
+                            ' the remaining planners.')
+                break
+
+            planner_name = GetPlannerName(planner)
+            start_time = time.time()
+
+            try:
+                logger.info('AdaptiveSequence - Calling planner "%s".', str(planner))
+                planner_method = getattr(planner, method)
+                planner_kw_args = dict(kw_args, defer=False)
+                if deadline is not None and getattr(planner, 'supports_deadline', False):
+                    planner_kw_args['deadline'] = deadline
+                traj = planner_method(*args, **planner_kw_args)
+            except PlanningError as e:
+                logger.warning('Planner %s returned %s', planner, e)
+                self.statistics.Record(top_method, planner_name, False,
+                                       time.time() - start_time)
+                errors[planner] = e
+                continue
+
+            self.statistics.Record(top_method, planner_name, True,
+                                   time.time() - start_time)
+            return traj
+
+        raise MetaPlanningError(method, errors)
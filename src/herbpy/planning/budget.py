@@ -0,0 +1,231 @@
+import logging, threading, time
+from contextlib import contextmanager
+from prpy.planning.base import MetaPlanner, MetaPlanningError, PlanningError
+from statistics import GetPlannerName, IsLeafPlanner, TopLevelMethod
+
+logger = logging.getLogger('herbpy')
+
+# Deadline of the planning calls of each thread; see Deadline.
+_deadline_context = threading.local()
+
+
+def GetDeadline():
+    """Get the deadline that applies to the planning calls of this thread.
+    @return absolute time, or None if there is no deadline
+    """
+    return getattr(_deadline_context, 'deadline', None)
+
+
+@contextmanager
+def Deadline(deadline):
+    """Apply a deadline to the planning calls made in this context.
+    Planners that do not forward keyword arguments, e.g. TSRPlanner, drop a
+    \p deadline keyword argument before calling their delegate, so HERB's
+    meta-planners also read the deadline from this context. Nested contexts
+    keep the earlier deadline. Threads do not inherit the context; enter it
+    again with the yielded deadline.
+    @param deadline absolute time, or None
+    @return context manager that yields the deadline of the context
+    """
+    outer_deadline = GetDeadline()
+    if deadline is None or (outer_deadline is not None and outer_deadline < deadline):
+        deadline = outer_deadline
+
+    _deadline_context.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _deadline_context.deadline = outer_deadline
+
+
+class PlanningTimeoutError(PlanningError):
+    pass
+
+
+class DeadlinePlanningError(MetaPlanningError):
+    def __init__(self, method, errors, timings):
+        """A BudgetedSequence failed to find a solution before its deadline.
+        @param method planning method name
+        @param errors dictionary from planner to its error
+        @param timings list of (planner, budget, elapsed, outcome) tuples
+        """
+        lines = [ '{:s} failed before its deadline:'.format(method) ]
+        for planner, budget, elapsed, outcome in timings:
+            lines.append('  {:s}: {:s} after {:.3f} s of {:.3f} s'.format(
+                str(planner), outcome, elapsed, budget))
+
+        MetaPlanningError.__init__(self, '\n'.join(lines), errors)
+        self.timings = timings
+
+
+class BudgetedSequence(MetaPlanner):
+    supports_deadline = True
+
+    def __init__(self, *planners, **kw_args):
+        """Sequence that splits a deadline into per-delegate time budgets.
+        Without a deadline, this behaves exactly like Sequence. If the caller
+        passes a \p deadline keyword argument, an absolute time as returned by
+        time.time(), each delegate receives a share of the remaining time in
+        proportion to its weight; time left unused by a delegate is passed on
+        to the ones after it. Delegates that support deadlines receive their
+        own deadline; leaf planners turn it into their time limit, see
+        LazyPlanner. As a last resort, other delegates are run in a
+        background thread and abandoned if they exceed their budget; the
+        meta-planners nested in them still read the deadline from the
+        Deadline context. Delegates often share planners and their
+        environments, so the next delegate, or the next call, is not started
+        while an abandoned delegate is running. The sequence either returns
+        before the deadline or raises a DeadlinePlanningError with a timing
+        breakdown.
+        @param planners delegate planners
+        @param weights relative time budget of each planner; default equal
+        @param statistics optional PlannerStatistics that records the outcome
+                          of each call to a delegate that is not a
+                          meta-planner
+        @param max_wait maximum time a call without a deadline waits for an
+                        abandoned delegate before it gives up
+        """
+        MetaPlanner.__init__(self)
+        self._planners = planners
+        self.weights = kw_args.get('weights') or [ 1. ] * len(planners)
+        self.statistics = kw_args.get('statistics')
+        self.max_wait = kw_args.get('max_wait', 10.)
+        self._lock = threading.Lock()
+        self._abandoned = list()
+
+        if len(self.weights) != len(planners):
+            raise ValueError('There must be one weight per planner.')
+
+    def __str__(self):
+        return 'BudgetedSequence({:s})'.format(', '.join(map(str, self._planners)))
+
+    def plan(self, method, args, kw_args):
+        with TopLevelMethod(method) as top_method:
+            with Deadline(kw_args.pop('deadline', None)) as deadline:
+                return self._Plan(method, top_method, deadline, args, kw_args)
+
+    def _Plan(self, method, top_method, deadline, args, kw_args):
+        kw_args['defer'] = False
+
+        candidates = [ (planner, weight) for planner, weight
+                       in zip(self._planners, self.weights)
+                       if planner.has_planning_method(method) ]
+        errors = dict()
+        timings = list()
+
+        for i, (planner, weight) in enumerate(candidates):
+            planner_method = getattr(planner, method)
+
+            if not self._WaitForAbandoned(deadline):
+                logger.warning('BudgetedSequence - Skipping the remaining planners;'
+                               ' an abandoned planner is still running.')
+                break
+
+            if deadline is None:
+                start_time = time.time()
+                try:
+                    logger.info('BudgetedSequence - Calling planner "%s".', str(planner))
+                    traj = planner_method(*args, **kw_args)
+                except PlanningError as e:
+                    logger.warning('Planner %s returned %s', planner, e)
+                    self._Record(top_method, planner, False, start_time)
+                    errors[planner] = e
+                    continue
+
+                self._Record(top_method, planner, True, start_time)
+                return traj
+
+            start_time = time.time()
+            remaining_time = deadline - start_time
+            if remaining_time <= 0.:
+                break
+
+            # The last delegate gets exactly the caller's deadline.
+            remaining_weight = sum(w for _, w in candidates[i:])
+            budget = remaining_time * weight / remaining_weight
+            budget_deadline = min(start_time + budget, deadline)
+
+            logger.info('BudgetedSequence - Calling planner "%s" with a budget'
+                        ' of %.3f s.', str(planner), budget)
+            try:
+                traj = self._CallWithBudget(planner, planner_method, args,
+                                            kw_args, budget_deadline, top_method)
+            except PlanningError as e:
+                logger.warning('Planner %s returned %s', planner, e)
+                self._Record(top_method, planner, False, start_time)
+                errors[planner] = e
+                outcome = 'timed out' if isinstance(e, PlanningTimeoutError) else 'failed'
+                timings.append((planner, budget, time.time() - start_time, outcome))
+                continue
+
+            self._Record(top_method, planner, True, start_time)
+            return traj
+
+        if deadline is None:
+            raise MetaPlanningError(method, errors)
+
+        for planner, _ in candidates[len(timings):]:
+            timings.append((planner, 0., 0., 'skipped'))
+        raise DeadlinePlanningError(method, errors, timings)
+
+    def _WaitForAbandoned(self, deadline):
+        """Wait for delegates that exceeded their budget to finish.
+        @param deadline absolute time to stop waiting; None waits for at
+                        most \p max_wait
+        @return True if no abandoned delegate is still running
+        """
+        with self._lock:
+            threads = list(self._abandoned)
+
+        if deadline is None:
+            deadline = time.time() + self.max_wait
+
+        for thread in threads:
+            if thread.is_alive():
+                logger.info('BudgetedSequence - Waiting for abandoned planner'
+                            ' thread "%s" to finish.', thread.name)
+            thread.join(max(deadline - time.time(), 0.))
+
+        with self._lock:
+            self._abandoned = [ thread for thread in self._abandoned
+                                if thread.is_alive() ]
+            return not self._abandoned
+
+    def _Record(self, method, planner, success, start_time):
+        if self.statistics is not None and IsLeafPlanner(planner):
+            self.statistics.Record(method, GetPlannerName(planner), success,
+                                   time.time() - start_time)
+
+    def _CallWithBudget(self, planner, planner_method, args, kw_args, deadline,
+                        top_method):
+        planner_kw_args = dict(kw_args)
+
+        if getattr(planner, 'supports_deadline', False):
+            planner_kw_args['deadline'] = deadline
+            with Deadline(deadline):
+                return planner_method(*args, **planner_kw_args)
+
+        result = dict()
+
+        def run_planner():
+            try:
+                with TopLevelMethod(top_method), Deadline(deadline):
+                    result['traj'] = planner_method(*args, **planner_kw_args)
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=run_planner,
+                                  name='BudgetedSequence-{:s}'.format(str(planner)))
+        thread.daemon = True
+        thread.start()
+        thread.join(max(deadline - time.time(), 0.))
+
+        if thread.is_alive():
+            logger.warning('Planner %s exceeded its budget; abandoning it.', planner)
+            with self._lock:
+                self._abandoned.append(thread)
+            raise PlanningTimeoutError('Exceeded the time budget.')
+        elif 'error' in result:
+            raise result['error']
+        else:
+            return result['traj']
@@ -0,0 +1,251 @@
+import collections, hashlib, logging, numpy, threading
+import openravepy
+from prpy.planning.base import MetaPlanner
+from prpy.tsr.tsr import TSR, TSRChain
+from prpy.util import CopyTrajectory
+
+logger = logging.getLogger('herbpy')
+
+# Keyword arguments that do not change the result of a planning query.
+IGNORED_KW_ARGS = frozenset([ 'deadline', 'defer', 'execute', 'executor' ])
+
+
+class UncacheableError(Exception):
+    pass
+
+
+def Fingerprint(value, resolution):
+    """Convert a planning argument to a hashable, quantized value.
+    Floating point values are rounded to a multiple of \p resolution so that
+    nearly identical queries map to the same key.
+    @param value argument to fingerprint
+    @param resolution quantization resolution
+    @return hashable fingerprint
+    @throws UncacheableError if the value cannot be fingerprinted
+    """
+    if value is None or isinstance(value, (bool, int, long, basestring)):
+        return value
+    elif isinstance(value, float):
+        return int(round(value / resolution))
+    elif isinstance(value, numpy.ndarray):
+        if value.dtype.kind in 'iub':
+            return (value.shape, tuple(value.flat))
+        else:
+            quantized = numpy.round(value / resolution).astype(int)
+            return (value.shape, tuple(quantized.flat))
+    elif isinstance(value, (list, tuple)):
+        return tuple(Fingerprint(element, resolution) for element in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((key, Fingerprint(element, resolution))
+                            for key, element in value.iteritems()))
+    elif isinstance(value, TSRChain):
+        return ('TSRChain', value.sample_start, value.sample_goal,
+                value.constrain, Fingerprint(value.TSRs, resolution))
+    elif isinstance(value, TSR):
+        return ('TSR', value.manipindex, value.bodyandlink,
+                Fingerprint(value.T0_w, resolution),
+                Fingerprint(value.Tw_e, resolution),
+                Fingerprint(value.Bw, resolution))
+    elif isinstance(value, openravepy.Robot.Manipulator):
+        return ('Manipulator', value.GetName())
+    elif isinstance(value, openravepy.KinBody):
+        return ('KinBody', value.GetName())
+    else:
+        raise UncacheableError('Unable to fingerprint {:s}.'.format(
+                               type(value).__name__))
+
+
+def GetSceneFingerprint(robot, resolution):
+    """Fingerprint the poses and geometry of all bodies in the environment.
+    @param robot robot that is planning
+    @param resolution quantization resolution for poses
+    @return hashable fingerprint
+    """
+    env = robot.GetEnv()
+    fingerprint = list()
+
+    with env:
+        for body in env.GetBodies():
+            fingerprint.append((
+                body.GetName(),
+                body.GetKinematicsGeometryHash(),
+                body.IsEnabled(),
+                Fingerprint(body.GetTransform(), resolution),
+                Fingerprint(body.GetDOFValues(), resolution),
+            ))
+
+        fingerprint.append(tuple(sorted(
+            body.GetName() for body in robot.GetGrabbed())))
+
+    return tuple(sorted(fingerprint))
+
+
+def GetTrajectoryDOFIndices(traj):
+    """Get the DOF indices in a trajectory's joint_values group.
+    @param traj trajectory
+    @return list of DOF indices
+    """
+    for group in traj.GetConfigurationSpecification().GetGroups():
+        tokens = group.name.split()
+        if tokens and tokens[0] == 'joint_values':
+            return [ int(index) for index in tokens[2:] ]
+    return []
+
+
+class CachedPlanner(MetaPlanner):
+    def __init__(self, planner, max_entries=128, max_bytes=64 * 1024 * 1024,
+                 resolution=1e-3, validate=True):
+        """LRU cache of trajectories in front of another planner.
+        The cache key combines the planning method, the quantized start
+        configuration and pose of the robot, the quantized goal arguments, and
+        a fingerprint of the poses and geometry of every body in the scene.
+        Queries with arguments that cannot be fingerprinted, e.g. a custom
+        ranker, bypass the cache. On a hit, the waypoints of the cached
+        trajectory are checked for collision before it is returned.
+        @param planner delegate planner
+        @param max_entries maximum number of cached trajectories
+        @param max_bytes approximate memory budget for cached waypoints
+        @param resolution quantization resolution in radians and meters
+        @param validate collision check cached trajectories on a hit
+        """
+        MetaPlanner.__init__(self)
+        self._planners = [ planner ]
+        self.planner = planner
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self.validate = validate
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._num_bytes = 0
+        self.ResetStatistics()
+
+    def __str__(self):
+        return 'CachedPlanner({:s})'.format(str(self.planner))
+
+    def ResetStatistics(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.uncacheable = 0
+
+    def GetStatistics(self):
+        """Get the cache counters.
+        @return dictionary of counters
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'uncacheable': self.uncacheable,
+                'entries': len(self._entries),
+                'bytes': self._num_bytes,
+            }
+
+    def Clear(self):
+        """Remove all cached trajectories."""
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+
+    def plan(self, method, args, kw_args):
+        robot = args[0]
+
+        try:
+            key = self._GetKey(method, robot, args[1:], kw_args)
+        except UncacheableError as e:
+            logger.debug('Not caching %s: %s', method, str(e))
+            with self._lock:
+                self.uncacheable += 1
+            return getattr(self.planner, method)(*args, **kw_args)
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+
+        if entry is not None:
+            traj = CopyTrajectory(entry[0], env=robot.GetEnv())
+            if not self.validate or self._Validate(robot, traj):
+                logger.debug('Plan cache hit for %s.', method)
+                with self._lock:
+                    self.hits += 1
+                return traj
+
+            logger.debug('Cached %s trajectory is in collision.', method)
+            with self._lock:
+                self.invalidations += 1
+                self._Remove(key)
+        else:
+            with self._lock:
+                self.misses += 1
+
+        traj = getattr(self.planner, method)(*args, **kw_args)
+        self._Insert(key, traj)
+        return traj
+
+    def _GetKey(self, method, robot, args, kw_args):
+        with robot.GetEnv():
+            start = (
+                Fingerprint(robot.GetActiveDOFIndices(), self.resolution),
+                Fingerprint(robot.GetDOFValues(), self.resolution),
+                Fingerprint(robot.GetTransform(), self.resolution),
+            )
+
+        goal = (
+            Fingerprint(args, self.resolution),
+            Fingerprint(dict((key, value) for key, value in kw_args.iteritems()
+                             if key not in IGNORED_KW_ARGS), self.resolution),
+        )
+        scene = GetSceneFingerprint(robot, self.resolution)
+
+        return hashlib.sha1(repr((method, start, goal, scene))).hexdigest()
+
+    def _Validate(self, robot, traj):
+        env = robot.GetEnv()
+        cspec = traj.GetConfigurationSpecification()
+        dof_indices = GetTrajectoryDOFIndices(traj)
+
+        with env:
+            with robot.CreateRobotStateSaver():
+                for i in xrange(traj.GetNumWaypoints()):
+                    waypoint = traj.GetWaypoint(i)
+
+                    transform = cspec.ExtractTransform(robot.GetTransform(),
+                                                       waypoint, robot)
+                    if transform is not None:
+                        robot.SetTransform(transform)
+                    if dof_indices:
+                        robot.SetDOFValues(cspec.ExtractJointValues(
+                            waypoint, robot, dof_indices), dof_indices)
+
+                    if env.CheckCollision(robot) or robot.CheckSelfCollision():
+                        return False
+        return True
+
+    def _Insert(self, key, traj):
+        cspec = traj.GetConfigurationSpecification()
+        num_bytes = 8 * traj.GetNumWaypoints() * cspec.GetDOF()
+
+        if num_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            self._Remove(key)
+            self._entries[key] = (CopyTrajectory(traj), num_bytes)
+            self._num_bytes += num_bytes
+
+            while (len(self._entries) > self.max_entries
+                    or self._num_bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._Remove(oldest_key)
+                self.evictions += 1
+
+    def _Remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._num_bytes -= entry[1]
@@ -0,0 +1,113 @@
+import logging, threading, time
+from prpy.planning.base import MetaPlanner, PlanningError
+
+logger = logging.getLogger('herbpy')
+
+# Keyword argument that bounds the planning time of each type of planner.
+TIME_LIMIT_ARGUMENTS = {
+    'CBiRRTPlanner': 'timelimit',
+    'GreedyIKPlanner': 'timelimit',
+    'SBPLPlanner': 'timelimit',
+    'TrajoptPlanner': 'timelimit',
+    'VectorFieldPlanner': 'timelimit',
+}
+
+
+class LazyPlanner(MetaPlanner):
+    def __init__(self, factory, name=None):
+        """Planner that is constructed the first time it is used.
+        Many of HERB's planners create their own OpenRAVE environment, load
+        plugins, or parse configuration files when they are constructed. This
+        proxy defers that cost until a meta-planner first asks whether the
+        planner supports a method. The factory may return None to indicate
+        that the planner is not available, e.g. because a plugin is missing;
+        the proxy then reports that it supports no planning methods. If the
+        planner bounds its planning time through a keyword argument, see
+        TIME_LIMIT_ARGUMENTS, the proxy supports a \p deadline keyword
+        argument and passes the remaining time on as the time limit.
+        @param factory callable that takes no arguments and returns a planner
+        @param name name used for logging before the planner is created
+        """
+        self._factory = factory
+        self._name = name or getattr(factory, '__name__', 'planner')
+        self._lock = threading.Lock()
+        self._planner = None
+        self._created = False
+        MetaPlanner.__init__(self)
+
+    def __str__(self):
+        if self._created:
+            return str(self._planner)
+        else:
+            return 'Lazy({:s})'.format(self._name)
+
+    @property
+    def name(self):
+        """Name of the planner that does not require constructing it."""
+        return self._name
+
+    @property
+    def supports_deadline(self):
+        """Returns True if the planner has a time limit argument."""
+        return self._GetTimeLimitArgument() is not None
+
+    @property
+    def created(self):
+        """Returns True if the underlying planner was constructed."""
+        return self._created
+
+    @property
+    def planner(self):
+        """Get the underlying planner, constructing it if necessary.
+        @return planner, or None if the planner is not available
+        """
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    logger.debug('Constructing planner "%s".', self._name)
+                    self._planner = self._factory()
+                    self._created = True
+
+        return self._planner
+
+    def has_planning_method(self, method_name):
+        planner = self.planner
+        return planner is not None and planner.has_planning_method(method_name)
+
+    def get_planning_method_names(self):
+        planner = self.planner
+        if planner is None:
+            return []
+        else:
+            return planner.get_planning_method_names()
+
+    def get_planners(self):
+        planner = self.planner
+        if planner is None:
+            return []
+        else:
+            return [ planner ]
+
+    def plan(self, method, args, kw_args):
+        planner = self.planner
+        if planner is None:
+            raise AttributeError('Planner "{:s}" is not available.'.format(
+                                 self._name))
+
+        deadline = kw_args.pop('deadline', None)
+        time_limit_arg = self._GetTimeLimitArgument()
+        if deadline is not None and time_limit_arg is not None:
+            remaining_time = deadline - time.time()
+            if remaining_time <= 0.:
+                raise PlanningError('The deadline passed before {:s} started.'.format(
+                                    self._name))
+            kw_args[time_limit_arg] = min(kw_args.get(time_limit_arg, remaining_time),
+                                          remaining_time)
+
+        return getattr(planner, method)(*args, **kw_args)
+
+    def _GetTimeLimitArgument(self):
+        planner = self.planner
+        if planner is None:
+            return None
+        return TIME_LIMIT_ARGUMENTS.get(type(planner).__name__)
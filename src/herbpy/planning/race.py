@@ -0,0 +1,121 @@
+import logging, threading, time, Queue
+from prpy.planning.base import MetaPlanner, MetaPlanningError, PlanningError
+from budget import Deadline
+from statistics import GetPlannerName, IsLeafPlanner, TopLevelMethod
+
+logger = logging.getLogger('herbpy')
+
+
+class Race(MetaPlanner):
+    supports_deadline = True
+
+    def __init__(self, *planners, **kw_args):
+        """Run planners concurrently and return the first solution.
+        This is a drop-in replacement for Sequence that does not wait for a
+        failing planner before starting the next one. Each planner plans in
+        its own cloned environment, so the delegates do not interfere with
+        each other. Python threads cannot be interrupted, so the planners
+        that lose the race run to completion in the background and their
+        results are discarded; a later call to the same planner waits for
+        its environment to be released. The race ends at the earlier of
+        \p timeout and a \p deadline keyword argument, or that of the
+        Deadline context; the deadline is only passed on to delegates that
+        support deadlines.
+        @param planners delegate planners
+        @param timeout optional maximum time to wait for a solution
+        @param statistics optional PlannerStatistics that records the outcome
+                          of each delegate that is not a meta-planner; the
+                          delegates that are still running when the race
+                          ends are recorded as censored attempts
+        """
+        MetaPlanner.__init__(self)
+        self._planners = planners
+        self.timeout = kw_args.get('timeout')
+        self.statistics = kw_args.get('statistics')
+
+    def __str__(self):
+        return 'Race({:s})'.format(', '.join(map(str, self._planners)))
+
+    def plan(self, method, args, kw_args):
+        with TopLevelMethod(method) as top_method:
+            with Deadline(kw_args.pop('deadline', None)) as deadline:
+                return self._Plan(method, top_method, deadline, args, kw_args)
+
+    def _Plan(self, method, top_method, deadline, args, kw_args):
+        planners = [ planner for planner in self._planners
+                     if planner.has_planning_method(method) ]
+        if not planners:
+            raise MetaPlanningError(method, dict())
+
+        results = Queue.Queue()
+        cancelled = threading.Event()
+        start_time = time.time()
+
+        if self.timeout is not None:
+            end_time = start_time + self.timeout
+            if deadline is not None:
+                end_time = min(end_time, deadline)
+        else:
+            end_time = deadline
+
+        def run_planner(planner):
+            planner_kw_args = dict(kw_args)
+            planner_kw_args['defer'] = False
+            if deadline is not None and getattr(planner, 'supports_deadline', False):
+                planner_kw_args['deadline'] = deadline
+
+            try:
+                logger.info('Race - Calling planner "%s".', str(planner))
+                with TopLevelMethod(top_method), Deadline(deadline):
+                    traj = getattr(planner, method)(*args, **planner_kw_args)
+                results.put((planner, traj, None))
+            except PlanningError as e:
+                if not cancelled.is_set():
+                    logger.warning('Planner %s returned %s', planner, e)
+                results.put((planner, None, e))
+            except Exception as e:
+                if not cancelled.is_set():
+                    logger.exception('Planner %s raised an exception.', planner)
+                results.put((planner, None, e))
+
+        for planner in planners:
+            thread = threading.Thread(target=run_planner, args=(planner,),
+                                      name='Race-{:s}'.format(str(planner)))
+            thread.daemon = True
+            thread.start()
+
+        errors = dict()
+        running = list(planners)
+        try:
+            while running:
+                if end_time is None:
+                    wait_time = None
+                else:
+                    wait_time = max(end_time - time.time(), 0.)
+
+                try:
+                    planner, traj, error = results.get(timeout=wait_time)
+                except Queue.Empty:
+                    raise MetaPlanningError('{:s} timed out after {:.3f} s'.format(
+                        method, time.time() - start_time), errors)
+
+                running.remove(planner)
+                self._Record(top_method, planner, error is None, start_time)
+
+                if error is None:
+                    logger.info('Race - Planner "%s" won.', str(planner))
+                    return traj
+                else:
+                    errors[planner] = error
+        finally:
+            cancelled.set()
+            for planner in running:
+                self._Record(top_method, planner, False, start_time,
+                             censored=True)
+
+        raise MetaPlanningError(method, errors)
+
+    def _Record(self, method, planner, success, start_time, censored=False):
+        if self.statistics is not None and IsLeafPlanner(planner):
+            self.statistics.Record(method, GetPlannerName(planner), success,
+                                   time.time() - start_time, censored=censored)
@@ -0,0 +1,179 @@
+import atexit, json, logging, os, tempfile, threading
+from contextlib import contextmanager
+from prpy.planning.base import MetaPlanner
+from lazy import LazyPlanner
+
+logger = logging.getLogger('herbpy')
+
+# Method of the outermost planning call of each thread; see TopLevelMethod.
+_call_context = threading.local()
+
+
+def GetPlannerName(planner):
+    """Get a name for a planner that is stable across sessions.
+    @param planner planner
+    @return name
+    """
+    if isinstance(planner, LazyPlanner):
+        return planner.name
+    else:
+        return type(planner).__name__
+
+
+def IsLeafPlanner(planner):
+    """Check whether a planner plans by itself instead of delegating.
+    Meta-planners that record statistics only record their leaf delegates;
+    the leaf planners nested in a meta-planner delegate are recorded by the
+    meta-planner that calls them, so every call is only counted once.
+    @param planner planner
+    @return True unless the planner is a meta-planner
+    """
+    if isinstance(planner, LazyPlanner):
+        return True
+    else:
+        return not isinstance(planner, MetaPlanner)
+
+
+def GetTopLevelMethod():
+    """Get the method of the outermost planning call of this thread.
+    @return planning method name, or None outside of a planning call
+    """
+    return getattr(_call_context, 'method', None)
+
+
+@contextmanager
+def TopLevelMethod(method):
+    """Attribute the planning calls made in this context to a method.
+    Meta-planners often call their delegates with a different method than
+    they were called with, e.g. TSRPlanner plans PlanToTSR by calling
+    PlanToConfiguration. Only the outermost context sets the method, so
+    statistics are stored under the method that started the call. Threads
+    do not inherit the context; enter it again with the yielded method.
+    @param method planning method name of this call
+    @return context manager that yields the top-level method name
+    """
+    outer_method = GetTopLevelMethod()
+    if outer_method is not None:
+        yield outer_method
+        return
+
+    _call_context.method = method
+    try:
+        yield method
+    finally:
+        _call_context.method = None
+
+
+class PlannerStatistics(object):
+    def __init__(self, path=None, save_interval=60.):
+        """Success and latency statistics of planners for each method.
+        Writing the file is kept off the planning path: new statistics are
+        saved by a background timer at most \p save_interval seconds after
+        they were recorded, when the process exits, or by calling Save.
+        @param path optional JSON file used to persist the statistics
+        @param save_interval delay between recording and saving statistics
+        """
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._data = dict()
+        self._dirty = False
+        self._timer = None
+
+        if path is not None:
+            self.Load()
+            atexit.register(self.Save)
+
+    def Load(self):
+        """Load the statistics from \p path, if it exists."""
+        try:
+            with open(self.path, 'r') as stats_file:
+                data = json.load(stats_file)
+        except IOError:
+            return
+        except ValueError:
+            logger.warning('Ignoring corrupt planner statistics "%s".',
+                           self.path)
+            return
+
+        with self._lock:
+            self._data = data
+
+    def Save(self):
+        """Atomically write the statistics to \p path if they changed."""
+        if self.path is None:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._data, indent=2, sort_keys=True)
+            self._dirty = False
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as stats_file:
+            stats_file.write(data)
+        os.rename(temp_path, self.path)
+
+    def Record(self, method, planner_name, success, duration, censored=False):
+        """Record the outcome of one planning call.
+        A censored call was still running when its result stopped mattering,
+        e.g. a planner that lost a Race. Its time is added to the total time
+        but it does not count as an attempt, so the time per success stays an
+        unbiased estimate for planners that succeed at a constant rate.
+        @param method planning method name
+        @param planner_name name of the planner
+        @param success True if the planner returned a trajectory
+        @param duration wall time of the call in seconds
+        @param censored True if the call was abandoned before it finished
+        """
+        with self._lock:
+            method_data = self._data.setdefault(method, dict())
+            entry = method_data.setdefault(planner_name, {
+                'attempts': 0,
+                'successes': 0,
+                'total_time': 0.,
+            })
+            if censored:
+                entry['censored'] = entry.get('censored', 0) + 1
+            else:
+                entry['attempts'] += 1
+                entry['successes'] += int(success)
+            entry['total_time'] += duration
+            self._dirty = True
+
+            if self.path is not None and self._timer is None:
+                self._timer = threading.Timer(self.save_interval, self._SaveFromTimer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _SaveFromTimer(self):
+        with self._lock:
+            self._timer = None
+
+        try:
+            self.Save()
+        except EnvironmentError as e:
+            logger.warning('Failed saving planner statistics to "%s": %s',
+                           self.path, str(e))
+
+    def Get(self, method, planner_name):
+        """Get the statistics of a planner for one method.
+        @return dictionary with attempts, successes, and total_time, and
+                censored if any call was censored
+        """
+        with self._lock:
+            entry = self._data.get(method, {}).get(planner_name)
+            if entry is None:
+                return { 'attempts': 0, 'successes': 0, 'total_time': 0. }
+            else:
+                return dict(entry)
+
+    def GetAll(self):
+        """Get a copy of all statistics, indexed by method and planner."""
+        with self._lock:
+            return json.loads(json.dumps(self._data))
@@ -0,0 +1,36 @@
+import logging
+from prpy.planning.base import MetaPlanner
+
+logger = logging.getLogger('herbpy')
+
+
+class WorkspaceFilteredPlanner(MetaPlanner):
+    def __init__(self, planner):
+        """Filter TSR samples by the workspace of the arm before planning.
+        The TSR chains passed to PlanToTSR are wrapped by the robot's
+        workspace_filter, if it has one, so samples that are far outside the
+        reach of the arm are rejected before they are passed to IK. All
+        other methods are passed through unchanged.
+        @param planner delegate planner, e.g. a TSRPlanner
+        """
+        MetaPlanner.__init__(self)
+        self._planners = [ planner ]
+        self.planner = planner
+
+    def __str__(self):
+        return 'WorkspaceFiltered({:s})'.format(str(self.planner))
+
+    def plan(self, method, args, kw_args):
+        robot = args[0]
+        workspace_filter = getattr(robot, 'workspace_filter', None)
+
+        if method == 'PlanToTSR' and workspace_filter is not None:
+            if len(args) > 1:
+                args = (robot, workspace_filter.FilterTSRList(robot, args[1])) \
+                     + tuple(args[2:])
+            elif 'tsrchains' in kw_args:
+                kw_args = dict(kw_args)
+                kw_args['tsrchains'] = workspace_filter.FilterTSRList(
+                    robot, kw_args['tsrchains'])
+
+        return getattr(self.planner, method)(*args, **kw_args)
@@ -0,0 +1,121 @@
+import logging, os, resource, time
+from contextlib import contextmanager
+
+logger = logging.getLogger('herbpy')
+
+
+def GetResidentMemory():
+    """Get the resident set size of this process.
+    This reads /proc/self/statm when it is available and falls back on the
+    peak resident set size reported by getrusage otherwise.
+    @return resident memory in bytes
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm_file:
+            num_pages = int(statm_file.read().split()[1])
+        return num_pages * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StartupProfiler(object):
+    def __init__(self, profile_path=None):
+        """Record the wall time and memory delta of named phases.
+        Phases may be nested; the report lists them in the order they
+        started along with their nesting depth. If profile_path is set, the
+        profiler also runs cProfile while it is active and dumps the
+        statistics to that file when it is stopped.
+        @param profile_path optional output path for cProfile statistics
+        """
+        self.profile_path = profile_path
+        self.phases = list()
+        self._depth = 0
+        self._cprofile = None
+        self._start_time = None
+        self._start_memory = None
+        self._total_time = None
+        self._total_memory = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        if self.profile_path is not None:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+        self._start_time = time.time()
+        self._start_memory = GetResidentMemory()
+
+    def stop(self):
+        self._total_time = time.time() - self._start_time
+        self._total_memory = GetResidentMemory() - self._start_memory
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.profile_path)
+            logger.info('Wrote startup profile to "%s".', self.profile_path)
+            self._cprofile = None
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with-statement as a named phase.
+        @param name name of the phase
+        """
+        record = {
+            'name': name,
+            'depth': self._depth,
+            'duration': None,
+            'memory_delta': None,
+        }
+        self.phases.append(record)
+
+        start_time = time.time()
+        start_memory = GetResidentMemory()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            record['duration'] = time.time() - start_time
+            record['memory_delta'] = GetResidentMemory() - start_memory
+
+    def report(self):
+        """Get a structured report of the recorded phases.
+        @return dictionary with the total time, total memory delta, and a
+                list of per-phase records
+        """
+        return {
+            'duration': self._total_time,
+            'memory_delta': self._total_memory,
+            'phases': [ dict(record) for record in self.phases ],
+        }
+
+    def log(self, level=logging.INFO):
+        """Log a human-readable table of the recorded phases.
+        @param level logging level
+        """
+        lines = [ 'Startup profile:' ]
+        for record in self.phases:
+            lines.append('  {:<40s} {:8.3f} s {:+10.1f} MB'.format(
+                '  ' * record['depth'] + record['name'],
+                record['duration'] or 0.,
+                (record['memory_delta'] or 0) / 1048576.))
+
+        if self._total_time is not None:
+            lines.append('  {:<40s} {:8.3f} s {:+10.1f} MB'.format(
+                'total', self._total_time, self._total_memory / 1048576.))
+
+        logger.log(level, '\n'.join(lines))
+
+
+class NullProfiler(object):
+    """Profiler that does not record anything."""
+    @contextmanager
+    def phase(self, name):
+        yield
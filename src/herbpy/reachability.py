@@ -0,0 +1,192 @@
+import json, logging, numpy, os, tempfile
+import openravepy
+from herbpy.workspace import WorkspaceGrid
+
+logger = logging.getLogger('herbpy')
+
+
+def GetPoseDescriptors(poses):
+    """Split end-effector poses into a heading and a gravity-relative part.
+    Every pose is written as Rz(heading) * R, where R does not depend on
+    rotations of the pose around the vertical axis. The descriptor of the
+    pose is its height and the x and y components of the quaternion of R,
+    which determine R because its z component is zero.
+    @param poses (N,4,4) array of poses
+    @return tuple of an (N,) array of headings and an (N,3) array of
+            descriptors
+    """
+    poses = numpy.asarray(poses, dtype=float)
+    quats = numpy.array([ openravepy.quatFromRotationMatrix(pose[0:3, 0:3])
+                          for pose in poses ])
+    w, x, y, z = quats.T
+
+    # Rotating a pose by beta around the vertical axis rotates (w, z) by beta/2.
+    half_heading = numpy.arctan2(z, w)
+    c, s = numpy.cos(half_heading), numpy.sin(half_heading)
+    descriptors = numpy.column_stack([ poses[:, 2, 3], c*x + s*y, c*y - s*x ])
+    return 2 * half_heading, descriptors
+
+
+class InverseReachabilityMap(object):
+    def __init__(self, path=None, height_resolution=0.05,
+                 rotation_resolution=0.1):
+        """Precomputed reachability of HERB's arms for base placement.
+        For each arm, the map stores a set of collision-free end-effector
+        poses relative to the base, indexed by their height and orientation
+        relative to gravity. Any pose with the same height and orientation
+        relative to gravity can be reached by moving the base on the floor,
+        which makes it possible to compute base poses for an end-effector pose.
+        @param path optional file used to persist the map
+        @param height_resolution bin size for the height of the end-effector
+        @param rotation_resolution bin size for the gravity-relative rotation
+        """
+        self.path = path
+        self.height_resolution = height_resolution
+        self.rotation_resolution = rotation_resolution
+        self._samples = dict()
+        self._bins = dict()
+
+        if path is not None and os.path.exists(path):
+            self.Load()
+
+    def Load(self):
+        """Load the map from \p path."""
+        with open(self.path, 'rb') as map_file:
+            data = numpy.load(map_file)
+            metadata = json.loads(str(data['metadata']))
+
+            self.height_resolution = metadata['height_resolution']
+            self.rotation_resolution = metadata['rotation_resolution']
+            self._samples = dict()
+            self._bins = dict()
+            for manip_name in metadata['manipulators']:
+                self._SetSamples(manip_name, data[manip_name])
+
+        logger.info('Loaded inverse reachability map for %s from "%s".',
+                    ', '.join(sorted(self._samples.keys())), self.path)
+
+    def Save(self):
+        """Atomically write the map to \p path."""
+        arrays = dict(self._samples)
+        arrays['metadata'] = numpy.array(json.dumps({
+            'height_resolution': self.height_resolution,
+            'rotation_resolution': self.rotation_resolution,
+            'manipulators': sorted(self._samples.keys()),
+        }))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as map_file:
+            numpy.savez_compressed(map_file, **arrays)
+        os.rename(temp_path, self.path)
+
+    def HasManipulator(self, manip):
+        return manip.GetName() in self._samples
+
+    def GetWorkspaceGrids(self, resolution=0.05, dilation=1):
+        """Build voxel grids of the positions each arm can reach.
+        @param resolution edge length of a voxel
+        @param dilation number of voxels to grow the reachable region by
+        @return dictionary from manipulator name to WorkspaceGrid
+        """
+        return dict((manip_name, WorkspaceGrid.FromPositions(
+                        samples[:, [ 0, 1, 3 ]], resolution=resolution,
+                        dilation=dilation))
+                    for manip_name, samples in self._samples.iteritems())
+
+    def Build(self, robot, manip, num_samples=100000, seed=0):
+        """Sample collision-free configurations of an arm to build its map.
+        The base is moved to the origin, so the environment should only
+        contain the robot. The other joints keep their current values.
+        @param robot robot
+        @param manip manipulator to build the map for
+        @param num_samples number of configurations to sample
+        @param seed random seed
+        @return number of collision-free samples
+        """
+        env = robot.GetEnv()
+        rng = numpy.random.RandomState(seed)
+        dof_indices = manip.GetArmIndices()
+
+        with env:
+            lower, upper = robot.GetDOFLimits(dof_indices)
+            poses = list()
+
+            with robot.CreateRobotStateSaver():
+                robot.SetTransform(numpy.eye(4))
+
+                for i in xrange(num_samples):
+                    robot.SetDOFValues(rng.uniform(lower, upper), dof_indices)
+                    if robot.CheckSelfCollision() or env.CheckCollision(robot):
+                        continue
+                    poses.append(manip.GetEndEffectorTransform())
+
+        logger.info('Inverse reachability map for the %s arm: %d of %d samples'
+                    ' are collision-free.', manip.GetName(), len(poses),
+                    num_samples)
+
+        if not poses:
+            raise ValueError('No collision-free configurations of the {:s} arm'
+                             ' were found.'.format(manip.GetName()))
+
+        poses = numpy.array(poses)
+        headings, descriptors = GetPoseDescriptors(poses)
+        samples = numpy.column_stack([ poses[:, 0:2, 3], headings, descriptors ])
+        self._SetSamples(manip.GetName(), samples.astype(numpy.float32))
+        return len(poses)
+
+    def GetBasePoses(self, manip, ee_poses, base_height=0.):
+        """Get the base poses from which end-effector poses are reachable.
+        @param manip manipulator that should reach the poses
+        @param ee_poses (N,4,4) array of end-effector poses in the world frame
+        @param base_height height of the base above the world frame
+        @return tuple of an (M,3) array of base x, y, and yaw and an (M,)
+                array with the index in ee_poses that each base pose reaches
+        """
+        bins = self._bins.get(manip.GetName())
+        if bins is None:
+            raise ValueError('There is no inverse reachability map for the {:s}'
+                             ' arm.'.format(manip.GetName()))
+        samples = self._samples[manip.GetName()]
+
+        ee_poses = numpy.array(ee_poses, dtype=float)
+        ee_poses[:, 2, 3] -= base_height
+        headings, descriptors = GetPoseDescriptors(ee_poses)
+
+        base_poses = list()
+        ee_indices = list()
+        for i, key in enumerate(self._GetBinKeys(descriptors)):
+            indices = bins.get(key)
+            if indices is None:
+                continue
+
+            # Rotate the base so the heading of the sample matches the target.
+            yaw = headings[i] - samples[indices, 2]
+            c, s = numpy.cos(yaw), numpy.sin(yaw)
+            x = ee_poses[i, 0, 3] - (c * samples[indices, 0] - s * samples[indices, 1])
+            y = ee_poses[i, 1, 3] - (s * samples[indices, 0] + c * samples[indices, 1])
+
+            base_poses.append(numpy.column_stack([ x, y, yaw ]))
+            ee_indices.append(numpy.repeat(i, len(indices)))
+
+        if not base_poses:
+            return numpy.zeros((0, 3)), numpy.zeros(0, dtype=int)
+        return numpy.concatenate(base_poses), numpy.concatenate(ee_indices)
+
+    def _SetSamples(self, manip_name, samples):
+        bins = dict()
+        for index, key in enumerate(self._GetBinKeys(samples[:, 3:6])):
+            bins.setdefault(key, list()).append(index)
+
+        self._samples[manip_name] = samples
+        self._bins[manip_name] = dict((key, numpy.array(indices))
+                                      for key, indices in bins.iteritems())
+
+    def _GetBinKeys(self, descriptors):
+        resolution = numpy.array([ self.height_resolution,
+                                   self.rotation_resolution,
+                                   self.rotation_resolution ])
+        return map(tuple, numpy.floor(descriptors / resolution).astype(int))
@@ -0,0 +1,548 @@
+import itertools, json, logging, numpy, os, shutil, socket, tempfile, Queue
+import SocketServer, openravepy
+
+logger = logging.getLogger('herbpy')
+
+PLANNING_METHODS = [
+    'PlanToBasePose',
+    'PlanToConfiguration',
+    'PlanToEndEffectorOffset',
+    'PlanToEndEffectorPose',
+    'PlanToNamedConfiguration',
+    'PlanToTSR',
+]
+
+
+class PlanningServerError(Exception):
+    pass
+
+
+def _ToArray(value):
+    if isinstance(value, list):
+        return numpy.array(value, dtype=float)
+    else:
+        return value
+
+
+def GetBodyFile(body, directory):
+    """Get a file that another process can load a kinbody from.
+    Kinbodies that were not loaded from a file, e.g. ones that were created
+    in code, are saved to \p directory in the COLLADA format. The file is
+    named after the kinematics and geometry hash of the body, so a body is
+    only saved again after it changed.
+    @param body kinbody
+    @param directory directory to save kinbodies to
+    @return path of the file
+    """
+    xml = body.GetXMLFilename()
+    if xml:
+        return xml
+
+    path = os.path.join(directory, '{:s}.dae'.format(
+                        body.GetKinematicsGeometryHash()))
+    if not os.path.exists(path):
+        fd, temp_path = tempfile.mkstemp(suffix='.dae', dir=directory)
+        os.close(fd)
+        body.GetEnv().Save(temp_path, openravepy.Environment.SelectionOptions.Body,
+                           { 'target': body.GetName() })
+        os.rename(temp_path, path)
+    return path
+
+
+def GetRobotState(robot):
+    """Get the state of a robot that is sent with a planning request.
+    @param robot robot
+    @return dictionary with the pose, DOF values, active DOFs, active
+            manipulator, and grabbed kinbodies of the robot
+    """
+    with robot.GetEnv():
+        manip = robot.GetActiveManipulator()
+        return {
+            'transform': robot.GetTransform().tolist(),
+            'dof_values': robot.GetDOFValues().tolist(),
+            'active_dof_indices': robot.GetActiveDOFIndices().tolist(),
+            'active_manip': manip.GetName() if manip is not None else None,
+            'grabbed': [ { 'body': body.GetName(),
+                           'link': robot.IsGrabbing(body).GetName() }
+                         for body in robot.GetGrabbed() ],
+        }
+
+
+class ClientScene(object):
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        """Kinbodies sent by one client connection.
+        The scene is only modified by the thread that serves the connection.
+        """
+        self.id = next(ClientScene._ids)
+        self.version = 0
+        self.bodies = dict()
+
+    def GetKey(self):
+        """Get a key that changes whenever the scene changes.
+        @return tuple of the connection id and scene version
+        """
+        return (self.id, self.version)
+
+    def Update(self, diff):
+        """Apply a scene diff.
+        @param diff dictionary with 'add', 'move', and 'remove' entries
+        """
+        for name in diff.get('remove', []):
+            self.bodies.pop(name, None)
+        for name, state in diff.get('add', {}).iteritems():
+            self.bodies[name] = state
+        for name, transform in diff.get('move', {}).iteritems():
+            if name not in self.bodies:
+                raise PlanningServerError(
+                    'Unable to move unknown kinbody "{:s}".'.format(name))
+            self.bodies[name] = dict(self.bodies[name], transform=transform)
+
+        self.version += 1
+
+
+class HerbEnvironment(object):
+    def __init__(self, env, robot):
+        """An initialized HERB environment owned by the planning server.
+        @param env OpenRAVE environment
+        @param robot HERBRobot in the environment
+        """
+        self.env = env
+        self.robot = robot
+        self.scene_key = None
+        self.bodies = dict()
+        self.sensor_pools = dict()
+
+    def SyncScene(self, client_scene):
+        """Add, remove, and move kinbodies to match a client's scene.
+        @param client_scene ClientScene of the connection
+        """
+        scene_key = client_scene.GetKey()
+        if scene_key == self.scene_key:
+            return
+
+        scene = client_scene.bodies
+        with self.env:
+            self.robot.ReleaseAllGrabbed()
+
+            for name in set(self.bodies) - set(scene):
+                body = self.env.GetKinBody(name)
+                if body is not None:
+                    self.env.Remove(body)
+                del self.bodies[name]
+
+            for name, state in scene.iteritems():
+                body = self.env.GetKinBody(name)
+
+                if body is None or self.bodies.get(name, {}).get('xml') != state['xml']:
+                    if body is not None:
+                        self.env.Remove(body)
+
+                    body = self.env.ReadKinBodyXMLFile(state['xml'])
+                    if body is None:
+                        raise PlanningServerError(
+                            'Failed loading kinbody "{:s}" from "{:s}".'.format(
+                                name, state['xml']))
+                    body.SetName(name)
+                    self.env.Add(body)
+
+                body.SetTransform(numpy.array(state['transform']))
+                self.bodies[name] = state
+
+        self.scene_key = scene_key
+
+    def SetRobotState(self, state):
+        """Restore the state of the robot sent with a request.
+        Kinbodies that are not listed in \p state are released.
+        @param state dictionary returned by GetRobotState; missing entries
+                     are left unchanged
+        """
+        robot = self.robot
+        with self.env:
+            robot.ReleaseAllGrabbed()
+
+            if 'dof_values' in state:
+                robot.SetDOFValues(numpy.array(state['dof_values']))
+            if 'transform' in state:
+                robot.SetTransform(numpy.array(state['transform']))
+            if state.get('active_manip') is not None:
+                robot.SetActiveManipulator(str(state['active_manip']))
+            if 'active_dof_indices' in state:
+                robot.SetActiveDOFs(state['active_dof_indices'])
+
+            for grabbed in state.get('grabbed', []):
+                body = self.env.GetKinBody(grabbed['body'])
+                if body is None:
+                    raise PlanningServerError(
+                        'Unable to grab unknown kinbody "{:s}".'.format(
+                            grabbed['body']))
+                robot.Grab(body, robot.GetLink(str(grabbed['link'])))
+
+    def Plan(self, request):
+        """Run a planning request in this environment.
+        @param request request dictionary; see PlanningClient.Plan
+        @return serialized trajectory
+        """
+        method_name = request['method']
+        if method_name not in PLANNING_METHODS:
+            raise PlanningServerError(
+                'Unsupported planning method "{:s}".'.format(method_name))
+
+        robot = self.robot
+        self.SetRobotState(request.get('robot_state', {}))
+
+        target_name = request.get('target', 'robot')
+        if target_name == 'robot':
+            target = robot
+        elif target_name == 'base':
+            target = robot.base
+        else:
+            target = robot.GetManipulator(target_name)
+            if target is None:
+                raise PlanningServerError(
+                    'Robot has no manipulator "{:s}".'.format(target_name))
+
+            with self.env:
+                target.SetActive()
+
+        args = [ _ToArray(arg) for arg in request.get('args', []) ]
+        kw_args = dict(request.get('kw_args', {}))
+        kw_args['execute'] = False
+
+        if method_name == 'PlanToTSR' and 'tsr' in request:
+            args = [ self._GetTSRList(request['tsr']) ] + args
+
+        traj = getattr(target, method_name)(*args, **kw_args)
+        return traj.serialize(0)
+
+    def ScoreOcclusion(self, request):
+        """Score the occlusion of pointing IK solutions in this environment.
+        @param request request dictionary; see PlanningClient.ScoreOcclusion
+        @return list of occlusion scores
+        """
+        from action.render import RenderSensorPool
+        from action.rogue import Naturalness
+
+        robot = self.robot
+        self.SetRobotState(request['robot_state'])
+
+        sensor_args = request['sensor']
+        sensor_key = json.dumps(sensor_args, sort_keys=True)
+        if sensor_key not in self.sensor_pools:
+            self.sensor_pools[sensor_key] = RenderSensorPool(**sensor_args)
+
+        goal_name = request['goal_name']
+        ranker = Naturalness(numpy.array(request['focus_trans']),
+                             str(goal_name) if goal_name is not None else None,
+                             sensor_pool=self.sensor_pools[sensor_key],
+                             occlusion=request['occlusion'],
+                             occlusion_scale=request['occlusion_scale'],
+                             num_exact=None)
+        ik_solutions = numpy.array(request['ik_solutions'])
+        return ranker.scoreOcclusion(robot, ik_solutions).tolist()
+
+    def _GetTSRList(self, tsr_request):
+        obj_name = tsr_request.get('object')
+        if obj_name is not None:
+            obj = self.env.GetKinBody(obj_name)
+            if obj is None:
+                raise PlanningServerError(
+                    'There is no kinbody named "{:s}".'.format(obj_name))
+        else:
+            obj = None
+
+        tsr_args = [ _ToArray(arg) for arg in tsr_request.get('args', []) ]
+        tsr_kw_args = dict(tsr_request.get('kw_args', {}))
+        if 'manip' in tsr_kw_args:
+            tsr_kw_args['manip'] = self.robot.GetManipulator(
+                tsr_kw_args['manip'])
+
+        return self.robot.tsrlibrary(obj, tsr_request['action'],
+                                     *tsr_args, **tsr_kw_args)
+
+
+class PlanningRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        scene = ClientScene()
+
+        for line in iter(self.rfile.readline, ''):
+            try:
+                request = json.loads(line)
+                response = self.server.HandleRequest(request, scene)
+            except Exception as e:
+                logger.warning('Planning request failed: %s', str(e))
+                response = {
+                    'status': 'error',
+                    'type': type(e).__name__,
+                    'message': str(e),
+                }
+
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+
+class PlanningServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, num_environments=1, **herbpy_args):
+        """Serve planning requests for warm HERB environments over a socket.
+        Each request is a JSON object on a single line and is answered with a
+        JSON object on a single line. Requests are served concurrently by a
+        pool of independently initialized HERB environments. Each connection
+        has its own scene, which the client updates by sending diffs of its
+        kinbodies; an environment lazily loads the scene of a connection
+        before it serves one of its requests, so clients that share a server
+        do not see each other's kinbodies. The state of the robot, including
+        its active DOFs and grabbed kinbodies, is sent with each request.
+        @param socket_path path of the Unix socket to listen on
+        @param num_environments number of HERB environments to create
+        @param **herbpy_args keyword arguments passed to herbpy.initialize
+        """
+        from herb import initialize
+
+        self.environments = Queue.Queue()
+        for i in xrange(num_environments):
+            env, robot = initialize(**herbpy_args)
+            self.environments.put(HerbEnvironment(env, robot))
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        SocketServer.UnixStreamServer.__init__(self, socket_path,
+                                               PlanningRequestHandler)
+        logger.info('Serving %d HERB environment(s) on "%s".',
+                    num_environments, socket_path)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def HandleRequest(self, request, scene):
+        """Serve one request of a connection.
+        @param request request dictionary
+        @param scene ClientScene of the connection
+        @return response dictionary
+        """
+        if 'scene' in request:
+            scene.Update(request['scene'])
+
+        if 'method' not in request and 'score_occlusion' not in request:
+            return { 'status': 'ok' }
+
+        herb_env = self.environments.get()
+        try:
+            herb_env.SyncScene(scene)
+            if 'method' in request:
+                return { 'status': 'ok', 'trajectory': herb_env.Plan(request) }
+            else:
+                return { 'status': 'ok', 'scores': herb_env.ScoreOcclusion(
+                                                       request['score_occlusion']) }
+        finally:
+            self.environments.put(herb_env)
+
+
+def Serve(socket_path, num_environments=1, debug=False, **herbpy_args):
+    """Initialize OpenRAVE and run a PlanningServer until it is interrupted.
+    @param socket_path path of the Unix socket to listen on
+    @param num_environments number of HERB environments to create
+    @param debug enable OpenRAVE debug logging
+    @param **herbpy_args keyword arguments passed to herbpy.initialize
+    """
+    openravepy.RaveInitialize(True)
+    openravepy.misc.InitOpenRAVELogging()
+
+    if debug:
+        openravepy.RaveSetDebugLevel(openravepy.DebugLevel.Debug)
+
+    server = PlanningServer(socket_path, num_environments=num_environments,
+                            **herbpy_args)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class PlanningClient(object):
+    def __init__(self, socket_path, env=None, body_directory=None):
+        """Client for a PlanningServer.
+        If \p env is specified, trajectories are deserialized into that
+        environment and UpdateScene sends the kinbodies in it to the server.
+        @param socket_path path of the server's Unix socket
+        @param env optional local environment
+        @param body_directory directory used to save kinbodies that were not
+                              loaded from a file; see GetBodyFile. Defaults
+                              to a temporary directory.
+        """
+        self.env = env
+        self._sent_bodies = dict()
+        self._body_directory = body_directory
+        self._owns_body_directory = False
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile('rw')
+
+    def Close(self):
+        self._file.close()
+        self._socket.close()
+
+        if self._owns_body_directory:
+            shutil.rmtree(self._body_directory, ignore_errors=True)
+
+    def Send(self, request):
+        self._file.write(json.dumps(request) + '\n')
+        self._file.flush()
+
+        line = self._file.readline()
+        if not line:
+            raise PlanningServerError('Planning server closed the connection.')
+
+        response = json.loads(line)
+        if response['status'] != 'ok':
+            raise PlanningServerError('{:s}: {:s}'.format(
+                response['type'], response['message']))
+        return response
+
+    def GetSceneDiff(self, env=None):
+        """Compute the kinbodies that changed since the last update.
+        The robot is not included; its state is sent with each request.
+        @param env environment to compare with the server; defaults to \p env
+        @return scene diff
+        """
+        if env is None:
+            env = self.env
+
+        diff = { 'add': dict(), 'move': dict(), 'remove': list() }
+        current_bodies = dict()
+
+        with env:
+            for body in env.GetBodies():
+                if body.IsRobot():
+                    continue
+
+                name = body.GetName()
+                state = {
+                    'xml': GetBodyFile(body, self._GetBodyDirectory()),
+                    'transform': body.GetTransform().tolist(),
+                }
+                current_bodies[name] = state
+
+                sent_state = self._sent_bodies.get(name)
+                if sent_state is None or sent_state['xml'] != state['xml']:
+                    diff['add'][name] = state
+                elif not numpy.allclose(sent_state['transform'], state['transform']):
+                    diff['move'][name] = state['transform']
+
+        diff['remove'] = [ name for name in self._sent_bodies
+                           if name not in current_bodies ]
+        self._sent_bodies = current_bodies
+        return diff
+
+    def _GetBodyDirectory(self):
+        if self._body_directory is None:
+            self._body_directory = tempfile.mkdtemp(prefix='herbpy-bodies-')
+            self._owns_body_directory = True
+        return self._body_directory
+
+    def UpdateScene(self):
+        """Send the kinbodies that changed in the local environment."""
+        diff = self.GetSceneDiff()
+        if diff['add'] or diff['move'] or diff['remove']:
+            self.Send({ 'scene': diff })
+
+    def Plan(self, method, target='robot', args=(), kw_args=None, tsr=None,
+             robot=None):
+        """Plan on the server.
+        @param method planning method name, e.g. PlanToConfiguration
+        @param target 'robot', 'base', or a manipulator name
+        @param args positional arguments of the planning method
+        @param kw_args keyword arguments of the planning method
+        @param tsr for PlanToTSR, a dictionary with the 'object', 'action',
+                   'args', and 'kw_args' of the TSR library query
+        @param robot optional local robot whose state is sent to the server;
+                     see GetRobotState. Without it, the server plans with
+                     the state of the previous request and nothing grabbed.
+        @return trajectory, or a serialized trajectory if there is no env
+        """
+        request = {
+            'method': method,
+            'target': target,
+            'args': [ numpy.asarray(arg).tolist()
+                      if isinstance(arg, numpy.ndarray) else arg
+                      for arg in args ],
+            'kw_args': kw_args or dict(),
+        }
+        if tsr is not None:
+            request['tsr'] = tsr
+
+        if self.env is not None:
+            diff = self.GetSceneDiff()
+            if diff['add'] or diff['move'] or diff['remove']:
+                request['scene'] = diff
+
+        if robot is not None:
+            request['robot_state'] = GetRobotState(robot)
+
+        serialized_traj = self.Send(request)['trajectory']
+        if self.env is None:
+            return serialized_traj
+
+        traj = openravepy.RaveCreateTrajectory(self.env, '')
+        traj.deserialize(serialized_traj)
+        return traj
+
+    def ScoreOcclusion(self, robot, ranker, ik_solutions):
+        """Score the occlusion of pointing IK solutions on the server.
+        The kinbodies that changed in the environment of \p robot and the
+        state of the robot, including its grabbed kinbodies, are sent with
+        the request.
+        @param robot local robot the solutions are for
+        @param ranker Naturalness ranker
+        @param ik_solutions (N,D) array of IK solutions of the active manipulator
+        @return (N,) array of scores, the same as ranker.scoreOcclusion
+        """
+        score_request = {
+            'robot_state': GetRobotState(robot),
+            'focus_trans': numpy.asarray(ranker.focus_trans).tolist(),
+            'goal_name': ranker.goal_name,
+            'occlusion': ranker.occlusion,
+            'occlusion_scale': ranker.occlusion_scale,
+            'sensor': {
+                'length': ranker.sensor_pool.length,
+                'width': ranker.sensor_pool.width,
+                'intrinsics': list(ranker.sensor_pool.intrinsics),
+            },
+            'ik_solutions': numpy.asarray(ik_solutions).tolist(),
+        }
+        request = { 'score_occlusion': score_request }
+
+        diff = self.GetSceneDiff(robot.GetEnv())
+        if diff['add'] or diff['move'] or diff['remove']:
+            request['scene'] = diff
+
+        return numpy.array(self.Send(request)['scores'])
+
+    def PlanToConfiguration(self, target, goal, **kw_args):
+        return self.Plan('PlanToConfiguration', target=target,
+                         args=[ goal ], **kw_args)
+
+    def PlanToNamedConfiguration(self, name, target='robot', **kw_args):
+        return self.Plan('PlanToNamedConfiguration', target=target,
+                         args=[ name ], **kw_args)
+
+    def PlanToTSR(self, target, obj_name, action, tsr_args=(),
+                  tsr_kw_args=None, **kw_args):
+        tsr = {
+            'object': obj_name,
+            'action': action,
+            'args': list(tsr_args),
+            'kw_args': tsr_kw_args or dict(),
+        }
+        return self.Plan('PlanToTSR', target=target, tsr=tsr, **kw_args)
+
+    def PlanToBasePose(self, pose, **kw_args):
+        return self.Plan('PlanToBasePose', target='base',
+                         args=[ pose ], **kw_args)
@@ -8,3 +8,5 @@ from pitcher import *
 from tray import *
 from pop_tarts import *
 from generic import *
+from sampling import SampleTSR, SampleTSRChain, SampleTSRChains
+from cache import CachedTSRLibrary
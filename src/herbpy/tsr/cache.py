@@ -0,0 +1,130 @@
+import collections, logging, threading
+from herbpy.planning.cache import Fingerprint, UncacheableError
+
+logger = logging.getLogger('herbpy')
+
+# TSR factories whose result only depends on the pose of the object, the
+# arguments and the manipulator. Factories that read the state of the robot,
+# e.g. 'lift', 'place' and 'handle_grasp' (which picks the handle closest to
+# the end-effector), are never cached.
+STATIC_ACTIONS = frozenset([ 'grasp', 'push_grasp', 'point_on',
+                             'given_point_on', 'point', 'present' ])
+
+class CachedTSRLibrary(object):
+    def __init__(self, library, actions=STATIC_ACTIONS, max_entries=256,
+                 resolution=1e-4):
+        """
+        Memoize the TSR chains returned by a TSR library. Entries are keyed on
+        the name, geometry and quantized pose of the object, the action, the
+        arguments and the manipulator. When an object moves, all of its
+        entries are dropped. Cached chains are shared between calls, so
+        callers must not modify them. The factories make the manipulator
+        active, so a hit does the same for a \p manip keyword argument.
+
+        @param library The TSRLibrary to wrap
+        @param actions The names of the actions whose TSRs can be cached
+        @param max_entries The maximum number of cached TSR lists
+        @param resolution The quantization resolution of poses and arguments
+        """
+        self.library = library
+        self.actions = actions
+        self.max_entries = max_entries
+        self.resolution = resolution
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._poses = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.library, name)
+
+    def __call__(self, kinbody, action_name, *args, **kw_args):
+        if action_name not in self.actions:
+            return self.library(kinbody, action_name, *args, **kw_args)
+
+        try:
+            key, object_name, pose = self._GetKey(kinbody, action_name, args, kw_args)
+        except UncacheableError as e:
+            logger.debug('Not caching the "%s" TSR: %s', action_name, str(e))
+            return self.library(kinbody, action_name, *args, **kw_args)
+
+        with self._lock:
+            # Drop the entries of an object that moved.
+            if self._poses.get(object_name, pose) != pose:
+                for stale_key in [ k for k in self._entries if k[0] == object_name ]:
+                    del self._entries[stale_key]
+            self._poses[object_name] = pose
+
+            tsrlist = self._entries.pop(key, None)
+            if tsrlist is not None:
+                self._entries[key] = tsrlist
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if tsrlist is not None:
+            manip = kw_args.get('manip')
+            if manip is not None:
+                with self.library.robot.GetEnv():
+                    manip.SetActive()
+            return list(tsrlist)
+
+        tsrlist = self.library(kinbody, action_name, *args, **kw_args)
+
+        with self._lock:
+            self._entries[key] = list(tsrlist)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return tsrlist
+
+    def clone(self, robot):
+        """
+        Clone the wrapped library for a cloned robot. The clone starts with an
+        empty cache, since its objects live in a different environment.
+        """
+        return CachedTSRLibrary(self.library.clone(robot), actions=self.actions,
+                                max_entries=self.max_entries,
+                                resolution=self.resolution)
+
+    def Clear(self):
+        """
+        Remove all cached TSRs.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._poses.clear()
+
+    def GetStatistics(self):
+        """
+        Get the cache counters.
+        @return dictionary of counters
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+            }
+
+    def _GetKey(self, kinbody, action_name, args, kw_args):
+        robot = self.library.robot
+
+        if kinbody is None:
+            object_name, pose = None, None
+        else:
+            with kinbody.GetEnv():
+                object_name = (kinbody.GetName(), kinbody.GetKinematicsGeometryHash())
+                pose = Fingerprint(kinbody.GetTransform(), self.resolution)
+
+        # Factories use the active manipulator if none is given.
+        if kw_args.get('manip') is None:
+            active_manip = robot.GetActiveManipulatorIndex()
+        else:
+            active_manip = None
+
+        return (object_name, pose, action_name, active_manip,
+                Fingerprint(args, self.resolution),
+                Fingerprint(kw_args, self.resolution)), object_name, pose
@@ -0,0 +1,131 @@
+import numpy
+
+def RPYToRotations(rpy):
+    """
+    Convert roll-pitch-yaw angles to rotation matrices, using the same
+    convention as prpy.tsr.TSR.rpy_to_rot, i.e. R = Rz(yaw) Ry(pitch) Rx(roll).
+
+    @param rpy (N,3) array of roll, pitch and yaw angles
+    @return (N,3,3) array of rotation matrices
+    """
+    cr, cp, cy = numpy.cos(rpy).T
+    sr, sp, sy = numpy.sin(rpy).T
+
+    rot = numpy.empty((len(rpy), 3, 3))
+    rot[:, 0, 0] = cy*cp
+    rot[:, 0, 1] = cy*sp*sr - sy*cr
+    rot[:, 0, 2] = cy*sp*cr + sy*sr
+    rot[:, 1, 0] = sy*cp
+    rot[:, 1, 1] = sy*sp*sr + cy*cr
+    rot[:, 1, 2] = sy*sp*cr - cy*sr
+    rot[:, 2, 0] = -sp
+    rot[:, 2, 1] = cp*sr
+    rot[:, 2, 2] = cp*cr
+    return rot
+
+def XYZRPYToTransforms(xyzrpy):
+    """
+    Convert displacements in a TSR's w frame to homogeneous transforms.
+
+    @param xyzrpy (N,6) array of x, y, z, roll, pitch and yaw
+    @return (N,4,4) array of transforms
+    """
+    xyzrpy = numpy.asarray(xyzrpy, dtype=float)
+
+    transforms = numpy.zeros((len(xyzrpy), 4, 4))
+    transforms[:, 0:3, 0:3] = RPYToRotations(xyzrpy[:, 3:6])
+    transforms[:, 0:3, 3] = xyzrpy[:, 0:3]
+    transforms[:, 3, 3] = 1.
+    return transforms
+
+def SampleTSRDisplacements(tsr, num_samples, rng=None):
+    """
+    Draw displacements uniformly from the bounds of a TSR.
+
+    @param tsr The TSR to sample
+    @param num_samples The number of samples N
+    @param rng numpy.random.RandomState to sample from; defaults to the
+       global numpy random state
+    @return (N,6) array of x, y, z, roll, pitch and yaw
+    """
+    if rng is None:
+        rng = numpy.random
+
+    Bw = numpy.asarray(tsr.Bw, dtype=float)
+    return rng.uniform(Bw[:, 0], Bw[:, 1], size=(num_samples, 6))
+
+def GetTSRPoses(tsr, xyzrpy):
+    """
+    Compute the end-effector poses of a TSR for a batch of displacements.
+
+    @param tsr The TSR
+    @param xyzrpy (N,6) array of displacements in the TSR's w frame
+    @return (N,4,4) array of T0_w * Tw * Tw_e
+    """
+    Tw = XYZRPYToTransforms(xyzrpy)
+    return numpy.dot(numpy.dot(tsr.T0_w, Tw).transpose(1, 0, 2), tsr.Tw_e)
+
+def SampleTSR(tsr, num_samples, rng=None):
+    """
+    Draw end-effector poses from a TSR. This is the vectorized equivalent of
+    calling tsr.sample() num_samples times.
+
+    @param tsr The TSR to sample
+    @param num_samples The number of samples N
+    @param rng numpy.random.RandomState to sample from
+    @return (N,4,4) array of T0_w * Tw * Tw_e
+    """
+    return GetTSRPoses(tsr, SampleTSRDisplacements(tsr, num_samples, rng))
+
+def SampleTSRChain(chain, num_samples, rng=None):
+    """
+    Draw end-effector poses from a TSR chain. The T0_w of every TSR after
+    the first is relative to the end-effector frame of the TSR before it,
+    so the pose is the product of the individual TSR samples. This matches
+    the sampling of multi-TSR chains like the 'point' chain in generic.py.
+
+    @param chain The TSRChain to sample
+    @param num_samples The number of samples N
+    @param rng numpy.random.RandomState to sample from
+    @return (N,4,4) array of end-effector poses
+    """
+    if len(chain.TSRs) == 0:
+        raise ValueError('Unable to sample from an empty TSR chain.')
+
+    poses = SampleTSR(chain.TSRs[0], num_samples, rng)
+    for tsr in chain.TSRs[1:]:
+        poses = numpy.einsum('nij,njk->nik', poses,
+                             SampleTSR(tsr, num_samples, rng))
+    return poses
+
+def SampleTSRChains(chains, num_samples, rng=None):
+    """
+    Draw end-effector poses from a list of goal TSR chains, as returned by
+    the herbpy TSR factories. Each sample picks one of the goal chains
+    uniformly at random, like TSRPlanner does.
+
+    @param chains The list of TSRChains; chains that are not goal chains
+       are ignored
+    @param num_samples The number of samples N
+    @param rng numpy.random.RandomState to sample from
+    @return tuple of an (N,4,4) array of poses and an (N,) array with the
+       index in chains of the chain each pose was drawn from
+    """
+    if rng is None:
+        rng = numpy.random
+
+    goal_indices = [ i for i, chain in enumerate(chains) if chain.sample_goal ]
+    if not goal_indices:
+        raise ValueError('There are no goal TSR chains to sample from.')
+
+    chain_indices = numpy.array(goal_indices)[
+        rng.randint(len(goal_indices), size=num_samples)]
+
+    poses = numpy.empty((num_samples, 4, 4))
+    for i in goal_indices:
+        mask = (chain_indices == i)
+        num_chain_samples = numpy.count_nonzero(mask)
+        if num_chain_samples > 0:
+            poses[mask] = SampleTSRChain(chains[i], num_chain_samples, rng)
+
+    return poses, chain_indices
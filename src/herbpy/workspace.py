@@ -0,0 +1,172 @@
+import logging, numpy, threading
+
+logger = logging.getLogger('herbpy')
+
+
+class WorkspaceGrid(object):
+    def __init__(self, lower, resolution, occupied):
+        """Voxel grid of the positions an end-effector can reach.
+        @param lower position of the corner of the grid in the base frame
+        @param resolution edge length of a voxel
+        @param occupied boolean array that is True for reachable voxels
+        """
+        self.lower = numpy.array(lower, dtype=float)
+        self.resolution = resolution
+        self.occupied = numpy.asarray(occupied, dtype=bool)
+
+    @classmethod
+    def FromPositions(cls, positions, resolution=0.05, dilation=1):
+        """Build a grid from sampled end-effector positions.
+        @param positions (N,3) array of reachable positions in the base frame
+        @param resolution edge length of a voxel
+        @param dilation number of voxels to grow the reachable region by, to
+                        cover reachable positions between the samples
+        @return WorkspaceGrid
+        """
+        positions = numpy.asarray(positions, dtype=float)
+        lower = positions.min(axis=0) - (dilation + 1) * resolution
+        upper = positions.max(axis=0) + (dilation + 1) * resolution
+        shape = numpy.ceil((upper - lower) / resolution).astype(int)
+
+        occupied = numpy.zeros(shape, dtype=bool)
+        indices = numpy.floor((positions - lower) / resolution).astype(int)
+        occupied[indices[:, 0], indices[:, 1], indices[:, 2]] = True
+
+        # The border is empty, so shifting the grid does not wrap around.
+        for _ in xrange(dilation):
+            dilated = occupied.copy()
+            for axis in xrange(3):
+                dilated |= numpy.roll(occupied, 1, axis=axis)
+                dilated |= numpy.roll(occupied, -1, axis=axis)
+            occupied = dilated
+
+        return cls(lower, resolution, occupied)
+
+    def Contains(self, positions):
+        """Check whether positions are in reachable voxels.
+        @param positions (N,3) array of positions in the base frame
+        @return (N,) boolean array
+        """
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+        indices = numpy.floor((positions - self.lower) / self.resolution).astype(int)
+        inside = numpy.all((indices >= 0) & (indices < self.occupied.shape), axis=1)
+
+        result = numpy.zeros(len(positions), dtype=bool)
+        valid = indices[inside]
+        result[inside] = self.occupied[valid[:, 0], valid[:, 1], valid[:, 2]]
+        return result
+
+
+class WorkspaceFilter(object):
+    def __init__(self, grids, max_rejections=100):
+        """Rejects TSR samples that are outside the workspace of an arm.
+        TSR chains passed through FilterTSRList resample until the
+        end-effector position is in a reachable voxel, so hopeless samples
+        never reach IK. After \p max_rejections consecutive rejections the
+        last sample is returned anyway.
+        @param grids dictionary from manipulator name to WorkspaceGrid
+        @param max_rejections maximum number of resamples per sample
+        """
+        self.grids = grids
+        self.max_rejections = max_rejections
+        self._lock = threading.Lock()
+        self.ResetStatistics()
+
+    def ResetStatistics(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.exhausted = 0
+
+    def GetStatistics(self):
+        """Get the filter counters.
+        @return dictionary of counters
+        """
+        with self._lock:
+            return {
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'exhausted': self.exhausted,
+            }
+
+    def Contains(self, robot, manip, poses):
+        """Check whether end-effector poses are in the workspace of an arm.
+        @param robot robot
+        @param manip manipulator
+        @param poses (N,4,4) array of end-effector poses in the world frame
+        @return (N,) boolean array; all True if there is no grid for manip
+        """
+        poses = numpy.asarray(poses, dtype=float).reshape(-1, 4, 4)
+        grid = self.grids.get(manip.GetName())
+        if grid is None:
+            return numpy.ones(len(poses), dtype=bool)
+
+        with robot.GetEnv():
+            world_in_base = numpy.linalg.inv(robot.GetTransform())
+        positions = (numpy.dot(world_in_base[0:3, 0:3], poses[:, 0:3, 3].T).T
+                     + world_in_base[0:3, 3])
+        return grid.Contains(positions)
+
+    def FilterTSRList(self, robot, tsrlist):
+        """Wrap TSR chains so their samples are filtered by the workspace.
+        @param robot robot the chains are for
+        @param tsrlist list of TSRChains
+        @return list of chains with the same interface
+        """
+        with robot.GetEnv():
+            manipulators = robot.GetManipulators()
+
+        filtered = list()
+        for chain in tsrlist:
+            manip = None
+            if chain.TSRs:
+                manip = manipulators[chain.TSRs[0].manipindex]
+
+            if (chain.sample_goal and manip is not None
+                    and manip.GetName() in self.grids):
+                filtered.append(FilteredTSRChain(chain, self, robot, manip))
+            else:
+                filtered.append(chain)
+        return filtered
+
+    def _Record(self, accepted, rejected, exhausted):
+        with self._lock:
+            self.accepted += accepted
+            self.rejected += rejected
+            self.exhausted += exhausted
+
+
+class FilteredTSRChain(object):
+    def __init__(self, chain, workspace_filter, robot, manip):
+        """TSR chain whose samples are inside the workspace of an arm.
+        The pose of the base is read once, so the robot must not move while
+        the chain is in use. All attributes other than sample are forwarded
+        to the chain.
+        @param chain TSRChain to sample
+        @param workspace_filter WorkspaceFilter
+        @param robot robot
+        @param manip manipulator the chain is for
+        """
+        self.chain = chain
+        self.workspace_filter = workspace_filter
+        self.grid = workspace_filter.grids[manip.GetName()]
+
+        with robot.GetEnv():
+            self.world_in_base = numpy.linalg.inv(robot.GetTransform())
+
+    def __getattr__(self, name):
+        return getattr(self.chain, name)
+
+    def sample(self, *args, **kw_args):
+        # Samples at fixed displacements are not random, so do not retry them.
+        if args or kw_args:
+            return self.chain.sample(*args, **kw_args)
+
+        for i in xrange(self.workspace_filter.max_rejections + 1):
+            pose = self.chain.sample()
+            position = numpy.dot(self.world_in_base, pose[:, 3])[0:3]
+            if self.grid.Contains(position)[0]:
+                self.workspace_filter._Record(1, i, 0)
+                return pose
+
+        self.workspace_filter._Record(0, i + 1, 1)
+        return pose
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, unittest
+from prpy.planning.base import PlanningError
+from prpy.tsr.tsr import TSR, TSRChain
+from herbpy.graspdb import GetCoveringInterval, GraspDatabase
+
+class MockNamed(object):
+    def __init__(self, name):
+        self._name = name
+
+    def GetName(self):
+        return self._name
+
+class MockGraspDatabase(GraspDatabase):
+    def __init__(self, samples):
+        GraspDatabase.__init__(self)
+        self.samples = samples
+
+    def GetFeasibleSamples(self, robot, obj, manip, tsr_name, tsr_args=None):
+        return self.samples
+
+class GetCoveringIntervalTest(unittest.TestCase):
+    def test_GetCoveringInterval_NonPeriodicReturnsRange(self):
+        values = numpy.array([ 0.3, -0.2, 0.1 ])
+        self.assertEqual(GetCoveringInterval(values, -1., 1., False), (-0.2, 0.3))
+
+    def test_GetCoveringInterval_PeriodicWrapsAround(self):
+        values = numpy.array([ -3., 3., 2.9, -2.8 ])
+        lower, upper = GetCoveringInterval(values, -numpy.pi, numpy.pi, True)
+        self.assertAlmostEqual(lower, 2.9)
+        self.assertAlmostEqual(upper, 2. * numpy.pi - 2.8)
+
+    def test_GetCoveringInterval_PeriodicWithoutWrapping(self):
+        values = numpy.array([ -0.5, 0.5, 0. ])
+        lower, upper = GetCoveringInterval(values, -numpy.pi, numpy.pi, True)
+        self.assertAlmostEqual(lower, -0.5)
+        self.assertAlmostEqual(upper, 0.5)
+
+class PruneTSRListTest(unittest.TestCase):
+    def setUp(self):
+        self._robot = MockNamed('herb')
+        self._obj = MockNamed('fuze_bottle')
+        self._manip = MockNamed('right')
+
+        Bw = numpy.zeros((6, 2))
+        Bw[2, :] = [ 0., 0.2 ]
+        Bw[5, :] = [ -numpy.pi, numpy.pi ]
+        self._tsr = TSR(T0_w=numpy.eye(4), Tw_e=numpy.eye(4), Bw=Bw, manip=0)
+        self._tsrlist = [ TSRChain(sample_goal=True, TSR=self._tsr) ]
+
+    def _Prune(self, samples):
+        database = MockGraspDatabase(samples)
+        return database.PruneTSRList(self._robot, self._obj, self._manip,
+                                     'grasp', self._tsrlist)
+
+    def _GetSamples(self, z, yaw):
+        samples = numpy.zeros((len(z), 6))
+        samples[:, 2] = z
+        samples[:, 5] = yaw
+        return samples
+
+    def test_PruneTSRList_ShrinksBounds(self):
+        tsrlist = self._Prune(self._GetSamples([ 0.5, 0.6, 0.55 ], [ 0.4, 0.5, 0.6 ]))
+        Bw = tsrlist[0].TSRs[0].Bw
+
+        # The bounds contain the samples, padded by 1/3 of the range.
+        self.assertAlmostEqual(Bw[2, 0], 0.1 - 0.2 / 3.)
+        self.assertAlmostEqual(Bw[2, 1], 0.12 + 0.2 / 3.)
+        self.assertLess(Bw[5, 1] - Bw[5, 0], 2. * numpy.pi)
+        self.assertTrue(tsrlist[0].sample_goal)
+
+    def test_PruneTSRList_PaddingIsClippedToBounds(self):
+        tsrlist = self._Prune(self._GetSamples([ 0., 1. ], [ 0.5, 0.5 ]))
+        Bw = tsrlist[0].TSRs[0].Bw
+        self.assertEqual(Bw[2, 0], 0.)
+        self.assertEqual(Bw[2, 1], 0.2)
+
+    def test_PruneTSRList_YawWrapsAround(self):
+        yaw = [ 0.01, 0.02, 0.03, 0.04, 0.05, 0.95, 0.96, 0.97, 0.98, 0.99 ]
+        tsrlist = self._Prune(self._GetSamples([ 0.5 ] * len(yaw), yaw))
+        Bw = tsrlist[0].TSRs[0].Bw
+
+        # The yaw interval crosses +/- pi instead of covering everything.
+        self.assertGreater(Bw[5, 1], numpy.pi)
+        self.assertLess(Bw[5, 1] - Bw[5, 0], numpy.pi)
+
+    def test_PruneTSRList_FixedDimensionsAreUnchanged(self):
+        tsrlist = self._Prune(self._GetSamples([ 0.5 ], [ 0.5 ]))
+        Bw = tsrlist[0].TSRs[0].Bw
+        numpy.testing.assert_array_equal(Bw[[ 0, 1, 3, 4 ], :], numpy.zeros((4, 2)))
+
+    def test_PruneTSRList_WithoutEntryReturnsTSRList(self):
+        self.assertIs(self._Prune(None), self._tsrlist)
+
+    def test_PruneTSRList_WithoutFeasibleSamplesThrows(self):
+        self.assertRaises(PlanningError, self._Prune, numpy.zeros((0, 6)))
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_graspdb_interval', GetCoveringIntervalTest)
+    rosunit.unitrun(PKG, 'test_graspdb_prune', PruneTSRListTest)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, unittest
+from herbpy.kinematics import GetRotations, LookAtIK
+
+class MockEnvironment(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+class MockJoint(object):
+    def __init__(self, axis, anchor):
+        self._axis, self._anchor = axis, anchor
+
+    def GetAxis(self, index):
+        return self._axis
+
+    def GetAnchor(self):
+        return self._anchor
+
+class MockLink(object):
+    def __init__(self, pose):
+        self._pose = pose
+
+    def GetTransform(self):
+        return self._pose
+
+class PanTiltChain(object):
+    """Synthetic pan-tilt head that implements the parts of the robot and
+    manipulator interfaces used by LookAtIK. The chain is defined in the
+    frame of its base link at zero joint values."""
+    def __init__(self, base_pose, direction, values):
+        self.base_pose = base_pose
+        self.pan_axis, self.pan_anchor = numpy.array([ 0., 0., 1. ]), numpy.array([ 0.1, 0., 1. ])
+        self.tilt_axis, self.tilt_anchor = numpy.array([ 0., 1., 0. ]), numpy.array([ 0.15, 0.02, 1.1 ])
+        self.origin = numpy.array([ 0.2, 0.05, 1.15 ])
+        self.direction = direction
+        self.values = numpy.array(values)
+        self.lower, self.upper = numpy.array([ -2., -1.5 ]), numpy.array([ 2., 1.5 ])
+
+    def ForwardKinematics(self, values):
+        """Origin and direction of the viewing ray in the base link frame."""
+        pan = GetRotations(self.pan_axis, [ values[0] ])[0]
+        tilt = GetRotations(self.tilt_axis, [ values[1] ])[0]
+        origin = numpy.dot(pan, numpy.dot(tilt, self.origin - self.tilt_anchor)
+                                + self.tilt_anchor - self.pan_anchor) + self.pan_anchor
+        direction = numpy.dot(numpy.dot(pan, tilt), self.direction)
+        return origin, direction
+
+    def ToWorld(self, points):
+        return numpy.dot(points, self.base_pose[0:3, 0:3].T) + self.base_pose[0:3, 3]
+
+    # Robot interface.
+    def GetEnv(self):
+        return MockEnvironment()
+
+    def GetDOFValues(self, dof_indices):
+        return self.values
+
+    def GetDOFLimits(self, dof_indices):
+        return self.lower, self.upper
+
+    def GetJointFromDOFIndex(self, dof_index):
+        pan = GetRotations(self.pan_axis, [ self.values[0] ])[0]
+        if dof_index == 0:
+            axis, anchor = self.pan_axis, self.pan_anchor
+        else:
+            axis = numpy.dot(pan, self.tilt_axis)
+            anchor = numpy.dot(pan, self.tilt_anchor - self.pan_anchor) + self.pan_anchor
+        return MockJoint(numpy.dot(self.base_pose[0:3, 0:3], axis), self.ToWorld(anchor))
+
+    # Manipulator interface.
+    def GetName(self):
+        return 'head'
+
+    def GetArmIndices(self):
+        return [ 0, 1 ]
+
+    def GetBase(self):
+        return MockLink(self.base_pose)
+
+    def GetEndEffectorTransform(self):
+        origin, _ = self.ForwardKinematics(self.values)
+        pose = numpy.eye(4)
+        pose[0:3, 0:3] = self.base_pose[0:3, 0:3]
+        pose[0:3, 3] = self.ToWorld(origin)
+        return pose
+
+    def GetLocalToolDirection(self):
+        _, direction = self.ForwardKinematics(self.values)
+        return direction
+
+class LookAtIKTest(unittest.TestCase):
+    def setUp(self):
+        self._base_pose = numpy.eye(4)
+        self._base_pose[0:3, 0:3] = GetRotations([ 0., 0., 1. ], [ 0.7 ])[0]
+        self._base_pose[0:3, 3] = [ 0.5, -0.3, 0.2 ]
+        self._rng = numpy.random.RandomState(0)
+
+    def _CreateChain(self, skew=0.):
+        direction = numpy.array([ numpy.cos(skew), numpy.sin(skew), 0. ])
+        return PanTiltChain(self._base_pose, direction, [ 0.3, -0.2 ])
+
+    def _GetAngles(self, chain, targets, solutions):
+        angles = list()
+        for target, values in zip(targets, solutions):
+            origin, direction = chain.ForwardKinematics(values)
+            offset = target - origin
+            cos_angle = numpy.dot(offset, direction) / numpy.linalg.norm(offset)
+            angles.append(numpy.arccos(numpy.clip(cos_angle, -1., 1.)))
+        return numpy.array(angles)
+
+    def test_Solve_LooksAtTargets(self):
+        chain = self._CreateChain()
+        targets = self._rng.uniform([ 0.5, -2., 0. ], [ 2.5, 2., 2. ], size=(500, 3))
+        solutions = LookAtIK(chain, chain).Solve(chain.ToWorld(targets), self._base_pose)
+
+        found = ~numpy.any(numpy.isnan(solutions), axis=1)
+        self.assertTrue(numpy.all(found))
+        self.assertTrue(numpy.all(solutions >= chain.lower))
+        self.assertTrue(numpy.all(solutions <= chain.upper))
+        self.assertLess(self._GetAngles(chain, targets, solutions).max(), 1e-6)
+
+    def test_Solve_TargetOutsideLimitsHasNoSolution(self):
+        chain = self._CreateChain()
+        targets = numpy.array([ [ -5., 0., 1. ] ])
+        solutions = LookAtIK(chain, chain).Solve(chain.ToWorld(targets), self._base_pose)
+        self.assertTrue(numpy.all(numpy.isnan(solutions)))
+
+    def test_Init_RoundedTiltAxisIsAccepted(self):
+        # A URDF with rpy="0 0 1.5708" is about 4e-6 rad off.
+        chain = self._CreateChain(skew=4e-6)
+        targets = self._rng.uniform([ 0.5, -2., 0. ], [ 2.5, 2., 2. ], size=(100, 3))
+        solutions = LookAtIK(chain, chain).Solve(chain.ToWorld(targets), self._base_pose)
+        self.assertLess(self._GetAngles(chain, targets, solutions).max(), 1e-5)
+
+    def test_Init_SkewedTiltAxisThrows(self):
+        chain = self._CreateChain(skew=0.1)
+        self.assertRaises(ValueError, LookAtIK, chain, chain)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_kinematics', LookAtIKTest)
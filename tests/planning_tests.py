@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import time, unittest
+from prpy.planning.base import MetaPlanningError, PlanningError
+from herbpy.planning import (AdaptiveSequence, BudgetedSequence,
+                             DeadlinePlanningError, GetDeadline,
+                             PlannerStatistics, Race, TopLevelMethod)
+
+class MockPlanner(object):
+    def __init__(self, succeeds=True):
+        self.succeeds = succeeds
+        self.calls = 0
+
+    def has_planning_method(self, method_name):
+        return method_name == 'PlanToConfiguration'
+
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        self.calls += 1
+        if not self.succeeds:
+            raise PlanningError('{:s} failed.'.format(type(self).__name__))
+        return type(self).__name__
+
+class FirstPlanner(MockPlanner):
+    pass
+
+class SecondPlanner(MockPlanner):
+    pass
+
+class SlowPlanner(MockPlanner):
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        time.sleep(0.5)
+        return MockPlanner.PlanToConfiguration(self, robot, goal, **kw_args)
+
+class BrokenPlanner(MockPlanner):
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        raise ValueError('BrokenPlanner is broken.')
+
+class DeadlinePlanner(MockPlanner):
+    supports_deadline = True
+
+    def __init__(self, succeeds=True):
+        MockPlanner.__init__(self, succeeds)
+        self.deadlines = list()
+
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        self.deadlines.append(kw_args.get('deadline'))
+        return MockPlanner.PlanToConfiguration(self, robot, goal, **kw_args)
+
+class ContextPlanner(MockPlanner):
+    def __init__(self):
+        MockPlanner.__init__(self)
+        self.deadlines = list()
+
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        self.deadlines.append(GetDeadline())
+        return MockPlanner.PlanToConfiguration(self, robot, goal, **kw_args)
+
+class AdaptiveSequenceTest(unittest.TestCase):
+    def setUp(self):
+        self._statistics = PlannerStatistics()
+        self._first = FirstPlanner()
+        self._second = SecondPlanner()
+        self._planner = AdaptiveSequence(self._first, self._second,
+                                         statistics=self._statistics,
+                                         exploration=0.)
+
+    def _Record(self, planner_name, attempts, successes, duration=1.):
+        for i in xrange(attempts):
+            self._statistics.Record('PlanToConfiguration', planner_name,
+                                    i < successes, duration)
+
+    def test_GetOrder_WithoutStatisticsKeepsDefaultOrder(self):
+        self.assertEqual(self._planner.GetOrder('PlanToConfiguration'),
+                         [ self._first, self._second ])
+
+    def test_GetOrder_SortsByTimePerSuccess(self):
+        self._Record('FirstPlanner', 10, 5, duration=1.)
+        self._Record('SecondPlanner', 10, 5, duration=0.1)
+        self.assertEqual(self._planner.GetOrder('PlanToConfiguration'),
+                         [ self._second, self._first ])
+
+    def test_GetOrder_SkipsPlannerAfterMinAttempts(self):
+        self._Record('FirstPlanner', self._planner.min_attempts, 0)
+        self.assertEqual(self._planner.GetOrder('PlanToConfiguration'),
+                         [ self._second ])
+
+    def test_GetOrder_KeepsPlannerBeforeMinAttempts(self):
+        self._Record('FirstPlanner', self._planner.min_attempts - 1, 0)
+        self.assertIn(self._first, self._planner.GetOrder('PlanToConfiguration'))
+
+    def test_GetOrder_NeverSkipsEveryPlanner(self):
+        self._Record('FirstPlanner', self._planner.min_attempts, 0)
+        self._Record('SecondPlanner', self._planner.min_attempts, 0)
+        self.assertEqual(self._planner.GetOrder('PlanToConfiguration'),
+                         [ self._first, self._second ])
+
+    def test_Plan_StopsCallingFailingPlanner(self):
+        self._first.succeeds = False
+        for i in xrange(2 * self._planner.min_attempts):
+            traj = self._planner.plan('PlanToConfiguration', (None, None), dict())
+            self.assertEqual(traj, 'SecondPlanner')
+
+        # The failing planner is tried first until its statistics rule it
+        # out; it is more expensive once the other planner has succeeded.
+        self.assertLess(self._first.calls, self._planner.min_attempts + 1)
+        self.assertEqual(self._second.calls, 2 * self._planner.min_attempts)
+
+    def test_Plan_RecordsStatisticsUnderTopLevelMethod(self):
+        with TopLevelMethod('PlanToTSR'):
+            self._planner.plan('PlanToConfiguration', (None, None), dict())
+
+        self.assertEqual(self._statistics.Get('PlanToTSR', 'FirstPlanner')['successes'], 1)
+        self.assertEqual(self._statistics.Get('PlanToConfiguration', 'FirstPlanner')['attempts'], 0)
+
+class RaceTest(unittest.TestCase):
+    def setUp(self):
+        self._statistics = PlannerStatistics()
+
+    def test_Plan_ReturnsFirstSolution(self):
+        planner = Race(SlowPlanner(), FirstPlanner(), statistics=self._statistics)
+        traj = planner.plan('PlanToConfiguration', (None, None), dict())
+        self.assertEqual(traj, 'FirstPlanner')
+
+    def test_Plan_ExceptionDoesNotEndRace(self):
+        planner = Race(BrokenPlanner(), SlowPlanner())
+        traj = planner.plan('PlanToConfiguration', (None, None), dict())
+        self.assertEqual(traj, 'SlowPlanner')
+
+    def test_Plan_StopsWaitingAtDeadline(self):
+        planner = Race(SlowPlanner())
+        start_time = time.time()
+        self.assertRaises(MetaPlanningError, planner.plan, 'PlanToConfiguration',
+                          (None, None), { 'deadline': start_time + 0.1 })
+        self.assertLess(time.time() - start_time, 0.4)
+
+    def test_Plan_RecordsLosersAsCensored(self):
+        planner = Race(SlowPlanner(), FirstPlanner(), statistics=self._statistics)
+        planner.plan('PlanToConfiguration', (None, None), dict())
+
+        entry = self._statistics.Get('PlanToConfiguration', 'SlowPlanner')
+        self.assertEqual(entry['attempts'], 0)
+        self.assertEqual(entry['censored'], 1)
+        self.assertEqual(self._statistics.Get('PlanToConfiguration',
+                                              'FirstPlanner')['successes'], 1)
+
+class BudgetedSequenceTest(unittest.TestCase):
+    def test_Plan_WithoutDeadlineBehavesLikeSequence(self):
+        first, second = FirstPlanner(succeeds=False), SecondPlanner()
+        planner = BudgetedSequence(first, second)
+        traj = planner.plan('PlanToConfiguration', (None, None), dict())
+        self.assertEqual(traj, 'SecondPlanner')
+        self.assertEqual((first.calls, second.calls), (1, 1))
+
+    def test_Plan_SplitsDeadlineByWeight(self):
+        first, second = DeadlinePlanner(succeeds=False), DeadlinePlanner()
+        planner = BudgetedSequence(first, second, weights=[ 1., 3. ])
+
+        start_time = time.time()
+        deadline = start_time + 1.
+        planner.plan('PlanToConfiguration', (None, None), { 'deadline': deadline })
+
+        # Time the first planner leaves unused is passed on to the second.
+        self.assertAlmostEqual(first.deadlines[0] - start_time, 0.25, delta=0.05)
+        self.assertAlmostEqual(second.deadlines[0], deadline, delta=1e-6)
+
+    def test_Plan_NestedPlannersReadDeadlineFromContext(self):
+        inner = ContextPlanner()
+        planner = BudgetedSequence(inner)
+
+        deadline = time.time() + 1.
+        planner.plan('PlanToConfiguration', (None, None), { 'deadline': deadline })
+        self.assertAlmostEqual(inner.deadlines[0], deadline, delta=1e-6)
+        self.assertIsNone(GetDeadline())
+
+    def test_Plan_AbandonsPlannerThatExceedsBudget(self):
+        planner = BudgetedSequence(SlowPlanner(), FirstPlanner(), max_wait=0.1)
+
+        start_time = time.time()
+        with self.assertRaises(DeadlinePlanningError) as context:
+            planner.plan('PlanToConfiguration', (None, None),
+                         { 'deadline': start_time + 0.2 })
+        self.assertLess(time.time() - start_time, 0.4)
+
+        # The next planner is not started while the abandoned one runs.
+        outcomes = [ outcome for _, _, _, outcome in context.exception.timings ]
+        self.assertEqual(outcomes[0], 'timed out')
+        self.assertIn(outcomes[1], [ 'skipped', 'failed' ])
+
+    def test_Plan_WithoutDeadlineWaitsForAbandonedPlanner(self):
+        slow, first = SlowPlanner(), FirstPlanner()
+        planner = BudgetedSequence(slow, first)
+
+        self.assertRaises(DeadlinePlanningError, planner.plan, 'PlanToConfiguration',
+                          (None, None), { 'deadline': time.time() + 0.1 })
+        traj = planner.plan('PlanToConfiguration', (None, None), dict())
+        self.assertEqual(traj, 'SlowPlanner')
+        self.assertEqual(slow.calls, 2)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_adaptive', AdaptiveSequenceTest)
+    rosunit.unitrun(PKG, 'test_race', RaceTest)
+    rosunit.unitrun(PKG, 'test_budget', BudgetedSequenceTest)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, unittest
+from herbpy.reachability import GetPoseDescriptors, InverseReachabilityMap
+
+class MockManipulator(object):
+    def __init__(self, name):
+        self._name = name
+
+    def GetName(self):
+        return self._name
+
+def GetRotationZ(angle):
+    c, s = numpy.cos(angle), numpy.sin(angle)
+    return numpy.array([[ c, -s, 0., 0. ],
+                        [ s,  c, 0., 0. ],
+                        [ 0., 0., 1., 0. ],
+                        [ 0., 0., 0., 1. ]])
+
+def GetRandomPoses(rng, num_poses):
+    poses = numpy.tile(numpy.eye(4), (num_poses, 1, 1))
+    for pose in poses:
+        rotation, _ = numpy.linalg.qr(rng.normal(size=(3, 3)))
+        if numpy.linalg.det(rotation) < 0:
+            rotation[:, 0] *= -1.
+        pose[0:3, 0:3] = rotation
+        pose[0:3, 3] = rng.uniform([ 0.2, -0.8, 0.5 ], [ 1.0, 0.8, 1.3 ])
+    return poses
+
+def GetAngleDifference(a, b):
+    return numpy.abs((a - b + numpy.pi) % (2. * numpy.pi) - numpy.pi)
+
+class GetPoseDescriptorsTest(unittest.TestCase):
+    def setUp(self):
+        self._rng = numpy.random.RandomState(0)
+
+    def test_GetPoseDescriptors_InvariantToHeading(self):
+        poses = GetRandomPoses(self._rng, 50)
+        headings, descriptors = GetPoseDescriptors(poses)
+
+        for angle in [ 0.3, -2., numpy.pi ]:
+            rotated = numpy.array([ numpy.dot(GetRotationZ(angle), pose) for pose in poses ])
+            rotated_headings, rotated_descriptors = GetPoseDescriptors(rotated)
+
+            # The quaternion of a rotation is only unique up to its sign.
+            numpy.testing.assert_allclose(numpy.abs(rotated_descriptors),
+                                          numpy.abs(descriptors), atol=1e-9)
+            numpy.testing.assert_allclose(rotated_descriptors[:, 0], descriptors[:, 0])
+            self.assertLess(GetAngleDifference(rotated_headings - headings, angle).max(), 1e-9)
+
+    def test_GetPoseDescriptors_DistinguishesTilt(self):
+        tilted = numpy.eye(4)
+        tilted[0:3, 0:3] = [[ 1., 0., 0. ], [ 0., 0., -1. ], [ 0., 1., 0. ]]
+        _, descriptors = GetPoseDescriptors(numpy.array([ numpy.eye(4), tilted ]))
+        self.assertGreater(numpy.linalg.norm(descriptors[0] - descriptors[1]), 0.5)
+
+class GetBasePosesTest(unittest.TestCase):
+    def setUp(self):
+        self._rng = numpy.random.RandomState(0)
+        self._manip = MockManipulator('right')
+
+        # Samples of the end-effector pose in the base frame, as in Build.
+        self._poses = GetRandomPoses(self._rng, 200)
+        headings, descriptors = GetPoseDescriptors(self._poses)
+        samples = numpy.column_stack([ self._poses[:, 0:2, 3], headings, descriptors ])
+
+        self._map = InverseReachabilityMap()
+        self._map._SetSamples(self._manip.GetName(), samples.astype(numpy.float32))
+
+    def test_GetBasePoses_RecoversBasePose(self):
+        base_pose = GetRotationZ(0.7)
+        base_pose[0:3, 3] = [ 1., 2., 0.1 ]
+        ee_poses = numpy.array([ numpy.dot(base_pose, self._poses[i]) for i in [ 5, 17 ] ])
+
+        base_poses, ee_indices = self._map.GetBasePoses(self._manip, ee_poses,
+                                                        base_height=0.1)
+        self.assertEqual(len(base_poses), len(ee_indices))
+        for i in xrange(len(ee_poses)):
+            candidates = base_poses[ee_indices == i]
+            errors = (numpy.linalg.norm(candidates[:, 0:2] - [ 1., 2. ], axis=1)
+                      + GetAngleDifference(candidates[:, 2], 0.7))
+            self.assertLess(errors.min(), 1e-4)
+
+    def test_GetBasePoses_CandidatesPlaceSamplesAtTarget(self):
+        ee_pose = numpy.dot(GetRotationZ(-1.), self._poses[3])
+        base_poses, _ = self._map.GetBasePoses(self._manip, [ ee_pose ])
+        self.assertGreater(len(base_poses), 0)
+
+        # In the frame of every candidate, the target is at a sampled position.
+        for x, y, yaw in base_poses:
+            base = GetRotationZ(yaw)
+            base[0:2, 3] = [ x, y ]
+            reached = numpy.dot(numpy.linalg.inv(base), ee_pose)
+            self.assertTrue(numpy.any(numpy.linalg.norm(
+                self._poses[:, 0:2, 3] - reached[0:2, 3], axis=1) < 1e-4))
+
+    def test_GetBasePoses_UnreachableHeightHasNoSolution(self):
+        ee_pose = numpy.eye(4)
+        ee_pose[2, 3] = 5.
+        base_poses, ee_indices = self._map.GetBasePoses(self._manip, [ ee_pose ])
+        self.assertEqual(base_poses.shape, (0, 3))
+        self.assertEqual(len(ee_indices), 0)
+
+    def test_GetBasePoses_UnknownManipulatorThrows(self):
+        self.assertRaises(ValueError, self._map.GetBasePoses,
+                          MockManipulator('left'), [ numpy.eye(4) ])
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_reachability_descriptors', GetPoseDescriptorsTest)
+    rosunit.unitrun(PKG, 'test_reachability_base_poses', GetBasePosesTest)
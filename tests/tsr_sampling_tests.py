@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, unittest
+from prpy.tsr.tsr import TSR, TSRChain
+from herbpy.tsr.sampling import (GetTSRPoses, RPYToRotations, SampleTSR,
+                                 SampleTSRChain, SampleTSRChains,
+                                 XYZRPYToTransforms)
+
+class TSRSamplingTest(unittest.TestCase):
+    def setUp(self):
+        self._rng = numpy.random.RandomState(0)
+
+        T0_w = TSR.xyzrpy_to_trans([ 1., 0.5, 0.7, 0., 0., 0.3 ])
+        Tw_e = TSR.xyzrpy_to_trans([ 0., 0., -0.2, 0., numpy.pi/2, 0. ])
+        Bw = numpy.zeros((6, 2))
+        Bw[0, :] = [ -0.05, 0.05 ]
+        Bw[2, :] = [ 0., 0.1 ]
+        Bw[5, :] = [ -numpy.pi, numpy.pi ]
+        self._tsr = TSR(T0_w=T0_w, Tw_e=Tw_e, Bw=Bw, manip=0)
+
+    def _GetDisplacements(self, poses, tsr):
+        """Transform poses back into the w frame of a TSR."""
+        return numpy.dot(numpy.dot(numpy.linalg.inv(tsr.T0_w), poses).transpose(1, 0, 2),
+                         numpy.linalg.inv(tsr.Tw_e))
+
+    def test_RPYToRotations_MatchesTSR(self):
+        rpy = self._rng.uniform(-numpy.pi, numpy.pi, size=(20, 3))
+        rotations = RPYToRotations(rpy)
+        for angles, rotation in zip(rpy, rotations):
+            numpy.testing.assert_allclose(rotation, TSR.rpy_to_rot(angles), atol=1e-12)
+
+    def test_XYZRPYToTransforms_MatchesTSR(self):
+        xyzrpy = self._rng.uniform(-1., 1., size=(20, 6))
+        transforms = XYZRPYToTransforms(xyzrpy)
+        for displacement, transform in zip(xyzrpy, transforms):
+            numpy.testing.assert_allclose(transform, TSR.xyzrpy_to_trans(displacement),
+                                          atol=1e-12)
+
+    def test_SampleTSR_SamplesAreInsideBounds(self):
+        poses = SampleTSR(self._tsr, 500, self._rng)
+        self.assertEqual(poses.shape, (500, 4, 4))
+
+        Tw = self._GetDisplacements(poses, self._tsr)
+        self.assertTrue(numpy.all(Tw[:, 0:3, 3] >= self._tsr.Bw[0:3, 0] - 1e-9))
+        self.assertTrue(numpy.all(Tw[:, 0:3, 3] <= self._tsr.Bw[0:3, 1] + 1e-9))
+
+        # Only yaw is free, so the z-axis of the w frame is unchanged.
+        numpy.testing.assert_allclose(Tw[:, 0:3, 2], numpy.tile([ 0., 0., 1. ], (500, 1)),
+                                      atol=1e-9)
+
+    def test_SampleTSR_MatchesGetTSRPoses(self):
+        xyzrpy = self._rng.uniform(self._tsr.Bw[:, 0], self._tsr.Bw[:, 1], size=(10, 6))
+        poses = GetTSRPoses(self._tsr, xyzrpy)
+        for displacement, pose in zip(xyzrpy, poses):
+            expected = numpy.dot(numpy.dot(self._tsr.T0_w, TSR.xyzrpy_to_trans(displacement)),
+                                 self._tsr.Tw_e)
+            numpy.testing.assert_allclose(pose, expected, atol=1e-12)
+
+    def test_SampleTSRChain_ComposesTSRs(self):
+        offset = TSR(T0_w=numpy.eye(4), Tw_e=TSR.xyzrpy_to_trans([ 0., 0., 0.1, 0., 0., 0. ]),
+                     Bw=numpy.zeros((6, 2)), manip=0)
+        chain = TSRChain(sample_goal=True, TSRs=[ self._tsr, offset ])
+
+        poses = SampleTSRChain(chain, 100, numpy.random.RandomState(1))
+        expected = SampleTSR(self._tsr, 100, numpy.random.RandomState(1))
+        numpy.testing.assert_allclose(poses[:, 0:3, 0:3], expected[:, 0:3, 0:3], atol=1e-12)
+        numpy.testing.assert_allclose(poses[:, 0:3, 3],
+                                      expected[:, 0:3, 3] + 0.1*expected[:, 0:3, 2], atol=1e-12)
+
+    def test_SampleTSRChain_EmptyChainThrows(self):
+        self.assertRaises(ValueError, SampleTSRChain, TSRChain(sample_goal=True), 10)
+
+    def test_SampleTSRChains_IgnoresNonGoalChains(self):
+        start = TSRChain(sample_start=True, TSR=self._tsr)
+        goal = TSRChain(sample_goal=True, TSR=self._tsr)
+
+        poses, chain_indices = SampleTSRChains([ start, goal ], 50, self._rng)
+        self.assertEqual(poses.shape, (50, 4, 4))
+        self.assertTrue(numpy.all(chain_indices == 1))
+
+    def test_SampleTSRChains_WithoutGoalChainsThrows(self):
+        start = TSRChain(sample_start=True, TSR=self._tsr)
+        self.assertRaises(ValueError, SampleTSRChains, [ start ], 10)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_tsr_sampling', TSRSamplingTest)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, openravepy, unittest
+import herbpy
+from herbpy.tsr.cache import CachedTSRLibrary
+
+env, robot = herbpy.initialize(sim=True)
+
+class MockTSRLibrary(object):
+    def __init__(self, robot):
+        self.robot = robot
+        self.calls = 0
+
+    def __call__(self, kinbody, action_name, *args, **kw_args):
+        self.calls += 1
+        manip = kw_args.get('manip')
+        if manip is None:
+            manip = self.robot.GetActiveManipulator()
+        manip.SetActive()
+        return [ (action_name, manip.GetName(), self.calls) ]
+
+class CachedTSRLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self._env, self._robot = env, robot
+        self._library = MockTSRLibrary(robot)
+        self._cache = CachedTSRLibrary(self._library)
+
+        with env:
+            self._body = openravepy.RaveCreateKinBody(env, '')
+            self._body.SetName('box')
+            self._body.InitFromBoxes(numpy.array([[ 0., 0., 0., 0.1, 0.1, 0.1 ]]), True)
+            env.Add(self._body)
+            self._body.SetTransform(self._GetPose(1.))
+            robot.SetActiveManipulator(robot.right_arm)
+
+    def tearDown(self):
+        with env:
+            env.Remove(self._body)
+
+    def _GetPose(self, x):
+        pose = numpy.eye(4)
+        pose[0, 3] = x
+        return pose
+
+    def test_Call_RepeatedCallIsCached(self):
+        tsrlist = self._cache(self._body, 'grasp')
+        self.assertEqual(self._cache(self._body, 'grasp'), tsrlist)
+        self.assertEqual(self._library.calls, 1)
+        self.assertEqual(self._cache.GetStatistics()['hits'], 1)
+
+    def test_Call_SmallMotionIsCached(self):
+        self._cache(self._body, 'grasp')
+        with env:
+            self._body.SetTransform(self._GetPose(1. + 1e-6))
+        self._cache(self._body, 'grasp')
+        self.assertEqual(self._library.calls, 1)
+
+    def test_Call_MovedObjectInvalidatesEntries(self):
+        self._cache(self._body, 'grasp')
+        self._cache(self._body, 'push_grasp')
+        with env:
+            self._body.SetTransform(self._GetPose(1.5))
+        self._cache(self._body, 'grasp')
+        self.assertEqual(self._library.calls, 3)
+        self.assertEqual(self._cache.GetStatistics()['entries'], 1)
+
+        # Moving the object back does not resurrect the dropped entries.
+        with env:
+            self._body.SetTransform(self._GetPose(1.))
+        self._cache(self._body, 'push_grasp')
+        self.assertEqual(self._library.calls, 4)
+
+    def test_Call_DifferentArgumentsAreNotShared(self):
+        self._cache(self._body, 'push_grasp', push_distance=0.1)
+        self._cache(self._body, 'push_grasp', push_distance=0.2)
+        self.assertEqual(self._library.calls, 2)
+
+    def test_Call_StateDependentActionIsNotCached(self):
+        self._cache(self._body, 'lift')
+        self._cache(self._body, 'lift')
+        self.assertEqual(self._library.calls, 2)
+
+    def test_Call_ActiveManipulatorIsPartOfKey(self):
+        self._cache(self._body, 'grasp')
+        with env:
+            robot.SetActiveManipulator(robot.left_arm)
+        tsrlist = self._cache(self._body, 'grasp')
+        self.assertEqual(tsrlist[0][1], robot.left_arm.GetName())
+        self.assertEqual(self._library.calls, 2)
+
+    def test_Call_ExplicitManipulatorIgnoresActiveManipulator(self):
+        self._cache(self._body, 'grasp', manip=robot.right_arm)
+        with env:
+            robot.SetActiveManipulator(robot.left_arm)
+        self._cache(self._body, 'grasp', manip=robot.right_arm)
+        self.assertEqual(self._library.calls, 1)
+
+    def test_Call_HitActivatesExplicitManipulator(self):
+        self._cache(self._body, 'grasp', manip=robot.right_arm)
+        with env:
+            robot.SetActiveManipulator(robot.left_arm)
+        self._cache(self._body, 'grasp', manip=robot.right_arm)
+        self.assertEqual(self._library.calls, 1)
+        with env:
+            self.assertEqual(robot.GetActiveManipulator().GetName(),
+                             robot.right_arm.GetName())
+
+    def test_Clear_DropsAllEntries(self):
+        self._cache(self._body, 'grasp')
+        self._cache.Clear()
+        self._cache(self._body, 'grasp')
+        self.assertEqual(self._library.calls, 2)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_tsr', CachedTSRLibraryTest)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+PKG = 'herbpy'
+import roslib; roslib.load_manifest(PKG)
+import numpy, unittest
+from herbpy.workspace import FilteredTSRChain, WorkspaceFilter, WorkspaceGrid
+
+class MockEnvironment(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+class MockRobot(object):
+    def __init__(self, transform):
+        self._transform = transform
+
+    def GetEnv(self):
+        return MockEnvironment()
+
+    def GetTransform(self):
+        return self._transform
+
+class MockManipulator(object):
+    def __init__(self, name):
+        self._name = name
+
+    def GetName(self):
+        return self._name
+
+class MockTSRChain(object):
+    def __init__(self, positions):
+        self.sample_goal = True
+        self._positions = list(positions)
+
+    def sample(self, *args, **kw_args):
+        pose = numpy.eye(4)
+        pose[0:3, 3] = self._positions.pop(0)
+        return pose
+
+class WorkspaceGridTest(unittest.TestCase):
+    def setUp(self):
+        # Binary fractions keep the voxel boundaries exact.
+        self._resolution = 0.0625
+        self._point = numpy.array([ 0.5, 0.125, 0.75 ])
+
+    def _CreateGrid(self, dilation):
+        return WorkspaceGrid.FromPositions([ self._point ], resolution=self._resolution,
+                                           dilation=dilation)
+
+    def test_Contains_SampledPositionsAreReachable(self):
+        positions = numpy.random.RandomState(0).uniform(-1., 1., size=(100, 3))
+        grid = WorkspaceGrid.FromPositions(positions, resolution=0.05, dilation=0)
+        self.assertTrue(numpy.all(grid.Contains(positions)))
+
+    def test_Contains_OutsideGridIsUnreachable(self):
+        grid = self._CreateGrid(dilation=1)
+        far = [ self._point + [ 10., 0., 0. ], self._point - [ 0., 0., 10. ] ]
+        self.assertFalse(numpy.any(grid.Contains(far)))
+
+    def test_Contains_SinglePosition(self):
+        grid = self._CreateGrid(dilation=1)
+        self.assertEqual(grid.Contains(self._point).shape, (1,))
+
+    def test_FromPositions_DilationGrowsByVoxels(self):
+        neighbor = self._point + [ 1.5 * self._resolution, 0., 0. ]
+        second_neighbor = self._point + [ 0., -1.5 * self._resolution, 0. ]
+        diagonal = self._point + [ 1.5 * self._resolution, 1.5 * self._resolution, 0. ]
+
+        grid = self._CreateGrid(dilation=0)
+        self.assertTrue(grid.Contains(self._point)[0])
+        self.assertFalse(grid.Contains(neighbor)[0])
+
+        grid = self._CreateGrid(dilation=1)
+        self.assertTrue(grid.Contains(neighbor)[0])
+        self.assertFalse(grid.Contains(second_neighbor)[0])
+        self.assertFalse(grid.Contains(diagonal)[0])
+
+        grid = self._CreateGrid(dilation=2)
+        self.assertTrue(grid.Contains(second_neighbor)[0])
+        self.assertTrue(grid.Contains(diagonal)[0])
+
+    def test_FromPositions_DilationDoesNotWrapAround(self):
+        grid = self._CreateGrid(dilation=3)
+        for axis in xrange(3):
+            self.assertFalse(numpy.any(numpy.take(grid.occupied, 0, axis=axis)))
+
+        # Exactly the voxels within an L1 distance of 3 of the sample.
+        self.assertEqual(numpy.count_nonzero(grid.occupied), 1 + 6 + 18 + 38)
+
+class WorkspaceFilterTest(unittest.TestCase):
+    def setUp(self):
+        self._manip = MockManipulator('right')
+        grid = WorkspaceGrid.FromPositions([[ 0.5, 0., 1. ]], resolution=0.0625, dilation=0)
+        self._filter = WorkspaceFilter({ 'right': grid }, max_rejections=3)
+
+        # The robot is moved by 1 m along x.
+        transform = numpy.eye(4)
+        transform[0, 3] = 1.
+        self._robot = MockRobot(transform)
+
+    def _GetPoses(self, positions):
+        poses = numpy.tile(numpy.eye(4), (len(positions), 1, 1))
+        poses[:, 0:3, 3] = positions
+        return poses
+
+    def test_Contains_UsesBaseFrame(self):
+        poses = self._GetPoses([[ 1.5, 0., 1. ], [ 0.5, 0., 1. ]])
+        numpy.testing.assert_array_equal(
+            self._filter.Contains(self._robot, self._manip, poses), [ True, False ])
+
+    def test_Contains_WithoutGridAcceptsEverything(self):
+        poses = self._GetPoses([[ 0., 0., 0. ]])
+        self.assertTrue(self._filter.Contains(self._robot, MockManipulator('left'), poses)[0])
+
+    def test_Sample_RejectsUnreachableSamples(self):
+        chain = MockTSRChain([[ 0., 0., 0. ], [ 5., 0., 0. ], [ 1.5, 0., 1. ]])
+        filtered = FilteredTSRChain(chain, self._filter, self._robot, self._manip)
+
+        numpy.testing.assert_allclose(filtered.sample()[0:3, 3], [ 1.5, 0., 1. ])
+        self.assertEqual(self._filter.GetStatistics(),
+                         { 'accepted': 1, 'rejected': 2, 'exhausted': 0 })
+
+    def test_Sample_ReturnsLastSampleWhenExhausted(self):
+        chain = MockTSRChain([[ float(i), 0., 0. ] for i in xrange(4) ])
+        filtered = FilteredTSRChain(chain, self._filter, self._robot, self._manip)
+
+        numpy.testing.assert_allclose(filtered.sample()[0:3, 3], [ 3., 0., 0. ])
+        self.assertEqual(self._filter.GetStatistics(),
+                         { 'accepted': 0, 'rejected': 4, 'exhausted': 1 })
+
+    def test_Sample_ForwardsAttributes(self):
+        chain = MockTSRChain([])
+        filtered = FilteredTSRChain(chain, self._filter, self._robot, self._manip)
+        self.assertTrue(filtered.sample_goal)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_workspace_grid', WorkspaceGridTest)
+    rosunit.unitrun(PKG, 'test_workspace_filter', WorkspaceFilterTest)